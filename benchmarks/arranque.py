@@ -0,0 +1,167 @@
+"""Tempo de arranque do serviço: até contar e até a API responder
+
+Arranca o main.py num processo novo (driver simulado, diretórios
+temporários) as vezes pedidas e mede, desde o spawn: a notificação
+"A contar" ao systemd (os contadores armados, a primeira garrafa já conta),
+o READY=1 (a API a aceitar ligações) e a primeira resposta 200 de /ready.
+Com --retomar, o checkpoint tem uma ordem em contagem, como depois de um
+reinício a meio de uma ordem, e é medido também o tempo até /status
+mostrar garrafas novas.
+
+Uso (a partir da raiz do projeto):
+
+    python benchmarks/arranque.py
+    python benchmarks/arranque.py --vezes 5 --retomar
+
+É gerado um certificado autoassinado temporário (precisa do comando openssl).
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+from benchmarks.carga_status import gerar_certificado  # noqa: E402
+from src.checkpoint import CheckpointEstado  # noqa: E402
+
+
+def porta_livre() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def pedir(porta: int, rota: str):
+    contexto = ssl.create_default_context()
+    contexto.check_hostname = False
+    contexto.verify_mode = ssl.CERT_NONE
+    conn = http.client.HTTPSConnection("127.0.0.1", porta, context=contexto, timeout=2)
+    try:
+        conn.request("GET", rota)
+        resposta = conn.getresponse()
+        return resposta.status, json.loads(resposta.read() or b"{}")
+    finally:
+        conn.close()
+
+
+def semear_checkpoint(diretorio: Path, contagem: int):
+    checkpoint = CheckpointEstado(diretorio / "contador.bin")
+    checkpoint.guardar(
+        {
+            "ordem": "BENCH-1",
+            "id_ordem": 1,
+            "artigo": "BENCH",
+            "descricao_artigo": "Benchmark de arranque",
+            "cadencia_artigo": 36000,
+            "contagem_atual": contagem,
+            "contagem_total": 10**9,
+            "quebras": 0,
+            "estado": 1,
+            "configurado": True,
+            "pausa_automatica": False,
+            "pausado_por_paragem": False,
+            "tempo_inicio": None,
+        },
+        sincronizar=True,
+    )
+    checkpoint.fechar()
+
+
+def arrancar(base: Path, cert: Path, key: Path, retomar: bool, timeout: float):
+    porta = porta_livre()
+    (base / "certs").mkdir(parents=True, exist_ok=True)
+    (base / "certs" / "CERT.crt").write_bytes(cert.read_bytes())
+    (base / "certs" / "CERT.key").write_bytes(key.read_bytes())
+    contagem_inicial = 1000
+    if retomar:
+        semear_checkpoint(base / "checkpoint", contagem_inicial)
+
+    notificacoes = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    caminho_socket = base / "notify.sock"
+    notificacoes.bind(str(caminho_socket))
+    notificacoes.settimeout(0.005)
+    ambiente = {
+        **os.environ,
+        "BASE_PATH": str(base),
+        "APP_PORT": str(porta),
+        "APP_HOST": "127.0.0.1",
+        "GPIO_DRIVER": "sim",
+        "SIM_TAXA": "36000",
+        "NOTIFY_SOCKET": str(caminho_socket),
+        "CHECKPOINT_DIR": str(base / "checkpoint"),
+        "SERIES_DIR": str(base / "series"),
+        "JOURNAL_PATH": str(base / "journal.db"),
+    }
+
+    tempos = {}
+    inicio = time.monotonic()
+    processo = subprocess.Popen(
+        [sys.executable, str(RAIZ / "main.py")],
+        cwd=base,
+        env=ambiente,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.monotonic() - inicio < timeout and len(tempos) < (4 if retomar else 3):
+            try:
+                mensagem = notificacoes.recv(4096).decode()
+                agora = time.monotonic() - inicio
+                if "READY=1" in mensagem:
+                    tempos.setdefault("ready", agora)
+                elif "STATUS=A contar" in mensagem:
+                    tempos.setdefault("contagem", agora)
+            except socket.timeout:
+                pass
+            if "ready" not in tempos or processo.poll() is not None:
+                continue
+            try:
+                if "/ready" not in tempos and pedir(porta, "/ready")[0] == 200:
+                    tempos["/ready"] = time.monotonic() - inicio
+                if retomar and "garrafas" not in tempos:
+                    dados = pedir(porta, "/status")[1]["data"]
+                    if dados["ContagemAtual"] > contagem_inicial:
+                        tempos["garrafas"] = time.monotonic() - inicio
+            except OSError:
+                pass
+    finally:
+        processo.kill()  # Só interessa o arranque (e cada vez usa diretórios novos)
+        processo.wait()
+        notificacoes.close()
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vezes", type=int, default=3)
+    parser.add_argument("--retomar", action="store_true", help="checkpoint com uma ordem em contagem")
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporario:
+        cert, key = gerar_certificado(Path(temporario))
+        resultados = []
+        for vez in range(args.vezes):
+            tempos = arrancar(Path(temporario) / f"arranque-{vez}", cert, key, args.retomar, args.timeout)
+            resultados.append(tempos)
+            print(
+                f"#{vez + 1}  "
+                + "  ".join(f"{marco}={t * 1000:7.1f}ms" for marco, t in tempos.items())
+            )
+        for marco in ("contagem", "garrafas", "ready", "/ready"):
+            valores = sorted(t[marco] for t in resultados if marco in t)
+            if valores:
+                print(f"{marco:9s} mediana={valores[len(valores) // 2] * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
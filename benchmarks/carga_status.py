@@ -0,0 +1,174 @@
+"""Teste de carga de /status: latência p99 com clientes concorrentes
+
+Arranca a API no próprio processo (com o contador a contar no driver
+simulado) e põe N clientes HTTPS keep-alive, repartidos por alguns
+processos, a fazer polling a /status. Reporta a latência por percentil, o
+débito e os erros, para comparar o servidor de produção com o servidor de
+desenvolvimento do Flask.
+
+Uso (a partir da raiz do projeto):
+
+    python benchmarks/carga_status.py
+    python benchmarks/carga_status.py --modo dev --clientes 50 --duracao 30
+
+Sem --cert/--key é gerado um certificado autoassinado temporário (precisa
+do comando openssl).
+"""
+import argparse
+import http.client
+import multiprocessing
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+from src.api import create_app  # noqa: E402
+from src.contador import Contador  # noqa: E402
+from src.gpio_drivers import SimulatedGPIODriver  # noqa: E402
+from src.gpio_handler import GPIOHandler  # noqa: E402
+from src.persistencia import EscritorContagens  # noqa: E402
+from src.servidor import ServidorProducao, criar_contexto_tls  # noqa: E402
+
+
+class DatabaseSimulada:
+    def amostra_contagem(self, contador, id_ordem, contagem, contagem_total):
+        return {}
+
+    def gravar_contagens(self, amostras):
+        pass
+
+
+def gerar_certificado(diretorio: Path):
+    cert, key = diretorio / "cert.pem", diretorio / "key.pem"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=localhost", "-keyout", str(key), "-out", str(cert),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def cliente(porta, parar, latencias, erros, reconexoes):
+    contexto = ssl.create_default_context()
+    contexto.check_hostname = False
+    contexto.verify_mode = ssl.CERT_NONE
+    conn = None
+    while not parar.is_set():
+        if conn is None:
+            conn = http.client.HTTPSConnection("127.0.0.1", porta, context=contexto, timeout=30)
+            reconexoes.append(1)
+        inicio = time.perf_counter()
+        try:
+            conn.request("GET", "/status")
+            resposta = conn.getresponse()
+            resposta.read()
+            latencias.append(time.perf_counter() - inicio)
+            if resposta.getheader("Connection", "").lower() == "close":
+                conn.close()
+                conn = None
+        except Exception:
+            erros.append(1)
+            conn.close()
+            conn = None
+
+
+def processo_clientes(porta, n, duracao, resultados):
+    """Corre `n` clientes num processo separado do servidor (sem partilhar o GIL)"""
+    parar = threading.Event()
+    latencias, erros, reconexoes = [], [], []
+    threads = [
+        threading.Thread(
+            target=cliente, args=(porta, parar, latencias, erros, reconexoes), daemon=True
+        )
+        for _ in range(n)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(duracao)
+    parar.set()
+    for thread in threads:
+        thread.join(timeout=35)
+    resultados.put((latencias, len(erros), len(reconexoes)))
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))] if ordenados else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modo", choices=["producao", "dev"], default="producao")
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--duracao", type=float, default=20)
+    parser.add_argument("--threads", type=int, default=32, help="threads do servidor de produção")
+    parser.add_argument("--processos", type=int, default=4, help="processos dos clientes")
+    parser.add_argument("--cert")
+    parser.add_argument("--key")
+    args = parser.parse_args()
+
+    temporario = tempfile.TemporaryDirectory()
+    if args.cert and args.key:
+        cert, key = Path(args.cert), Path(args.key)
+    else:
+        cert, key = gerar_certificado(Path(temporario.name))
+    contexto = criar_contexto_tls(cert, key)
+
+    db = DatabaseSimulada()
+    contador = Contador(
+        GPIOHandler(SimulatedGPIODriver(22, 23, taxa=36000)),
+        db,
+        escritor=EscritorContagens(db),
+    )
+    contador.state.configurado = True
+    contador.state.contagem_total = 10**9
+    contador.start()
+    contador.iniciar_contagem()
+
+    app = create_app(contador)
+    if args.modo == "producao":
+        servidor = ServidorProducao("127.0.0.1", 0, app, contexto, threads=args.threads)
+    else:
+        servidor = make_server("127.0.0.1", 0, app, threaded=True, ssl_context=contexto)
+    porta = servidor.socket.getsockname()[1]
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    resultados = multiprocessing.Queue()
+    processos = [
+        multiprocessing.Process(
+            target=processo_clientes,
+            args=(porta, len(range(i, args.clientes, args.processos)), args.duracao, resultados),
+        )
+        for i in range(args.processos)
+    ]
+    for processo in processos:
+        processo.start()
+    latencias, erros, reconexoes = [], 0, 0
+    for _ in processos:
+        parcial, n_erros, n_ligacoes = resultados.get()
+        latencias.extend(parcial)
+        erros += n_erros
+        reconexoes += n_ligacoes
+    for processo in processos:
+        processo.join()
+    servidor.shutdown()
+
+    print(f"Servidor: {args.modo}, {args.clientes} clientes, {args.duracao:.0f}s")
+    print(f"Pedidos: {len(latencias)} ({len(latencias) / args.duracao:.0f}/s), erros: {erros}, ligações: {reconexoes}")
+    for p in (0.5, 0.9, 0.99):
+        print(f"p{int(p * 100)}: {percentil(latencias, p) * 1000:.1f} ms")
+    print(f"max: {max(latencias, default=0) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
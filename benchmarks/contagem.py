@@ -0,0 +1,262 @@
+"""Benchmark de precisão da contagem: pulsos perdidos vs velocidade da linha
+
+Conduz o caminho de contagem com o driver simulado e compara as garrafas
+contadas com os pulsos gerados, para cada combinação de velocidade, largura
+de pulso, modo de contagem e cenário de carga:
+
+- base: só o contador a correr
+- api: clientes a fazer polling a /api/info em paralelo
+- db_lento: base de dados que demora a responder a cada gravação
+
+Uso (a partir da raiz do projeto):
+
+    python benchmarks/contagem.py
+    python benchmarks/contagem.py --taxas 1000 100000 --duracao 20 --json bench_output.txt
+    python benchmarks/contagem.py --ressalto 0.2  # 20% dos pulsos com ressalto
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import contador as contador_mod  # noqa: E402
+from src import contagem_backend  # noqa: E402
+from src.contador import Contador  # noqa: E402
+from src.gpio_drivers import SimulatedGPIODriver  # noqa: E402
+from src.gpio_handler import GPIOHandler  # noqa: E402
+from src.persistencia import EscritorContagens  # noqa: E402
+
+TAXAS = [1000, 10000, 50000, 100000]  # garrafas/hora
+LARGURAS = [0.005, 0.02]  # segundos
+MODOS = ["eventos", "polling"]
+CENARIOS = ["base", "api", "db_lento"]
+
+
+class RelogioInstrumentado:
+    """Substitui o módulo time nos módulos do contador para medir o atraso
+    de cada sleep (jitter de acordar) por thread"""
+
+    def __init__(self):
+        self.atrasos = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, nome):
+        return getattr(time, nome)
+
+    def sleep(self, segundos):
+        inicio = time.monotonic()
+        time.sleep(segundos)
+        atraso = time.monotonic() - inicio - segundos
+        nome = threading.current_thread().name
+        with self._lock:
+            self.atrasos.setdefault(nome, []).append(atraso)
+
+    def reset(self):
+        with self._lock:
+            self.atrasos = {}
+
+
+class DatabaseSimulada:
+    """Substitui o DatabaseManager; `atraso` simula um SQL Server lento"""
+
+    def __init__(self, atraso: float = 0):
+        self.atraso = atraso
+        self.gravacoes = 0
+
+    def amostra_contagem(self, contador, id_ordem, contagem, contagem_total):
+        return {"contagem": contagem}
+
+    def gravar_contagens(self, amostras):
+        time.sleep(self.atraso)
+        self.gravacoes += len(amostras)
+
+    def desativar_ordens_ativas(self, ordem=None):
+        pass
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def polling_api(app, parar: threading.Event, latencias: list, intervalo: float):
+    cliente = app.test_client()
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        cliente.get("/api/info")
+        latencias.append(time.perf_counter() - inicio)
+        parar.wait(intervalo)
+
+
+def executar(taxa, largura, modo, cenario, duracao, relogio, clientes_api, ressalto=0):
+    driver = SimulatedGPIODriver(
+        22, 23, taxa=taxa, largura=largura, jitter=0.1, ressalto=ressalto, seed=1
+    )
+    gpio = GPIOHandler(driver)
+    db = DatabaseSimulada(atraso=duracao if cenario == "db_lento" else 0)
+    contador = Contador(gpio, db, modo_contagem=modo, escritor=EscritorContagens(db))
+    contador.state.configurado = True
+    contador.state.contagem_total = 10**9
+    if ressalto:
+        # O filtro de ressaltos vem desligado: liga-o com os valores de partida
+        filtro = contador._backend.filtro
+        filtro.largura_minima, filtro.intervalo_base, filtro.fracao = 0.002, 0.003, 0.05
+    contador._backend.configurar(taxa)  # Filtro de ressaltos ajustado à cadência
+
+    # Atraso entre o flanco agendado pelo simulador que conta a garrafa (o
+    # ascendente, ou o descendente com o filtro de ressaltos) e o seu registo
+    latencias_flanco = []
+    registar = contador._registar_garrafas
+    fim_pulso = largura if ressalto else 0
+
+    def registar_medido(quantidade, instante):
+        latencias_flanco.append(time.monotonic() - instante - fim_pulso)
+        registar(quantidade, instante)
+
+    contador._registar_garrafas = registar_medido
+
+    parar_api = threading.Event()
+    latencias_api = []
+    threads_api = []
+    if cenario == "api":
+        from src.api import create_app
+
+        app = create_app(contador)
+        threads_api = [
+            threading.Thread(
+                target=polling_api, args=(app, parar_api, latencias_api, 0.05), daemon=True
+            )
+            for _ in range(clientes_api)
+        ]
+
+    relogio.reset()
+    contador.start()
+    for thread in threads_api:
+        thread.start()
+
+    cpu_inicio = time.process_time()
+    parede_inicio = time.monotonic()
+    contador.iniciar_contagem()
+    time.sleep(duracao)
+    driver.set_door(False)  # Pára o trem de pulsos e deixa terminar o pulso em curso
+    time.sleep(largura + 0.05)
+    contador._backend.desarmar()
+    esperado = driver.pulsos_gerados
+    contado = contador.state.contagem_atual
+    cpu = (time.process_time() - cpu_inicio) / (time.monotonic() - parede_inicio)
+
+    parar_api.set()
+    for thread in threads_api:
+        thread.join()
+    ciclo = getattr(contador._backend, "ciclo", None)
+    thread_backend = ciclo._thread if ciclo is not None else None
+    contador._running = False
+    contador._backend.stop()
+    gpio.cleanup()
+
+    # Só as threads desta execução (as das anteriores podem ainda estar a dormir)
+    threads = contador._threads + [thread_backend]
+    nomes = {thread.name for thread in threads if thread is not None}
+    jitter = {
+        nome: {
+            "p50_us": percentil(valores, 0.5) * 1e6,
+            "p99_us": percentil(valores, 0.99) * 1e6,
+            "max_us": max(valores) * 1e6,
+        }
+        for nome, valores in relogio.atrasos.items()
+        if nome in nomes
+    }
+
+    return {
+        "taxa": taxa,
+        "largura": largura,
+        "modo": modo,
+        "cenario": cenario,
+        "esperado": esperado,
+        "contado": contado,
+        "perdidos_pct": (esperado - contado) * 100 / esperado if esperado else 0.0,
+        "ressaltos_gerados": driver.ressaltos_gerados,
+        "ressaltos_filtrados": contador._backend.filtro.rejeitados,
+        "cpu_pct": cpu * 100,
+        "jitter": jitter,
+        "latencia_flanco_p99_us": percentil(latencias_flanco, 0.99) * 1e6
+        if modo == "eventos"
+        else None,
+        "api_p99_ms": percentil(latencias_api, 0.99) * 1e3 if latencias_api else None,
+        "api_pedidos": len(latencias_api),
+    }
+
+
+def imprimir(resultado):
+    jitter = " ".join(
+        f"{nome}={valores['p99_us']:.0f}us" for nome, valores in resultado["jitter"].items()
+    )
+    extra = ""
+    if resultado["latencia_flanco_p99_us"] is not None:
+        extra += f" flanco_p99={resultado['latencia_flanco_p99_us']:.0f}us"
+    if resultado["ressaltos_gerados"]:
+        extra += f" ressaltos={resultado['ressaltos_filtrados']}/{resultado['ressaltos_gerados']}"
+    if resultado["api_p99_ms"] is not None:
+        extra += f" api_p99={resultado['api_p99_ms']:.1f}ms ({resultado['api_pedidos']} pedidos)"
+    print(
+        f"{resultado['taxa']:>7}/h {resultado['largura'] * 1000:>5.1f}ms "
+        f"{resultado['modo']:<8} {resultado['cenario']:<8} "
+        f"{resultado['contado']:>6}/{resultado['esperado']:<6} "
+        f"perdidos={resultado['perdidos_pct']:5.2f}% cpu={resultado['cpu_pct']:5.1f}% "
+        f"jitter_p99[{jitter}]{extra}",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--taxas", type=int, nargs="+", default=TAXAS)
+    parser.add_argument("--larguras", type=float, nargs="+", default=LARGURAS)
+    parser.add_argument("--modos", nargs="+", default=MODOS, choices=MODOS)
+    parser.add_argument("--cenarios", nargs="+", default=CENARIOS, choices=CENARIOS)
+    parser.add_argument("--duracao", type=float, default=12, help="segundos por execução")
+    parser.add_argument("--clientes-api", type=int, default=4)
+    parser.add_argument("--ressalto", type=float, default=0, help="fração de pulsos com ressalto")
+    parser.add_argument("--json", help="ficheiro onde gravar os resultados")
+    args = parser.parse_args()
+
+    relogio = RelogioInstrumentado()
+    contador_mod.time = relogio
+    contagem_backend.time = relogio
+
+    resultados = []
+    for taxa in args.taxas:
+        for largura in args.larguras:
+            for modo in args.modos:
+                for cenario in args.cenarios:
+                    resultado = executar(
+                        taxa,
+                        largura,
+                        modo,
+                        cenario,
+                        args.duracao,
+                        relogio,
+                        args.clientes_api,
+                        args.ressalto,
+                    )
+                    imprimir(resultado)
+                    resultados.append(resultado)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(resultados, indent=2))
+
+    pior = max(resultados, key=lambda r: r["perdidos_pct"])
+    print(f"Pior caso: {pior['perdidos_pct']:.2f}% perdidos ({pior['taxa']}/h, {pior['modo']}, {pior['cenario']})")
+    medias = [r["perdidos_pct"] for r in resultados]
+    print(f"Média de pulsos perdidos: {statistics.mean(medias):.2f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Custo de CPU por linha no modo multi-linha
+
+Conta N linhas simuladas ao mesmo tempo, de duas formas: N contadores
+independentes, cada um com as suas threads (como N processos), e um
+GestorLinhas com os loops partilhados. Reporta garrafas contadas vs pulsos
+gerados e o CPU do processo, total e por linha.
+
+Uso (a partir da raiz do projeto):
+
+    python benchmarks/linhas.py
+    python benchmarks/linhas.py --linhas 1 2 4 8 --modos polling --duracao 10
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.contador import Contador  # noqa: E402
+from src.gpio_drivers import SimulatedGPIODriver  # noqa: E402
+from src.gpio_handler import GPIOHandler  # noqa: E402
+from src.linhas import GestorLinhas  # noqa: E402
+from src.persistencia import EscritorContagens  # noqa: E402
+
+
+class DatabaseSimulada:
+    def amostra_contagem(self, contador, id_ordem, contagem, contagem_total):
+        return {"contagem": contagem}
+
+    def gravar_contagens(self, amostras):
+        pass
+
+    def gravar_estatisticas(self, ordem, stats):
+        pass
+
+    def desativar_ordens_ativas(self, ordem=None):
+        pass
+
+
+def executar(n, modo, arranjo, taxa, duracao):
+    db = DatabaseSimulada()
+    escritor = EscritorContagens(db)
+    drivers = [SimulatedGPIODriver(22 + i, 40 + i, taxa=taxa, seed=i) for i in range(n)]
+
+    if arranjo == "partilhado":
+        gestor = GestorLinhas(db, escritor=escritor, modo_contagem=modo)
+        contadores = [gestor.adicionar(str(i + 1), GPIOHandler(d)) for i, d in enumerate(drivers)]
+        gestor.start()
+    else:
+        gestor = None
+        contadores = [
+            Contador(GPIOHandler(d), db, modo_contagem=modo, escritor=escritor, linha=str(i + 1))
+            for i, d in enumerate(drivers)
+        ]
+        for contador in contadores:
+            contador.start()
+
+    for contador in contadores:
+        contador.state.configurado = True
+        contador.state.contagem_total = 10**9
+        contador._backend.configurar(taxa)
+
+    cpu_inicio = time.process_time()
+    parede_inicio = time.monotonic()
+    for contador in contadores:
+        contador.iniciar_contagem()
+    time.sleep(duracao)
+    for driver in drivers:
+        driver.set_door(False)
+    time.sleep(0.1)
+    for contador in contadores:
+        contador._backend.desarmar()
+    cpu = (time.process_time() - cpu_inicio) / (time.monotonic() - parede_inicio)
+    esperado = sum(driver.pulsos_gerados for driver in drivers)
+    contado = sum(contador.state.contagem_atual for contador in contadores)
+
+    # Sem Contador.stop(): o loop das pausas programadas dorme 30 s
+    if gestor is not None:
+        gestor._running = False
+        gestor.ciclo_polling.stop()
+    for contador in contadores:
+        contador._running = False
+        contador._backend.stop()
+        contador.paragens.stop()
+        contador.gpio.cleanup()
+    escritor.stop()
+    return {"esperado": esperado, "contado": contado, "cpu": cpu}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modos", nargs="+", default=["eventos", "polling"])
+    parser.add_argument("--taxa", type=float, default=36000, help="garrafas/hora por linha")
+    parser.add_argument("--duracao", type=float, default=5)
+    args = parser.parse_args()
+
+    for modo in args.modos:
+        for arranjo in ("independentes", "partilhado"):
+            for n in args.linhas:
+                r = executar(n, modo, arranjo, args.taxa, args.duracao)
+                print(
+                    f"{modo:8s} {arranjo:13s} linhas={n}  "
+                    f"{r['contado']:>6}/{r['esperado']:<6} "
+                    f"cpu={r['cpu'] * 100:5.1f}%  por linha={r['cpu'] * 100 / n:5.1f}%"
+                )
+
+
+if __name__ == "__main__":
+    main()
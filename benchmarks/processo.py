@@ -0,0 +1,128 @@
+"""Contagem no processo principal vs num processo isolado, com o GIL ocupado
+
+Conta garrafas do driver simulado com COUNTER_MODE=eventos (no processo da
+API) e com COUNTER_MODE=processo, com e sem uma thread que prende o GIL em
+chamadas C longas (ordenações de listas grandes, como uma pausa do GC ou
+uma chamada ao pymssql). Reporta garrafas contadas vs pulsos gerados, o
+atraso entre o flanco e o registo no contador e a taxa medida.
+
+Uso (a partir da raiz do projeto):
+
+    python benchmarks/processo.py
+    python benchmarks/processo.py --taxa 100000 --largura 0.005 --duracao 10
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(Path(__file__).resolve().parent.parent)
+
+
+class DatabaseSimulada:
+    def amostra_contagem(self, contador, id_ordem, contagem, contagem_total):
+        return {"contagem": contagem}
+
+    def gravar_contagens(self, amostras):
+        pass
+
+    def gravar_estatisticas(self, ordem, stats):
+        pass
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))] if ordenados else 0.0
+
+
+def ocupar_gil(parar: threading.Event, tamanho: int):
+    lista = list(range(tamanho, 0, -1))
+    while not parar.is_set():
+        sorted(lista)  # Uma chamada C que não larga o GIL
+
+
+def executar(modo, cenario, taxa, largura, duracao, tamanho):
+    from src.contador import Contador
+    from src.gpio_drivers import SimulatedGPIODriver
+    from src.gpio_handler import GPIOHandler
+    from src.persistencia import EscritorContagens
+    from src.processo_contagem import DriverProcesso
+
+    if modo == "processo":
+        driver = DriverProcesso("sim", 22, 23)
+    else:
+        driver = SimulatedGPIODriver(22, 23, taxa=taxa, largura=largura, seed=1)
+    db = DatabaseSimulada()
+    contador = Contador(GPIOHandler(driver), db, modo_contagem=modo, escritor=EscritorContagens(db))
+    contador.state.configurado = True
+    contador.state.contagem_total = 10**9
+    contador._backend.configurar(taxa)
+
+    atrasos = []
+    registar = contador._registar_garrafas
+
+    def registar_medido(quantidade, instante):
+        atrasos.append(time.monotonic() - instante - largura)  # Conta no fim do pulso
+        registar(quantidade, instante)
+
+    contador._registar_garrafas = registar_medido
+
+    parar = threading.Event()
+    contador.start()
+    contador.iniciar_contagem()
+    inicio = time.monotonic()
+    ocupacao = None
+    if cenario == "gil":
+        ocupacao = threading.Thread(target=ocupar_gil, args=(parar, tamanho), daemon=True)
+        ocupacao.start()
+    time.sleep(duracao)
+    taxa_medida = contador.state.passagens.taxa(time.monotonic() - inicio)
+    parar.set()
+    if ocupacao:
+        ocupacao.join()
+    contador.set_porta(False)
+    time.sleep(largura + 0.1)
+    if modo == "processo":
+        esperado = driver.bloco.ler()[6]
+    else:
+        esperado = driver.pulsos_gerados
+    contado = contador.state.contagem_atual
+
+    contador._running = False  # Sem Contador.stop(): o loop das pausas programadas dorme 30 s
+    contador._backend.stop()
+    contador.paragens.stop()
+    contador.gpio.cleanup()
+    contador.escritor.stop()
+    return contado, esperado, atrasos, taxa_medida
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--taxa", type=float, default=36000, help="garrafas/hora")
+    parser.add_argument("--largura", type=float, default=0.005, help="largura do pulso (s)")
+    parser.add_argument("--duracao", type=float, default=5)
+    parser.add_argument("--tamanho", type=int, default=2_000_000, help="lista ordenada pela thread do GIL")
+    args = parser.parse_args()
+
+    # O processo de contagem lê a configuração do simulador do ambiente
+    os.environ["SIM_TAXA"] = str(args.taxa)
+    os.environ["SIM_LARGURA"] = str(args.largura)
+
+    for modo in ("eventos", "processo"):
+        for cenario in ("base", "gil"):
+            contado, esperado, atrasos, taxa = executar(
+                modo, cenario, args.taxa, args.largura, args.duracao, args.tamanho
+            )
+            print(
+                f"{modo:8s} {cenario:4s}  {contado:>5}/{esperado:<5} "
+                f"atraso p50={percentil(atrasos, 0.5) * 1000:6.1f}ms "
+                f"p99={percentil(atrasos, 0.99) * 1000:6.1f}ms "
+                f"max={max(atrasos, default=0) * 1000:6.1f}ms  taxa={taxa:.0f}/h"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,9 @@ Description=Krones Counter Service
 After=network.target
 
 [Service]
-Type=simple
+Type=notify
+NotifyAccess=main
+TimeoutStartSec=60
 User=root
 WorkingDirectory=/home/pi/krones
 ExecStart=/usr/bin/python3 main.py
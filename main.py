@@ -1,17 +1,30 @@
+from src.arranque import arranque, sd_notify  # Primeiro: marca o início do arranque
 import logging
 from pathlib import Path
 import signal
 import sys
-from src.config import app_config
+import threading
+from src.batimentos import batimentos
+from src.checkpoint import CheckpointEstado
+from src.config import (
+    app_config,
+    cache_config,
+    carregar_linhas,
+    checkpoint_config,
+    watchdog_config,
+)
 from src.contador import Contador
-from src.gpio_handler import GPIOHandler
+from src.gpio_handler import GPIOHandler, criar_driver_linha
+from src.linhas import GestorLinhas
 from src.database import DatabaseManager
-from src.api import create_app
-import ssl
+from src.logger import setup_logger
+from src.metricas import metricas
 
 class Application:
     def __init__(self):
         self.contador = None
+        self.linhas = None
+        self.db_manager = None
         self.setup_signal_handlers()
         self.setup_directories()
         self.setup_logging()
@@ -25,37 +38,105 @@ class Application:
         Path("certs").mkdir(exist_ok=True)
 
     def setup_logging(self):
-        logging.basicConfig(
-            filename=str(app_config.log_path),
-            level=logging.INFO,
-            format="%(asctime)s;%(levelname)s;%(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
-        )
+        setup_logger()
 
     def handle_shutdown(self, signum, frame):
         logging.info("Recebido sinal de shutdown")
         if self.contador:
             self.contador.stop()
+        if self.linhas:
+            self.linhas.stop()
+        if self.db_manager:
+            self.db_manager.fechar()
         sys.exit(0)
 
+    def aquecer_bd(self):
+        """Abre as conexões à base de dados em segundo plano"""
+        try:
+            self.db_manager.aquecer()
+            arranque.marcar("bd")
+        except Exception as e:
+            logging.error(f"Base de dados indisponível no arranque: {e}")
+        if cache_config.prefetch > 0:
+            self.db_manager.iniciar_prefetch(cache_config.prefetch)
+
     def run(self):
         try:
             # Inicializa componentes
-            gpio_handler = GPIOHandler()
-            db_manager = DatabaseManager()
-            self.contador = Contador(gpio_handler, db_manager)
-
-            # Inicia o contador
-            self.contador.start()
-
-            # Configura e inicia a API
-            app = create_app(self.contador)
-            context = ssl.SSLContext(ssl.PROTOCOL_TLS)
-            context.load_cert_chain(
-                certfile=str(app_config.cert_path), keyfile=str(app_config.key_path)
+            # A contagem arranca primeiro; a base de dados (ligações e cache)
+            # prepara-se em segundo plano e a API (Flask, TLS) vem depois
+            batimentos.abrir(watchdog_config.batimentos)
+            self.db_manager = DatabaseManager()
+            linhas = carregar_linhas()
+
+            if linhas:
+                # Modo multi-linha: um contador por linha, rotas em /linha/<id>
+                self.linhas = GestorLinhas(
+                    self.db_manager,
+                    diretorio_checkpoint=checkpoint_config.diretorio
+                    if checkpoint_config.ativo
+                    else None,
+                )
+                for linha in linhas:
+                    driver = criar_driver_linha(linha.counter_pin, linha.door_pin, linha.id)
+                    self.linhas.adicionar(linha.id, GPIOHandler(driver))
+                self.linhas.start()
+                logging.info(f"Modo multi-linha: {', '.join(l.id for l in linhas)}")
+            else:
+                gpio_handler = GPIOHandler()
+                checkpoint = None
+                if checkpoint_config.ativo:
+                    checkpoint = CheckpointEstado(
+                        checkpoint_config.diretorio / "contador.bin", checkpoint_config.sync
+                    )
+                self.contador = Contador(gpio_handler, self.db_manager, checkpoint=checkpoint)
+
+                # Inicia o contador
+                self.contador.start()
+            arranque.marcar("contagem")
+            sd_notify("STATUS=A contar; a iniciar a API")
+            threading.Thread(target=self.aquecer_bd, daemon=True).start()
+
+            # Configura e inicia a API (o Flask só é importado aqui)
+            from src.api import create_app
+            from src.servidor import ServidorProducao, criar_contexto_tls
+
+            if self.linhas:
+                app = create_app(linhas=self.linhas.contadores, turnos=self.linhas.turnos)
+            else:
+                app = create_app(self.contador, turnos=self.contador.turnos)
+            context = criar_contexto_tls(
+                app_config.cert_path, app_config.key_path, app_config.tls_tickets
             )
 
-            app.run(host=app_config.host, port=app_config.port, ssl_context=context)
+            if app_config.server_mode == "dev":
+                arranque.marcar("api")
+                sd_notify("READY=1", "STATUS=A contar e a servir a API")
+                app.run(host=app_config.host, port=app_config.port, ssl_context=context)
+                return
+
+            servidor = ServidorProducao(
+                app_config.host,
+                app_config.port,
+                app,
+                context,
+                threads=app_config.server_threads,
+                fila=app_config.server_fila,
+                timeout=app_config.server_timeout,
+            )
+            metricas.medidor(
+                "servidor_fila_ligacoes",
+                "Ligações à espera de uma thread do servidor",
+                lambda: servidor.ocupacao()["fila"],
+            )
+            logging.info(
+                f"API a servir em https://{app_config.host}:{app_config.port} "
+                f"({app_config.server_threads} threads)"
+            )
+            arranque.marcar("api")
+            marcos = " ".join(f"{marco}={t:.3f}s" for marco, t in arranque.marcos.items())
+            sd_notify("READY=1", f"STATUS=A contar e a servir a API ({marcos})")
+            servidor.serve_forever()
 
         except Exception as e:
             logging.error(f"Erro fatal na aplicação: {e}")
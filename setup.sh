@@ -36,7 +36,9 @@ Description=Krones Counter Service
 After=network.target
 
 [Service]
-Type=simple
+Type=notify
+NotifyAccess=main
+TimeoutStartSec=60
 User=root
 Group=root
 WorkingDirectory=${BASE_DIR}
@@ -73,7 +75,7 @@ WorkingDirectory=${BASE_DIR}
 Environment=VIRTUAL_ENV=${BASE_DIR}/venv
 Environment=PATH=${BASE_DIR}/venv/bin:${PATH}
 Environment=PYTHONPATH=${BASE_DIR}
-ExecStart=${BASE_DIR}/venv/bin/python ${BASE_DIR}/src/watchdog.py
+ExecStart=${BASE_DIR}/venv/bin/python -m src.watchdog
 Restart=always
 RestartSec=5
 
@@ -1,51 +1,90 @@
-from flask import Flask, jsonify
+from flask import Blueprint, Flask, Response, g, jsonify, make_response, request
 from flask_cors import CORS
+from typing import Dict, Optional
+from .arranque import arranque
 from .contador import Contador
+from .estatisticas import LIMITES_INTERVALOS
+from .metricas import metricas
+from .paragens import formatar_registo
+from .series import ficheiro_ordem, formatar_tempo, ler_registo, reduzir
+from .turnos import AgendadorTurnos
+from .config import app_config
 import logging
 from datetime import datetime, timedelta
+import hashlib
+import json
 import math
-import numpy as np
-import pymssql
+import threading
+import time
 
+DURACAO_PEDIDO = metricas.histograma(
+    "api_pedido_segundos", "Duração dos pedidos à API até à resposta, por rota", ("rota",)
+)
+
+# Clientes do /stream de todas as linhas: cada um prende uma thread do servidor,
+# por isso fica sempre pelo menos uma livre para os outros pedidos
+_STREAMS = threading.BoundedSemaphore(
+    max(1, min(app_config.stream_max_clientes, app_config.server_threads - 1))
+)
+
+
+def _etag(*valores) -> str:
+    """ETag curto a partir dos valores que definem uma resposta"""
+    return hashlib.blake2b(repr(valores).encode(), digest_size=8).hexdigest()
+
+
+def _numero_ordem(ordem: str) -> str:
+    """Número da ordem como está na base de dados (no URL as "/" vêm como "-")"""
+    return ordem.replace("-", "/")
+
+
+def _formatar_epoch(instante: float) -> str:
+    return datetime.fromtimestamp(instante).strftime("%Y-%m-%d %H:%M:%S")
 
-def create_app(contador: Contador) -> Flask:
-    app = Flask(__name__)
-    CORS(app)
 
-    @app.route("/abrir-porta", methods=["GET"])
+def _sse(tipo: str, dados) -> str:
+    """Formata um evento Server-Sent Events"""
+    return f"event: {tipo}\ndata: {json.dumps(dados, default=str)}\n\n"
+
+
+def criar_rotas(contador: Contador, nome: str = "contador") -> Blueprint:
+    """Rotas de uma linha (na raiz, ou em /linha/<id> no modo multi-linha)"""
+    rotas = Blueprint(nome, __name__)
+
+    @rotas.route("/abrir-porta", methods=["GET"])
     def abrir_porta():
         contador.set_porta(True)
         return jsonify({"status": "OK"}), 200
 
-    @app.route("/fechar-porta", methods=["GET"])
+    @rotas.route("/fechar-porta", methods=["GET"])
     def fechar_porta():
         contador.set_porta(False)
         return jsonify({"status": "OK"}), 200
 
-    @app.route("/iniciar-contagem", methods=["GET"])
+    @rotas.route("/iniciar-contagem", methods=["GET"])
     def iniciar_contagem():
         contador.iniciar_contagem()
         return jsonify({"status": "OK"}), 200
 
-    @app.route("/parar-contagem", methods=["GET"])
+    @rotas.route("/parar-contagem", methods=["GET"])
     def parar_contagem():
         contador.parar_contagem()
         return jsonify({"status": "OK"}), 200
 
-    @app.route("/pausa", methods=["GET"])
+    @rotas.route("/pausa", methods=["GET"])
     def pausa():
         contador.pausar_contagem()
         return jsonify({"status": "OK"}), 200
 
-    @app.route("/retomar", methods=["GET"])
+    @rotas.route("/retomar", methods=["GET"])
     def retomar():
         contador.retomar_contagem()
         return jsonify({"status": "OK"}), 200
 
-    @app.route("/quebra/<int:valor>", methods=["GET"])
+    @rotas.route("/quebra/<int:valor>", methods=["GET"])
     def quebra(valor):
         try:
-            if contador.state.estado == 1:
+            if contador.snapshot.estado == 1:
                 contador.adicionar_quebras(valor)
                 return jsonify({"status": "OK"}), 200
             return jsonify({"message": "Contador não está em contagem"}), 400
@@ -53,7 +92,7 @@ def create_app(contador: Contador) -> Flask:
             logging.error(f"Erro ao registrar quebra: {e}")
             return jsonify({"error": str(e)}), 500
 
-    @app.route("/setup/<string:ordem>/<int:cnt>", methods=["GET"])
+    @rotas.route("/setup/<string:ordem>/<int:cnt>", methods=["GET"])
     def setup_contagem(ordem, cnt):
         try:
             dados = contador.db.buscar_ordem_producao(ordem)
@@ -70,26 +109,7 @@ def create_app(contador: Contador) -> Flask:
                 )
                 
                 # Registrar na base de dados
-                with pymssql.connect(contador.db._host, contador.db._user, contador.db._password, "SIP") as conn:
-                    with conn.cursor() as cursor:
-                        # Inserir nova ordem de produção
-                        sql_insert = """
-                            INSERT INTO krones_contadoreslinha
-                                (Data, Ativo, Ordem, QuantidadeInicial, Artigo)
-                            VALUES
-                                (%s, %s, %s, %s, %s)
-                        """
-                        
-                        data_insert = (
-                            datetime.now().replace(microsecond=0).strftime("%Y-%m-%d %H:%M:%S"),
-                            1,
-                            ordem,
-                            cnt,
-                            dados["Artigo"]
-                        )
-                        
-                        cursor.execute(sql_insert, data_insert)
-                        conn.commit()              
+                contador.db.registar_ordem(ordem, cnt, dados["Artigo"])
                 return jsonify(
                     {"message": f"Ordem {ordem} configurada com {cnt} garrafas totais"}
                 ), 200
@@ -98,9 +118,9 @@ def create_app(contador: Contador) -> Flask:
             logging.error(f"Erro ao configurar contagem: {e}")
             return jsonify({"error": str(e)}), 500
 
-    @app.route("/reset-contador", methods=["GET"])
+    @rotas.route("/reset-contador", methods=["GET"])
     def reset_contador():
-        if contador.state.estado == 0:
+        if contador.snapshot.estado == 0:
             try:
                 contador.reset()
                 return jsonify({"message": "OK"}), 200
@@ -109,84 +129,362 @@ def create_app(contador: Contador) -> Flask:
                 return jsonify({"message": "Erro ao resetar contador"}), 500
         return jsonify({"message": "Contador não está parado"}), 400
 
-    @app.route("/status", methods=["GET"])
+    @rotas.route("/status", methods=["GET"])
     def status():
-        media = (
-            round(np.mean(contador.state.estatistica_gfa))
-            if contador.state.estatistica_gfa
-            else 0
-        )
+        snapshot = contador.snapshot
         data = {
-            "Ordem": contador.state.ordem,
-            "Artigo": contador.state.artigo,
-            "DescricaoArtigo": contador.state.descricao_artigo,
-            "CadenciaArtigo": contador.state.cadencia_artigo,
-            "Inicio": contador.state.tempo_inicio.strftime("%Y-%m-%d %H:%M:%S")
-            if contador.state.tempo_inicio
+            "Ordem": snapshot.ordem,
+            "Artigo": snapshot.artigo,
+            "DescricaoArtigo": snapshot.descricao_artigo,
+            "CadenciaArtigo": snapshot.cadencia_artigo,
+            "Inicio": snapshot.tempo_inicio.strftime("%Y-%m-%d %H:%M:%S")
+            if snapshot.tempo_inicio
             else "",
-            "Fim": contador.state.tempo_fim.strftime("%Y-%m-%d %H:%M:%S")
-            if contador.state.tempo_fim
+            "Fim": snapshot.tempo_fim.strftime("%Y-%m-%d %H:%M:%S")
+            if snapshot.tempo_fim
             else "",
-            "ContagemAtual": contador.state.contagem_atual,
-            "ContagemTotal": contador.state.contagem_total,
-            "MediaProducao": media,
-            "Nominal": contador.state.estatistica_nominal,
-            "Quebras": contador.state.quebras,
-            "EstadoPorta": contador.gpio.door_state,
-            "EstadoContador": contador.state.estado,
-            "EstadoConfiguracao": contador.state.configurado,
-            "IdBDOrdemProducao": contador.state.id_ordem,
+            "ContagemAtual": snapshot.contagem_atual,
+            "ContagemTotal": snapshot.contagem_total,
+            "MediaProducao": snapshot.media_ordem,
+            "Nominal": snapshot.estatistica_nominal,
+            "TaxaInstantanea": snapshot.taxa_instantanea,
+            "TaxaMinuto": snapshot.taxa_minuto,
+            "EmParagem": snapshot.em_paragem,
+            "NumParagens": snapshot.num_paragens,
+            "TempoParado": snapshot.tempo_parado,
+            "Ressaltos": snapshot.ressaltos,
+            "Quebras": snapshot.quebras,
+            "EstadoPorta": snapshot.porta_gpio,
+            "EstadoContador": snapshot.estado,
+            "EstadoConfiguracao": snapshot.configurado,
+            "IdBDOrdemProducao": snapshot.id_ordem,
         }
         return jsonify({"data": data}), 200
 
-    @app.route("/api/info", defaults={"NumPontos": 180, "Ordem": None})
-    @app.route("/api/info/<int:NumPontos>/<string:Ordem>")
+    @rotas.route("/api/info", defaults={"NumPontos": 180, "Ordem": None})
+    @rotas.route("/api/info/<int:NumPontos>/<string:Ordem>")
     def ApiInfo(NumPontos, Ordem):
-        media = (
-            round(np.mean(contador.state.estatistica_gfa))
-            if contador.state.estatistica_gfa
-            else 0
-        )
+        """Estado e séries da ordem
+
+        As séries completas são reduzidas a no máximo `NumPontos` pontos
+        (LTTB, mantendo as paragens). Com uma `Ordem` que não é a atual
+        devolve as séries dessa ordem a partir do ficheiro local.
+
+        `?since=<seq>` devolve só os pontos das séries acrescentados depois
+        de `seq` (o campo "Seq" da resposta anterior), sem redução;
+        `&serie=<id>` garante que o cursor é da mesma série. Responde 304 se
+        o ETag enviado em If-None-Match ainda for válido. Tudo é lido do
+        mesmo snapshot, e as séries só até à sequência que ele regista.
+        """
+        if NumPontos < 3:
+            return jsonify({"error": "NumPontos tem de ser pelo menos 3"}), 400
+        snapshot = contador.snapshot
+        if Ordem and _numero_ordem(Ordem) != _numero_ordem(snapshot.ordem or ""):
+            return _info_historico(Ordem, NumPontos)
+        series = snapshot.series
+        seq = snapshot.seq
+        desde = request.args.get("since", type=int)
+        serie_cliente = request.args.get("serie")
+        if desde is not None and (
+            desde > seq or (serie_cliente and serie_cliente != series.id)
+        ):
+            desde = None  # Cursor de outra série: responde com as séries completas
+
+        media = snapshot.media_ordem
         estimativa_tempo = None
 
-        if media > 0 and contador.state.estado == 1:
+        if media > 0 and snapshot.estado == 1:
             minutos = math.ceil(
-                (contador.state.contagem_total - contador.state.contagem_atual)
-                * 60
-                / media
+                (snapshot.contagem_total - snapshot.contagem_atual) * 60 / media
             )
             estimativa_tempo = (
                 datetime.now() + timedelta(minutes=minutos)
             ).strftime("%Y-%m-%d %H:%M:%S")
 
-        data = {
-            "DataDados": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "Ordem": contador.state.ordem,
-            "Artigo": contador.state.artigo,
-            "DescricaoArtigo": contador.state.descricao_artigo,
-            "CadenciaArtigo": contador.state.cadencia_artigo,
-            "Inicio": contador.state.tempo_inicio.strftime("%Y-%m-%d %H:%M:%S")
-            if contador.state.tempo_inicio
+        campos = {
+            "Ordem": snapshot.ordem,
+            "Artigo": snapshot.artigo,
+            "DescricaoArtigo": snapshot.descricao_artigo,
+            "CadenciaArtigo": snapshot.cadencia_artigo,
+            "Inicio": snapshot.tempo_inicio.strftime("%Y-%m-%d %H:%M:%S")
+            if snapshot.tempo_inicio
             else "",
-            "Fim": contador.state.tempo_fim.strftime("%Y-%m-%d %H:%M:%S")
-            if contador.state.tempo_fim
+            "Fim": snapshot.tempo_fim.strftime("%Y-%m-%d %H:%M:%S")
+            if snapshot.tempo_fim
             else "",
-            "ContagemAtual": contador.state.contagem_atual,
-            "ContagemTotal": contador.state.contagem_total,
+            "ContagemAtual": snapshot.contagem_atual,
+            "ContagemTotal": snapshot.contagem_total,
             "MediaProducao": media,
             "EstimativaFecho": estimativa_tempo,
-            "Nominal": contador.state.estatistica_gfa,
-            "Paragens": contador.state.paragens,
-            "Quebras": contador.state.quebras,
-            "EstadoPorta": contador.gpio.door_state,
-            "EstadoContador": contador.state.estado,
-            "EstadoConfiguracao": contador.state.configurado,
-            "Media": contador.state.estatistica_media,
-            "Cadencia": contador.state.estatistica_cadencia,
-            "Tempo": contador.state.estatistica_tempo,
-            "IdBDOrdemProducao": contador.state.id_ordem,
+            "TaxaInstantanea": snapshot.taxa_instantanea,
+            "TaxaMinuto": snapshot.taxa_minuto,
+            "EmParagem": snapshot.em_paragem,
+            "NumParagens": snapshot.num_paragens,
+            "TempoParado": snapshot.tempo_parado,
+            "Quebras": snapshot.quebras,
+            "EstadoPorta": snapshot.porta_gpio,
+            "EstadoContador": snapshot.estado,
+            "EstadoConfiguracao": snapshot.configurado,
+            "IdBDOrdemProducao": snapshot.id_ordem,
+            "Seq": seq,
+            "Serie": series.id,
+        }
+        if desde is not None:
+            # Se os pontos pedidos já saíram da memória, "Desde" é maior que `since`
+            campos["Desde"] = max(desde, seq - series.capacidade, 0)
+
+        # Os pontos das séries ficam definidos pela série, seq, since e
+        # NumPontos; o resto da resposta são os campos
+        etag = _etag(series.id, seq, desde, NumPontos, sorted(campos.items()))
+        if etag in request.if_none_match:
+            resposta = make_response("", 304)
+            resposta.set_etag(etag)
+            return resposta
+
+        if desde is None:
+            instantes, colunas = _reduzida(series, seq, NumPontos)
+        else:
+            instantes = series.instantes(desde, seq).tolist()
+            colunas = {nome: series.coluna(nome, desde, seq).tolist() for nome in series.nomes}
+
+        data = {
+            "DataDados": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            **campos,
+            # O mesmo que /api/paragens; só muda com NumParagens ou EmParagem (no ETag)
+            "Paragens": [formatar_registo(p) for p in contador.paragens.historico()],
+            "Nominal": colunas["gfa"],
+            "MarcasParagem": colunas["paragem"],
+            "Media": colunas["media"],
+            "Cadencia": colunas["cadencia"],
+            "Tempo": [formatar_tempo(t) for t in instantes],
+        }
+        resposta = jsonify(data)
+        resposta.set_etag(etag)
+        return resposta, 200
+
+    reduzidas: Dict[int, tuple] = {}  # NumPontos -> (id da série, seq, pontos)
+
+    def _reduzida(series, seq: int, pontos: int):
+        """Séries completas da ordem atual reduzidas a `pontos` (memorizadas por seq)"""
+        chave = (series.id, seq)
+        memorizada = reduzidas.get(pontos)
+        if memorizada is None or memorizada[0] != chave:
+            if len(reduzidas) >= 16:
+                reduzidas.clear()
+            instantes, colunas = series.completa(seq)
+            memorizada = reduzidas[pontos] = (chave, reduzir(instantes, colunas, pontos))
+        return memorizada[1]
+
+    def _info_historico(ordem: str, pontos: int):
+        """Séries de uma ordem anterior, lidas do ficheiro local da ordem"""
+        caminho = ficheiro_ordem(contador.diretorio_series, _numero_ordem(ordem))
+        try:
+            info = caminho.stat()
+        except FileNotFoundError:
+            return jsonify({"error": "Ordem sem histórico local"}), 404
+        etag = _etag(str(caminho), info.st_size, info.st_mtime_ns, pontos)
+        if etag in request.if_none_match:
+            resposta = make_response("", 304)
+            resposta.set_etag(etag)
+            return resposta
+
+        instantes, colunas = reduzir(*ler_registo(caminho), pontos)
+        data = {
+            "DataDados": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "Ordem": ordem,
+            "Historico": True,
+            "Inicio": _formatar_epoch(instantes[0]) if instantes else "",
+            "Fim": _formatar_epoch(instantes[-1]) if instantes else "",
+            "Nominal": colunas["gfa"],
+            "Paragens": [],  # O detetor só tem as paragens da ordem atual
+            "MarcasParagem": colunas["paragem"],
+            "Media": colunas["media"],
+            "Cadencia": colunas["cadencia"],
+            "Tempo": [formatar_tempo(t) for t in instantes],
         }
-        return jsonify(data), 200
+        resposta = jsonify(data)
+        resposta.set_etag(etag)
+        return resposta, 200
+
+    @rotas.route("/api/taxa", methods=["GET"])
+    def api_taxa():
+        """Taxas calculadas a partir do instante de cada garrafa
+
+        `?janela=<segundos>` (padrão 60) define a janela da taxa exata e do
+        histograma dos intervalos entre garrafas.
+        """
+        janela = request.args.get("janela", default=60, type=float)
+        if janela <= 0:
+            return jsonify({"error": "janela tem de ser positiva"}), 400
+        snapshot = contador.snapshot
+        passagens, ate = snapshot.passagens, snapshot.passagens_total
+        agora = time.monotonic()
+        data = {
+            "Janela": janela,
+            "Garrafas": passagens.contar(agora - janela, ate),
+            "Taxa": round(passagens.taxa(janela, agora, ate)),
+            "TaxaInstantanea": round(passagens.taxa_instantanea(agora, ate=ate)),
+            "Intervalos": {
+                "Limites": list(LIMITES_INTERVALOS),
+                "Contagens": passagens.intervalos(janela, LIMITES_INTERVALOS, agora, ate),
+            },
+        }
+        return jsonify({"data": data}), 200
+
+    @rotas.route("/api/paragens", methods=["GET"])
+    def api_paragens():
+        """Paragens detetadas na ordem atual, com início, fim e duração"""
+        paragens = [formatar_registo(p) for p in contador.paragens.historico()]
+        return jsonify(
+            {
+                "data": {
+                    "Limiar": round(contador.paragens.limiar, 2),
+                    "TempoParado": round(contador.paragens.tempo_parado, 1),
+                    "Paragens": paragens,
+                }
+            }
+        ), 200
+
+    @rotas.route("/stream", methods=["GET"])
+    def stream():
+        """Stream Server-Sent Events com as alterações do contador
+
+        Eventos: estado (transições), contagem, porta, quebras, estatisticas
+        (cada tick), taxa (a cada segundo durante a contagem), paragem
+        (início e fim de cada paragem detetada) e perdidos (o buffer do cliente transbordou; convém
+        ressincronizar com /api/info). As contagens que chegam dentro de
+        `stream_intervalo` segundos são enviadas como um único evento.
+
+        Acima de STREAM_MAX_CLIENTES clientes ligados responde 503.
+        """
+        if not _STREAMS.acquire(blocking=False):
+            return jsonify({"error": "Demasiados clientes ligados ao stream"}), 503
+        subscricao = contador.eventos.subscrever()
+
+        def gerar():
+            try:
+                yield _sse("estado", {"acao": "ligado", **contador.get_status()})
+                while True:
+                    eventos = subscricao.proximos(timeout=15)
+                    if not eventos:
+                        yield ": keepalive\n\n"
+                        continue
+                    yield "".join(_sse(tipo, dados) for tipo, dados in eventos)
+                    time.sleep(app_config.stream_intervalo)  # Janela de coalescência
+            finally:
+                contador.eventos.cancelar(subscricao)
+
+        resposta = Response(
+            gerar(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # Mesmo que o gerador nunca chegue a correr (cliente que desliga logo)
+        resposta.call_on_close(_STREAMS.release)
+        return resposta
+
+    @rotas.route("/persistencia", methods=["GET"])
+    def persistencia():
+        return jsonify({"data": contador.escritor.estado()}), 200
+
+    @rotas.route("/cache", methods=["GET"])
+    def cache():
+        """Estado das caches de ordens e artigos"""
+        return jsonify({"data": contador.db.estado_cache()}), 200
+
+    @rotas.route("/cache/limpar", methods=["GET"])
+    def limpar_cache():
+        """Esquece uma ordem (?ordem=...) ou todas as ordens e artigos em cache"""
+        contador.db.invalidar_cache(request.args.get("ordem"))
+        return jsonify({"message": "OK"}), 200
+
+    return rotas
+
+
+def create_app(
+    contador: Optional[Contador] = None,
+    linhas: Optional[Dict[str, Contador]] = None,
+    turnos: Optional[AgendadorTurnos] = None,
+) -> Flask:
+    """Aplicação da API: um contador servido na raiz, ou várias `linhas`
+
+    No modo multi-linha as rotas de cada linha ficam em /linha/<id>/...
+    (por exemplo /linha/2/status) e /linhas resume o estado de todas. Com
+    `turnos`, /turnos mostra e altera o calendário das pausas (comum a todas
+    as linhas).
+    """
+    app = Flask(__name__)
+    CORS(app)
+
+    @app.before_request
+    def iniciar_cronometro():
+        g.inicio_pedido = time.perf_counter()
+
+    @app.after_request
+    def registar_duracao(resposta):
+        # Nos streams (/stream) mede só até ao envio dos cabeçalhos
+        rota = request.url_rule.rule if request.url_rule else "desconhecida"
+        DURACAO_PEDIDO.com(rota).observar(time.perf_counter() - g.inicio_pedido)
+        return resposta
+
+    if contador is not None:
+        app.register_blueprint(criar_rotas(contador))
+    for linha, contador_linha in (linhas or {}).items():
+        app.register_blueprint(
+            criar_rotas(contador_linha, f"linha_{linha}"), url_prefix=f"/linha/{linha}"
+        )
+
+    if linhas:
+
+        @app.route("/linhas", methods=["GET"])
+        def listar_linhas():
+            """Resumo do estado de cada linha"""
+            data = []
+            for linha, contador_linha in linhas.items():
+                snapshot = contador_linha.snapshot
+                data.append(
+                    {
+                        "Linha": linha,
+                        "Ordem": snapshot.ordem,
+                        "Artigo": snapshot.artigo,
+                        "ContagemAtual": snapshot.contagem_atual,
+                        "ContagemTotal": snapshot.contagem_total,
+                        "TaxaInstantanea": snapshot.taxa_instantanea,
+                        "EmParagem": snapshot.em_paragem,
+                        "EstadoPorta": snapshot.porta_gpio,
+                        "EstadoContador": snapshot.estado,
+                        "EstadoConfiguracao": snapshot.configurado,
+                    }
+                )
+            return jsonify({"data": data}), 200
+
+    if turnos is not None:
+
+        @app.route("/turnos", methods=["GET", "PUT"])
+        def calendario_turnos():
+            """Calendário de turnos e próximos eventos; PUT substitui o calendário"""
+            if request.method == "PUT":
+                try:
+                    turnos.definir_calendario(request.get_json(force=True, silent=True))
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+            return jsonify({"data": turnos.estado()}), 200
+
+    @app.route("/ready", methods=["GET"])
+    def ready():
+        """Prontidão do serviço: 200 com a contagem e a API a funcionar, 503 antes"""
+        contadores = ([contador] if contador is not None else []) + list((linhas or {}).values())
+        contagem = bool(contadores) and all(c.ativo for c in contadores)
+        data = {
+            **arranque.estado(),
+            "Contagem": contagem,
+            "BaseDados": "bd" in arranque.marcos,
+        }
+        return jsonify({"data": data}), 200 if contagem and arranque.pronto else 503
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
 
     @app.errorhandler(404)
     def not_found(e):
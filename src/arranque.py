@@ -0,0 +1,54 @@
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict
+
+INICIO = time.monotonic()  # Importado logo no início do main.py
+
+
+def sd_notify(*linhas: str) -> bool:
+    """Envia linhas de estado ao systemd (READY=1, STATUS=...)
+
+    Só com Type=notify: sem NOTIFY_SOCKET no ambiente não faz nada.
+    """
+    endereco = os.getenv("NOTIFY_SOCKET")
+    if not endereco:
+        return False
+    if endereco.startswith("@"):  # Socket no namespace abstrato
+        endereco = "\0" + endereco[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(endereco)
+            sock.sendall("\n".join(linhas).encode())
+        return True
+    except OSError as e:
+        logging.error(f"Erro ao notificar o systemd: {e}")
+        return False
+
+
+class Arranque:
+    """Marcos do arranque do serviço, em segundos desde o início do main.py
+
+    "contagem": os contadores estão a contar (ou prontos para contar);
+    "api": o servidor HTTP está a aceitar ligações; "bd": as conexões à
+    base de dados foram abertas. O serviço está pronto com "api", porque a
+    contagem arranca antes da API e não precisa da base de dados.
+    """
+
+    def __init__(self):
+        self.marcos: Dict[str, float] = {}
+
+    def marcar(self, marco: str):
+        self.marcos[marco] = round(time.monotonic() - INICIO, 3)
+        logging.info(f"Arranque: {marco} aos {self.marcos[marco]:.3f} s")
+
+    @property
+    def pronto(self) -> bool:
+        return "api" in self.marcos
+
+    def estado(self) -> Dict[str, Any]:
+        return {"Pronto": self.pronto, "Marcos": dict(self.marcos)}
+
+
+arranque = Arranque()
@@ -0,0 +1,134 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+_MAGIA = b"KBAT"
+_CABECALHO = struct.Struct("<4sIQd")  # magia, número de slots, pid, arranque (monotonic)
+_TAMANHO_CABECALHO = 64
+_SLOT = struct.Struct("<40sddQ")  # nome, último batimento, prazo, batimentos
+_INSTANTE = 40  # Deslocamento do instante e do prazo dentro do slot
+_LIVRE = 0.0  # Prazo de um slot livre
+EM_ESPERA = float("inf")  # Prazo de um loop parado de propósito (sem trabalho)
+
+
+class Batimento:
+    """Batimento de um loop: o instante da última iteração e o prazo para a próxima
+
+    Sem ficheiro aberto (benchmarks, processo de contagem) não faz nada.
+    """
+
+    INTERVALO_ESCRITA = 0.1  # Segundos mínimos entre escritas (loops muito rápidos)
+
+    def __init__(self, mm: Optional[mmap.mmap], inicio: int, prazo: float):
+        self._mm = mm
+        self._inicio = inicio
+        self.prazo = prazo
+        self._batidas = 0
+        self._ultimo = float("-inf")
+
+    def bater(self, agora: Optional[float] = None):
+        """Marca uma iteração (`agora` em monotonic, se quem chama já o tiver)"""
+        if self._mm is None:
+            return
+        agora = time.monotonic() if agora is None else agora
+        if agora - self._ultimo < self.INTERVALO_ESCRITA:
+            return
+        self._ultimo = agora
+        self._batidas += 1
+        struct.pack_into(
+            "<ddQ", self._mm, self._inicio + _INSTANTE, agora, self.prazo, self._batidas
+        )
+
+    def em_espera(self):
+        """O loop vai ficar parado sem prazo (por exemplo, sem nada armado)"""
+        if self._mm is not None:
+            self._ultimo = float("-inf")
+            struct.pack_into("<dd", self._mm, self._inicio + _INSTANTE, time.monotonic(), EM_ESPERA)
+
+    def terminar(self):
+        """O loop terminou: liberta o slot"""
+        if self._mm is not None:
+            struct.pack_into("<dd", self._mm, self._inicio + _INSTANTE, time.monotonic(), _LIVRE)
+            self._mm = None
+
+
+class RegistoBatimentos:
+    """Batimentos dos loops do serviço num ficheiro partilhado (mmap)
+
+    Cada loop periódico escreve num slot fixo o instante (CLOCK_MONOTONIC,
+    comum a todos os processos) da última iteração e o prazo até à
+    próxima. O ServiceWatchdog, noutro processo, lê o ficheiro sem chamar o
+    serviço e deteta um loop encravado mesmo com a unidade "active".
+    """
+
+    def __init__(self):
+        self._mm: Optional[mmap.mmap] = None
+        self._slots = 0
+        self._lock = threading.Lock()
+
+    def abrir(self, caminho: Path, slots: int = 64):
+        """Cria o ficheiro dos batimentos deste processo"""
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        tamanho = _TAMANHO_CABECALHO + slots * _SLOT.size
+        fd = os.open(caminho, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, tamanho)
+            mm = mmap.mmap(fd, tamanho)
+        finally:
+            os.close(fd)
+        _CABECALHO.pack_into(mm, 0, _MAGIA, slots, os.getpid(), time.monotonic())
+        with self._lock:
+            self._mm, self._slots = mm, slots
+        logging.info(f"Batimentos dos loops em {caminho}")
+
+    def registar(self, nome: str, prazo: float) -> Batimento:
+        """Slot para um loop que tem de bater pelo menos a cada `prazo` segundos"""
+        with self._lock:
+            if self._mm is None:
+                return Batimento(None, 0, prazo)
+            slot = self._slot_livre()
+            if slot is None:
+                logging.error(f"Sem slots de batimento para o loop {nome}")
+                return Batimento(None, 0, prazo)
+            inicio = _TAMANHO_CABECALHO + slot * _SLOT.size
+            _SLOT.pack_into(self._mm, inicio, nome.encode()[:40], time.monotonic(), prazo, 0)
+            return Batimento(self._mm, inicio, prazo)
+
+    def _slot_livre(self) -> Optional[int]:
+        for slot in range(self._slots):
+            if _SLOT.unpack_from(self._mm, _TAMANHO_CABECALHO + slot * _SLOT.size)[2] == _LIVRE:
+                return slot
+        return None
+
+
+def ler_batimentos(caminho: Path) -> Optional[Tuple[int, float, List[Tuple[str, float, float, int]]]]:
+    """(pid, arranque, [(nome, último batimento, prazo, batimentos)]) dos slots ocupados
+
+    None se o ficheiro não existir ou não for um ficheiro de batimentos.
+    """
+    try:
+        with open(caminho, "rb") as ficheiro:
+            dados = ficheiro.read()
+    except OSError:
+        return None
+    if len(dados) < _TAMANHO_CABECALHO:
+        return None
+    magia, slots, pid, arranque = _CABECALHO.unpack_from(dados, 0)
+    if magia != _MAGIA:
+        return None
+    loops = []
+    for slot in range(min(slots, (len(dados) - _TAMANHO_CABECALHO) // _SLOT.size)):
+        nome, instante, prazo, batidas = _SLOT.unpack_from(
+            dados, _TAMANHO_CABECALHO + slot * _SLOT.size
+        )
+        if prazo != _LIVRE:
+            loops.append((nome.rstrip(b"\0").decode(errors="replace"), instante, prazo, batidas))
+    return pid, arranque, loops
+
+
+batimentos = RegistoBatimentos()
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class CacheTTL:
+    """Cache em memória com validade (TTL) e despejo do menos usado (LRU)
+
+    Cada entrada expira `ttl` segundos depois de guardada; com `capacidade`
+    entradas, guardar uma nova despeja a usada há mais tempo. Em
+    `obter_ou_carregar`, pedidos simultâneos pela mesma chave em falta fazem
+    uma só chamada a `carregar`: os restantes esperam pelo resultado.
+    Os valores `None` não são guardados.
+    """
+
+    def __init__(self, nome: str, capacidade: int = 256, ttl: float = 3600):
+        self.nome = nome
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._dados: "OrderedDict[Hashable, tuple]" = OrderedDict()  # chave -> (expira, valor)
+        self._lock = threading.Lock()
+        self._a_carregar: Dict[Hashable, threading.Event] = {}
+        self.acertos = 0
+        self.falhas = 0
+        self.expirados = 0
+        self.despejados = 0
+
+    def __len__(self) -> int:
+        return len(self._dados)
+
+    def _ler(self, chave: Hashable, agora: float):
+        """Valor em cache ou None (chamado com o lock)"""
+        entrada = self._dados.get(chave)
+        if entrada is None:
+            return None
+        expira, valor = entrada
+        if agora >= expira:
+            del self._dados[chave]
+            self.expirados += 1
+            return None
+        self._dados.move_to_end(chave)
+        return valor
+
+    def obter(self, chave: Hashable) -> Optional[Any]:
+        with self._lock:
+            valor = self._ler(chave, time.monotonic())
+            if valor is None:
+                self.falhas += 1
+            else:
+                self.acertos += 1
+            return valor
+
+    def guardar(self, chave: Hashable, valor: Any, ttl: Optional[float] = None):
+        if valor is None:
+            return
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._dados[chave] = (expira, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.capacidade:
+                self._dados.popitem(last=False)
+                self.despejados += 1
+
+    def obter_ou_carregar(self, chave: Hashable, carregar: Callable[[], Any]) -> Optional[Any]:
+        """Valor em cache, ou o resultado de `carregar()` (guardado se não for None)"""
+        while True:
+            with self._lock:
+                valor = self._ler(chave, time.monotonic())
+                if valor is not None:
+                    self.acertos += 1
+                    return valor
+                espera = self._a_carregar.get(chave)
+                if espera is None:
+                    self.falhas += 1
+                    espera = self._a_carregar[chave] = threading.Event()
+                    break
+            espera.wait()  # Outra thread está a carregar esta chave
+
+        try:
+            valor = carregar()
+            self.guardar(chave, valor)
+            return valor
+        finally:
+            with self._lock:
+                del self._a_carregar[chave]
+            espera.set()
+
+    def invalidar(self, chave: Optional[Hashable] = None):
+        """Esquece uma entrada, ou todas sem `chave`"""
+        with self._lock:
+            if chave is None:
+                self._dados.clear()
+            else:
+                self._dados.pop(chave, None)
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "entradas": len(self._dados),
+            "capacidade": self.capacidade,
+            "ttl": self.ttl,
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "expirados": self.expirados,
+            "despejados": self.despejados,
+        }
@@ -0,0 +1,94 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+_CABECALHO = struct.Struct("<QII")  # sequência, crc32, tamanho dos dados
+_SLOT = 4096
+
+
+class CheckpointEstado:
+    """Checkpoint do estado do contador num ficheiro mapeado em memória
+
+    O ficheiro tem dois slots de 4 KiB. Cada gravação escreve o slot que não
+    tem o checkpoint mais recente, com um número de sequência e o crc32 dos
+    dados: se o processo morrer a meio da escrita, o slot incompleto falha o
+    crc e `ler` devolve o outro. Gravar é uma cópia para memória; o flush
+    para o disco (que só importa numa falha de energia) é feito no máximo a
+    cada `intervalo_sync` segundos, ou quando pedido.
+    """
+
+    def __init__(self, caminho: Path, intervalo_sync: float = 10):
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        self.caminho = Path(caminho)
+        self.intervalo_sync = intervalo_sync
+        fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < 2 * _SLOT:
+                os.ftruncate(fd, 2 * _SLOT)
+            self._mm = mmap.mmap(fd, 2 * _SLOT)
+        finally:
+            os.close(fd)
+        self._ultimo = b""
+        self._ultimo_sync = time.monotonic()
+        self._seq, slot = self._mais_recente()
+        self._slot = 0 if slot is None else slot
+
+    def _slot_valido(self, slot: int) -> Optional[tuple]:
+        """(sequência, dados) de um slot, ou None se estiver vazio ou corrompido"""
+        inicio = slot * _SLOT
+        seq, crc, tamanho = _CABECALHO.unpack_from(self._mm, inicio)
+        if not seq or tamanho > _SLOT - _CABECALHO.size:
+            return None
+        dados = self._mm[inicio + _CABECALHO.size : inicio + _CABECALHO.size + tamanho]
+        if zlib.crc32(struct.pack("<QI", seq, tamanho) + dados) != crc:
+            return None
+        return seq, dados
+
+    def _mais_recente(self):
+        """(sequência, slot) do checkpoint válido mais recente"""
+        melhor = (0, None)
+        for slot in (0, 1):
+            valido = self._slot_valido(slot)
+            if valido and valido[0] > melhor[0]:
+                melhor = (valido[0], slot)
+        return melhor
+
+    def ler(self) -> Optional[Dict[str, Any]]:
+        """Último checkpoint válido, ou None"""
+        seq, slot = self._mais_recente()
+        if slot is None:
+            return None
+        try:
+            return json.loads(self._slot_valido(slot)[1])
+        except ValueError as e:
+            logging.error(f"Checkpoint ilegível: {e}")
+            return None
+
+    def guardar(self, estado: Dict[str, Any], sincronizar: bool = False):
+        """Grava o estado no outro slot (não faz nada se não mudou)"""
+        dados = json.dumps(estado, separators=(",", ":")).encode()
+        if dados != self._ultimo:
+            if len(dados) > _SLOT - _CABECALHO.size:
+                logging.error(f"Checkpoint com {len(dados)} bytes não cabe no slot")
+                return
+            self._seq += 1
+            self._slot ^= 1
+            inicio = self._slot * _SLOT
+            crc = zlib.crc32(struct.pack("<QI", self._seq, len(dados)) + dados)
+            self._mm[inicio + _CABECALHO.size : inicio + _CABECALHO.size + len(dados)] = dados
+            _CABECALHO.pack_into(self._mm, inicio, self._seq, crc, len(dados))
+            self._ultimo = dados
+        agora = time.monotonic()
+        if sincronizar or agora - self._ultimo_sync >= self.intervalo_sync:
+            self._mm.flush()
+            self._ultimo_sync = agora
+
+    def fechar(self):
+        self._mm.flush()
+        self._mm.close()
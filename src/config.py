@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from pathlib import Path
+from typing import List
 import os
 from dotenv import load_dotenv
 
@@ -11,6 +12,8 @@ class DatabaseConfig:
     user: str = ""
     password: str = ""
     port: int = 1433  # Porta padrão do MySQL
+    login_timeout: int = int(os.getenv('DB_LOGIN_TIMEOUT', 10))  # segundos para abrir uma conexão
+    timeout: int = int(os.getenv('DB_TIMEOUT', 30))  # segundos por consulta
 
 @dataclass
 class AppConfig:
@@ -21,13 +24,147 @@ class AppConfig:
     log_path: Path = base_path / 'logs' / 'app.log'
     cert_path: Path = base_path / 'certs' / 'CERT.crt'
     key_path: Path = base_path / 'certs' / 'CERT.key'
+    stream_intervalo: float = float(os.getenv('STREAM_INTERVALO', 0.25))  # coalescência do /stream
+    server_mode: str = os.getenv('SERVER_MODE', 'producao')  # 'producao' ou 'dev' (servidor do Flask)
+    server_threads: int = int(os.getenv('SERVER_THREADS', 32))
+    # Cada cliente do /stream ocupa uma thread do pool enquanto estiver ligado:
+    # acima deste limite (sempre abaixo de SERVER_THREADS) recebe 503
+    stream_max_clientes: int = int(os.getenv('STREAM_MAX_CLIENTES', 8))
+    server_fila: int = int(os.getenv('SERVER_FILA', 128))  # ligações à espera de uma thread
+    server_timeout: float = float(os.getenv('SERVER_TIMEOUT', 10))  # segundos sem pedidos numa ligação
+    tls_tickets: int = int(os.getenv('TLS_TICKETS', 2))
+
+@dataclass
+class LogConfig:
+    formato: str = os.getenv('LOG_FORMATO', 'texto')  # 'texto' ou 'json' (um objeto por linha)
+    tamanho: int = int(os.getenv('LOG_TAMANHO', 5 * 1024 * 1024))  # bytes por ficheiro antes de rodar
+    ficheiros: int = int(os.getenv('LOG_FICHEIROS', 5))  # ficheiros antigos mantidos
+    capacidade_fila: int = int(os.getenv('LOG_FILA', 10000))  # registos à espera de escrita
+    janela_repeticoes: float = float(os.getenv('LOG_REPETICOES', 60))  # segundos; 0 = sem limite
 
 @dataclass
 class GPIOConfig:
     counter_pin: int = int(os.getenv('COUNTER_PIN', 22))
     door_pin: int = int(os.getenv('DOOR_PIN', 23))
+    counter_mode: str = os.getenv('COUNTER_MODE', 'eventos')  # 'eventos', 'polling' ou 'processo'
+    driver: str = os.getenv('GPIO_DRIVER', 'rpi')  # 'rpi', 'gpiod' ou 'sim'
+    chip: str = os.getenv('GPIO_CHIP', '/dev/gpiochip0')  # chip do driver gpiod
+    # Filtro de ressaltos, desligado com os três a 0 (conta cada flanco ascendente)
+    debounce_largura: float = float(os.getenv('DEBOUNCE_LARGURA', 0))  # largura mínima do pulso (s)
+    debounce_intervalo: float = float(os.getenv('DEBOUNCE_INTERVALO', 0))  # intervalo mínimo entre pulsos (s)
+    debounce_fracao: float = float(os.getenv('DEBOUNCE_FRACAO', 0))  # do intervalo nominal do artigo
+
+@dataclass
+class CacheConfig:
+    ttl: float = float(os.getenv('CACHE_TTL', 3600))  # segundos de validade de ordens e artigos
+    capacidade: int = int(os.getenv('CACHE_CAPACIDADE', 512))  # entradas por cache (LRU)
+    prefetch: float = float(os.getenv('CACHE_PREFETCH', 0))  # segundos entre pré-carregamentos; 0 = desligado
+    prefetch_ordens: int = int(os.getenv('CACHE_PREFETCH_ORDENS', 200))  # máximo de ordens do dia pré-carregadas
+
+@dataclass
+class ProcessoConfig:
+    # Com COUNTER_MODE=processo a contagem corre num processo à parte
+    modo: str = os.getenv('PROCESSO_MODO', 'eventos')  # contagem dentro do processo: 'eventos' ou 'polling'
+    cpu: int = int(os.getenv('PROCESSO_CPU', -1))  # núcleo fixo; -1 = sem afinidade
+    prioridade: int = int(os.getenv('PROCESSO_FIFO', 0))  # prioridade SCHED_FIFO (1-99); 0 = normal
+    nice: int = int(os.getenv('PROCESSO_NICE', 0))  # usado sem SCHED_FIFO
+    capacidade: int = int(os.getenv('PROCESSO_CAPACIDADE', 4096))  # instantes no bloco partilhado
+    leitura: float = float(os.getenv('PROCESSO_LEITURA', 0.005))  # segundos entre leituras do bloco
+
+@dataclass
+class LinhaConfig:
+    id: str
+    counter_pin: int
+    door_pin: int
+
+def carregar_linhas(valor: str = os.getenv('LINHAS', '')) -> List[LinhaConfig]:
+    """Linhas do modo multi-linha, de LINHAS="<id>:<pino contador>:<pino porta>,..."
+
+    Sem LINHAS o processo gere uma só linha, com COUNTER_PIN e DOOR_PIN.
+    """
+    linhas = []
+    for item in filter(None, (parte.strip() for parte in valor.split(','))):
+        try:
+            id_linha, counter_pin, door_pin = item.split(':')
+            id_linha = id_linha.strip()
+            if not id_linha.replace('-', '').replace('_', '').isalnum():
+                raise ValueError  # O id vai para as rotas (/linha/<id>)
+            linhas.append(LinhaConfig(id_linha, int(counter_pin), int(door_pin)))
+        except ValueError:
+            raise ValueError(f"Linha mal definida em LINHAS: {item!r} (esperado id:contador:porta)")
+    ids = [linha.id for linha in linhas]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Ids de linha repetidos em LINHAS: {valor}")
+    return linhas
+
+@dataclass
+class SimuladorConfig:
+    taxa: float = float(os.getenv('SIM_TAXA', 6000))  # garrafas/hora
+    largura: float = float(os.getenv('SIM_LARGURA', 0.02))  # largura do pulso em segundos
+    jitter: float = float(os.getenv('SIM_JITTER', 0.1))  # fração do intervalo nominal
+    paragem_intervalo: float = float(os.getenv('SIM_PARAGEM_INTERVALO', 0))  # 0 = sem paragens
+    paragem_duracao: float = float(os.getenv('SIM_PARAGEM_DURACAO', 0))
+    ressalto: float = float(os.getenv('SIM_RESSALTO', 0))  # fração de pulsos com ressalto
+
+@dataclass
+class PersistenciaConfig:
+    capacidade_fila: int = int(os.getenv('FILA_CAPACIDADE', 1000))  # amostras em memória
+    tamanho_lote: int = min(int(os.getenv('FILA_LOTE', 50)), 1000)  # linhas por INSERT (máx. 1000)
+    politica: str = os.getenv('FILA_POLITICA', 'descartar_antigas')  # ou 'descartar_novas', 'bloquear'
+    journal_path: Path = Path(os.getenv('JOURNAL_PATH', AppConfig.base_path / 'dados' / 'journal.db'))
+    journal_sync: str = os.getenv('JOURNAL_SYNC', 'FULL')  # PRAGMA synchronous do SQLite
+
+@dataclass
+class SeriesConfig:
+    retencao: int = int(os.getenv('SERIES_RETENCAO', 8640))  # pontos em memória (24h a cada 10s)
+    diretorio: Path = Path(os.getenv('SERIES_DIR', AppConfig.base_path / 'dados' / 'series'))
+    passagens: int = int(os.getenv('PASSAGENS_CAPACIDADE', 8192))  # instantes de garrafas em memória
+
+@dataclass
+class CheckpointConfig:
+    ativo: bool = os.getenv('CHECKPOINT', 'true').lower() == 'true'
+    diretorio: Path = Path(os.getenv('CHECKPOINT_DIR', AppConfig.base_path / 'dados' / 'checkpoint'))
+    sync: float = float(os.getenv('CHECKPOINT_SYNC', 10))  # segundos máximos entre flushes para o disco
+
+@dataclass
+class WatchdogConfig:
+    # Ficheiro partilhado com os batimentos dos loops (em memória se houver /dev/shm)
+    batimentos: Path = Path(os.getenv(
+        'BATIMENTOS_PATH',
+        '/dev/shm/krones-counter.batimentos' if os.path.isdir('/dev/shm')
+        else AppConfig.base_path / 'dados' / 'batimentos.bin',
+    ))
+    intervalo: float = float(os.getenv('WATCHDOG_INTERVALO', 5))  # segundos entre verificações dos batimentos
+    amostragem: float = float(os.getenv('WATCHDOG_AMOSTRAGEM', 30))  # segundos entre amostras de /proc
+    janela: int = int(os.getenv('WATCHDOG_JANELA', 10))  # amostras para uma tendência sustentada
+    confirmacoes: int = int(os.getenv('WATCHDOG_CONFIRMACOES', 2))  # verificações seguidas com um loop encravado
+    carencia: float = float(os.getenv('WATCHDOG_CARENCIA', 60))  # segundos sem decisões depois de um (re)arranque
+    cpu_limite: float = float(os.getenv('WATCHDOG_CPU', 90))  # % de CPU do sistema
+    memoria_minima: float = float(os.getenv('WATCHDOG_MEMORIA', 50))  # MB disponíveis
+    horizonte: float = float(os.getenv('WATCHDOG_HORIZONTE', 600))  # segundos até esgotar a memória
+
+@dataclass
+class ParagensConfig:
+    fator: float = float(os.getenv('PARAGEM_FATOR', 5))  # intervalos nominais sem garrafas
+    minimo: float = float(os.getenv('PARAGEM_MINIMO', 2))  # segundos
+    auto_pausa: float = float(os.getenv('PARAGEM_AUTO_PAUSA', 0))  # segundos de paragem; 0 = desligado
+
+@dataclass
+class TurnosConfig:
+    ativo: bool = os.getenv('TURNOS', 'true').lower() == 'true'  # pausas e retomas do calendário
+    caminho: Path = Path(os.getenv('TURNOS_PATH', AppConfig.base_path / 'dados' / 'turnos.json'))
 
 # Instâncias das configurações
 db_config = DatabaseConfig()
 app_config = AppConfig()
-gpio_config = GPIOConfig() 
\ No newline at end of file
+log_config = LogConfig()
+gpio_config = GPIOConfig()
+simulador_config = SimuladorConfig()
+processo_config = ProcessoConfig()
+cache_config = CacheConfig()
+persistencia_config = PersistenciaConfig()
+series_config = SeriesConfig()
+checkpoint_config = CheckpointConfig()
+watchdog_config = WatchdogConfig()
+paragens_config = ParagensConfig()
+turnos_config = TurnosConfig()
\ No newline at end of file
@@ -1,13 +1,90 @@
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from datetime import datetime, time as datetime_time
-from typing import List, Optional, Dict, Any
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any
 import threading
 import logging
-import numpy as np
+import weakref
+from .checkpoint import CheckpointEstado
 from .gpio_handler import GPIOHandler
 from .database import DatabaseManager
+from .contagem_backend import CicloPolling, criar_backend
+from .persistencia import EscritorContagens
+from .journal import JournalLocal
+from .series import SerieTemporal, criar_series_estatisticas, formatar_tempo
+from .estatisticas import LIMITES_INTERVALOS, EstatisticasGFA, RegistoPassagens
+from .eventos import Difusor
+from .metricas import MetricaLoop, metricas
+from .paragens import DetetorParagens, formatar_registo
+from .config import (
+    gpio_config,
+    paragens_config,
+    persistencia_config,
+    series_config,
+    turnos_config,
+)
+from .turnos import AgendadorTurnos, Pausa
 import time
-import pymssql
+
+LINHA_UNICA = "1"  # Id da linha quando o processo só gere uma
+
+GARRAFAS = metricas.contador("contador_garrafas_total", "Garrafas contadas", ("linha",))
+INTERVALO_GARRAFAS = metricas.histograma(
+    "contador_intervalo_garrafas_segundos",
+    "Intervalo entre garrafas consecutivas",
+    ("linha",),
+    LIMITES_INTERVALOS,
+)
+
+# Contadores vivos, por id de linha, para as métricas com a etiqueta "linha"
+_CONTADORES = weakref.WeakValueDictionary()
+metricas.medidor(
+    "contador_estado",
+    "Estado do contador (0 parado, 1 contagem, 2 pausa)",
+    lambda: {linha: c.snapshot.estado for linha, c in list(_CONTADORES.items())},
+    ("linha",),
+)
+metricas.medidor(
+    "stream_clientes",
+    "Clientes ligados ao /stream",
+    lambda: {linha: c.eventos.clientes for linha, c in list(_CONTADORES.items())},
+    ("linha",),
+)
+
+
+def _escritores():
+    """Escritores das linhas vivas (um escritor partilhado conta uma vez)"""
+    return list({id(c.escritor): c.escritor for c in list(_CONTADORES.values())}.values())
+
+
+# A fila de gravação e o journal são do processo: um valor só, somado sobre
+# os escritores (um por linha, ou um partilhado pelo GestorLinhas)
+metricas.medidor(
+    "persistencia_fila_profundidade",
+    "Amostras à espera de gravação",
+    lambda: sum(escritor.profundidade for escritor in _escritores()),
+)
+metricas.medidor(
+    "persistencia_journal_pendentes",
+    "Registos do journal local ainda por enviar",
+    lambda: sum(e.journal.total_pendentes() for e in _escritores() if e.journal is not None),
+)
+metricas.medidor(
+    "persistencia_amostras_total",
+    "Amostras por resultado da gravação",
+    lambda: {
+        resultado: sum(getattr(escritor, atributo) for escritor in _escritores())
+        for resultado, atributo in (
+            ("gravadas", "amostras_gravadas"),
+            ("reenviadas", "reenviadas"),
+            ("descartadas", "descartadas"),
+        )
+    },
+    ("resultado",),
+    tipo="counter",
+)
+
 
 @dataclass
 class ContadorState:
@@ -28,288 +105,568 @@ class ContadorState:
     # Estatísticas
     tempo_inicio: Optional[datetime] = None
     tempo_fim: Optional[datetime] = None
-    estatistica_gfa: List[float] = field(default_factory=list)
-    estatistica_media: List[float] = field(default_factory=list)
     estatistica_nominal: float = 0
-    estatistica_tempo: List[str] = field(default_factory=list)
-    estatistica_cadencia: List[int] = field(default_factory=list)
-    paragens: List[str] = field(default_factory=list)
+    # Séries gfa, media, cadencia e paragem, com um instante epoch por ponto
+    series: SerieTemporal = field(
+        default_factory=lambda: criar_series_estatisticas(series_config.retencao)
+    )
+    # Agregados incrementais da GFA (média da ordem, janelas móveis, mín/máx)
+    estatisticas: EstatisticasGFA = field(default_factory=EstatisticasGFA)
+    # Instante de cada garrafa da ordem, para taxas exatas em qualquer janela
+    passagens: RegistoPassagens = field(
+        default_factory=lambda: RegistoPassagens(series_config.passagens)
+    )
     registo_paragem: int = 0
     pausa_automatica: bool = False  # Novo campo para controlar pausas automáticas
 
 
+@dataclass(frozen=True)
+class ContadorSnapshot:
+    """Vista imutável e coerente do estado, publicada a cada alteração
+
+    As garrafas contadas entram no snapshot seguinte, no máximo
+    `Contador.INTERVALO_SNAPSHOT` segundos depois (ou no tick de estatísticas).
+
+    Os leitores (API, stream) leem todos os campos do mesmo snapshot em vez
+    de `contador.state`, que pode estar a meio de uma alteração. As séries
+    continuam a ser o objeto partilhado: `seq` é o número de pontos que
+    existiam quando o snapshot foi criado e deve ser usado como `ate` nas
+    vistas, para que os pontos mais recentes não entrem na resposta. O mesmo
+    para as passagens, com `passagens_total`.
+    """
+
+    versao: int
+    artigo: str
+    descricao_artigo: str
+    cadencia_artigo: int
+    contagem_atual: int
+    contagem_total: int
+    quebras: int
+    estado: int
+    porta_estado: int
+    porta_gpio: int  # Estado lido do pino da porta
+    ordem: str
+    configurado: bool
+    id_ordem: int
+    tempo_inicio: Optional[datetime]
+    tempo_fim: Optional[datetime]
+    estatistica_nominal: float
+    media_ordem: int
+    taxa_instantanea: int  # Garrafas/hora pelos últimos intervalos entre garrafas
+    taxa_minuto: int  # Garrafas/hora no último minuto
+    em_paragem: bool
+    num_paragens: int
+    tempo_parado: float  # Segundos em paragens detetadas na ordem
+    ressaltos: int  # Pulsos rejeitados pelo filtro de ressaltos
+    gfa: int
+    media: int
+    resumo: Dict[str, Any]
+    series: SerieTemporal
+    seq: int
+    passagens: RegistoPassagens
+    passagens_total: int
+
+
 class Contador:
-    def __init__(self, gpio_handler: GPIOHandler, db_manager: DatabaseManager):
+    # Com garrafas a chegar, o snapshot é refeito no máximo a este intervalo (s)
+    INTERVALO_SNAPSHOT = 0.1
+
+    def __init__(
+        self,
+        gpio_handler: GPIOHandler,
+        db_manager: DatabaseManager,
+        modo_contagem: Optional[str] = None,
+        escritor: Optional[EscritorContagens] = None,
+        linha: Optional[str] = None,
+        ciclo_polling: Optional[CicloPolling] = None,
+        diretorio_series: Optional[Path] = None,
+        checkpoint: Optional[CheckpointEstado] = None,
+    ):
+        """`linha` só é dado no modo multi-linha (ver GestorLinhas)
+
+        Com um `checkpoint`, o estado da ordem é guardado com cada snapshot
+        das garrafas contadas e, sincronizado no disco, a cada transição;
+        `start` retoma a ordem que lá estiver.
+        """
         self.state = ContadorState()
         self.gpio = gpio_handler
         self.db = db_manager
+        self.linha = linha
+        self.id_linha = linha or LINHA_UNICA
+        self.diretorio_series = diretorio_series or series_config.diretorio
+        self.checkpoint = checkpoint
+        self._escritor_proprio = escritor is None
+        self.escritor = escritor or EscritorContagens(
+            db_manager,
+            capacidade=persistencia_config.capacidade_fila,
+            lote=persistencia_config.tamanho_lote,
+            politica=persistencia_config.politica,
+            journal=JournalLocal(
+                persistencia_config.journal_path, persistencia_config.journal_sync
+            ),
+        )
         self._running = False
         self._threads = []
-        self._last_count = 0
-        self._last_time = time.time()
-        self._threads = []
-
-    def start(self):
-        """Inicia todas as threads do contador"""
+        self._a_parar = False
+        self.eventos = Difusor()
+        self._backend = criar_backend(
+            modo_contagem or gpio_config.counter_mode, self, ciclo_polling
+        )
+        self._backend.configurar(self.state.cadencia_artigo)
+        self.paragens = DetetorParagens(
+            self._paragem_iniciada,
+            self._paragem_terminada,
+            self._paragem_prolongada,
+            fator=paragens_config.fator,
+            minimo=paragens_config.minimo,
+            limite_pausa=paragens_config.auto_pausa,
+        )
+        self._pausado_por_paragem = False
+        self._pausado_por_horario = False  # Pausa do calendário de turnos (retoma no fim)
+        self.turnos: Optional[AgendadorTurnos] = None
+        # Todas as alterações do estado, incluindo as contagens, são feitas
+        # sob este lock; os leitores usam o snapshot e nunca esperam por ele.
+        self._lock_estado = threading.RLock()
+        self._versao = 0
+        self._ultimo_snapshot = 0.0
+        self._snapshot = self._criar_snapshot()
+        self._garrafas = GARRAFAS.com(self.id_linha)
+        self._intervalos = INTERVALO_GARRAFAS.com(self.id_linha)
+        self._ultima_gravacao = time.time()
+        self._ultimo_ponto = time.monotonic()
+        # As métricas do módulo leem o contador por aqui, sem o manter vivo
+        _CONTADORES[self.id_linha] = self
+
+    def start(self, loops: bool = True):
+        """Inicia todas as threads do contador
+
+        Com `loops=False` o loop de estatísticas e o calendário de turnos
+        não têm threads próprias: o GestorLinhas chama `tick_estatisticas` e
+        `evento_turno` de todas as linhas a partir das suas.
+        """
         if not self._running:
             self._running = True
-            self._threads = [
-                threading.Thread(target=self._contagem_loop, daemon=True),
-                threading.Thread(target=self._stats_loop, daemon=True),
-                threading.Thread(target=self._schedule_pause_loop, daemon=True)
-                # threading.Thread(target=self._auto_pause_loop, daemon=True),
-            ]
+            self.escritor.start()
+            self._backend.start()
+            self.paragens.start()
+            self._ultima_gravacao = time.time()
+            self._ultimo_ponto = time.monotonic()
+            if self.checkpoint is not None:
+                self._restaurar_checkpoint()
+            self._threads = []
+            if loops:
+                self._threads = [threading.Thread(target=self._stats_loop, daemon=True)]
+                if turnos_config.ativo:
+                    self.turnos = AgendadorTurnos(self.evento_turno, turnos_config.caminho)
             for thread in self._threads:
                 logging.info(f"Iniciando thread: {thread.name}")
                 thread.start()
+            if self.turnos is not None:
+                self.turnos.start()
 
     def stop(self):
         """Para todas as threads de forma segura"""
         self._running = False
+        self._backend.stop()
+        self.paragens.stop()
+        if self.turnos is not None:
+            self.turnos.stop()
         for thread in self._threads:
             thread.join()
+        if self._escritor_proprio:  # Um escritor partilhado é parado por quem o criou
+            self.escritor.stop()
+        if self.checkpoint is not None:
+            # Fica com a ordem em curso: o próximo arranque retoma-a
+            self._guardar_checkpoint(sincronizar=True)
+            self.checkpoint.fechar()
+            self.checkpoint = None
         self.gpio.cleanup()
 
+    @property
+    def ativo(self) -> bool:
+        """As threads do contador estão a correr"""
+        return self._running
+
+    @property
+    def snapshot(self) -> ContadorSnapshot:
+        """Último snapshot publicado (leitura sem locks)"""
+        return self._snapshot
+
+    def _criar_snapshot(self) -> ContadorSnapshot:
+        estado = self.state
+        estatisticas = estado.estatisticas
+        agora = time.monotonic()
+        self._versao += 1
+        return ContadorSnapshot(
+            versao=self._versao,
+            artigo=estado.artigo,
+            descricao_artigo=estado.descricao_artigo,
+            cadencia_artigo=estado.cadencia_artigo,
+            contagem_atual=estado.contagem_atual,
+            contagem_total=estado.contagem_total,
+            quebras=estado.quebras,
+            estado=estado.estado,
+            porta_estado=estado.porta_estado,
+            porta_gpio=self.gpio.door_state,
+            ordem=estado.ordem,
+            configurado=estado.configurado,
+            id_ordem=estado.id_ordem,
+            tempo_inicio=estado.tempo_inicio,
+            tempo_fim=estado.tempo_fim,
+            estatistica_nominal=estado.estatistica_nominal,
+            media_ordem=round(estatisticas.ordem.media) if estatisticas.ordem.contagem else 0,
+            taxa_instantanea=round(estado.passagens.taxa_instantanea(agora)),
+            taxa_minuto=round(estado.passagens.taxa(60, agora)),
+            em_paragem=self.paragens.em_paragem,
+            num_paragens=self.paragens.total,
+            tempo_parado=round(self.paragens.tempo_parado, 1),
+            ressaltos=self._backend.rejeitados,
+            gfa=estado.series.ultimo("gfa", 0),
+            media=estado.series.ultimo("media", 0),
+            resumo=estatisticas.resumo(),
+            series=estado.series,
+            seq=estado.series.total,
+            passagens=estado.passagens,
+            passagens_total=estado.passagens.total,
+        )
+
+    def _publicar_snapshot(self):
+        """Publica um snapshot novo (chamado com o lock)"""
+        self._snapshot = self._criar_snapshot()
+        self._ultimo_snapshot = time.monotonic()
+
+    def _publicar_contagem(self):
+        """Passa as garrafas contadas para o snapshot e o checkpoint (chamado com o lock)"""
+        self._publicar_snapshot()
+        self._guardar_checkpoint()
+
+    @contextmanager
+    def _alterar_estado(self):
+        """Altera o estado sob o lock e publica um snapshot novo no fim
+
+        O snapshot lido a seguir já inclui a alteração.
+        """
+        with self._lock_estado:
+            try:
+                yield self.state
+            finally:
+                self._publicar_snapshot()
+
     def get_status(self) -> Dict[str, Any]:
         """Retorna o estado atual do contador"""
+        snapshot = self._snapshot
         return {
-            "artigo": self.state.artigo,
-            "descricao": self.state.descricao_artigo,
-            "cadencia": self.state.cadencia_artigo,
-            "contagem": self.state.contagem_atual,
-            "total": self.state.contagem_total,
-            "quebras": self.state.quebras,
-            "estado": self.state.estado,
-            "porta": self.state.porta_estado,
-            "ordem": self.state.ordem,
-            "configurado": self.state.configurado,
+            "artigo": snapshot.artigo,
+            "descricao": snapshot.descricao_artigo,
+            "cadencia": snapshot.cadencia_artigo,
+            "contagem": snapshot.contagem_atual,
+            "total": snapshot.contagem_total,
+            "quebras": snapshot.quebras,
+            "estado": snapshot.estado,
+            "porta": snapshot.porta_estado,
+            "ordem": snapshot.ordem,
+            "configurado": snapshot.configurado,
             "estatisticas": {
-                "gfa": self.state.estatistica_gfa[-1]
-                if self.state.estatistica_gfa
-                else 0,
-                "media": self.state.estatistica_media[-1]
-                if self.state.estatistica_media
-                else 0,
-                "nominal": self.state.estatistica_nominal,
+                "gfa": snapshot.gfa,
+                "media": snapshot.media,
+                "nominal": snapshot.estatistica_nominal,
+                "taxa_instantanea": snapshot.taxa_instantanea,
+                "taxa_minuto": snapshot.taxa_minuto,
+                "em_paragem": snapshot.em_paragem,
+                "paragens": snapshot.num_paragens,
+                "tempo_parado": snapshot.tempo_parado,
+                "ressaltos": snapshot.ressaltos,
+                **snapshot.resumo,
             },
         }
 
     def iniciar_contagem(self):
         """Inicia a contagem"""
-        if not self.state.configurado:
-            raise ValueError("Contador não configurado")
-        self.state.estado = 1
-        self.state.tempo_inicio = datetime.now()
-        self.state.estatistica_gfa = []
-        self.state.estatistica_media = []
-        self.state.estatistica_tempo = []
-        self.state.paragens = []
-        self.gpio.set_door(True)
+        with self._alterar_estado() as estado:
+            if not estado.configurado:
+                raise ValueError("Contador não configurado")
+            estado.estado = 1
+            estado.tempo_inicio = datetime.now()
+            estado.series.fechar()
+            estado.series = criar_series_estatisticas(
+                series_config.retencao, self.diretorio_series, estado.ordem
+            )
+            estado.estatisticas = EstatisticasGFA()
+            estado.passagens = RegistoPassagens(series_config.passagens)
+            self._a_parar = False
+            self.paragens.limpar()
+            self.paragens.configurar(estado.cadencia_artigo)
+            # Arma antes de abrir a porta para não perder as primeiras garrafas
+            self._backend.armar()
+            self.set_porta(True)
+            self.paragens.armar(time.monotonic())
+        self._publicar_estado("iniciar")
 
     def parar_contagem(self):
         """Para a contagem"""
         try:
-            if self.state.estado != 0:  # Evita parar múltiplas vezes
-                self.state.estado = 0
-                self.state.configurado = 0
-                self.state.tempo_fim = datetime.now()
-                self.gpio.set_door(False)
-                self._gravar_dados_finais()
+            with self._alterar_estado() as estado:
+                if estado.estado == 0:  # Evita parar múltiplas vezes
+                    return
+                estado.estado = 0
+                estado.configurado = 0
+                estado.tempo_fim = datetime.now()
+                self._pausado_por_paragem = False
+                self._pausado_por_horario = False
+                self._backend.desarmar()
+                self.paragens.desarmar(time.monotonic())
+                self.set_porta(False)
+            self._publicar_estado("parar")
+            self._gravar_dados_finais()
         except Exception as e:
             logging.error(f"Erro ao parar contagem: {e}")
 
     def pausar_contagem(self):
         """Pausa a contagem"""
-        if self.state.estado == 1:
-            self.state.estado = 2
-            self.state.registo_paragem = 1
-            self.gpio.set_door(False)
+        with self._alterar_estado() as estado:
+            # Numa pausa por paragem a porta ficou aberta: pausar fecha-a
+            if estado.estado != 1 and not self._pausado_por_paragem:
+                return
+            estado.estado = 2
+            estado.registo_paragem = 1
+            self._pausado_por_paragem = False
+            self._backend.desarmar()
+            self.paragens.desarmar(time.monotonic())
+            self.set_porta(False)
+        self._publicar_estado("pausar")
 
     def retomar_contagem(self):
         """Retoma a contagem após pausa"""
-        if self.state.estado == 2:
-            self.state.estado = 1
-            self.state.pausa_automatica = False
-            self.gpio.set_door(True)
+        with self._alterar_estado() as estado:
+            if estado.estado != 2:
+                return
+            estado.estado = 1
+            estado.pausa_automatica = False
+            self._pausado_por_paragem = False
+            self._pausado_por_horario = False
+            self._backend.armar()
+            self.set_porta(True)
+            self.paragens.armar(time.monotonic())
+        self._publicar_estado("retomar")
 
     def configurar_ordem(self, dados: Dict[str, Any]):
         """Configura uma nova ordem de produção"""
-        self.state.artigo = dados["artigo"]
-        self.state.descricao_artigo = dados["descricao"]
-        self.state.cadencia_artigo = int(dados["cadencia"])
-        self.state.contagem_total = int(dados["total"])
-        self.state.ordem = dados["ordem"]
-        self.state.id_ordem = int(dados["id_ordem"])
-        self.state.configurado = True
-        self.state.contagem_atual = 0
-        self.state.quebras = 0
+        with self._alterar_estado() as estado:
+            estado.artigo = dados["artigo"]
+            estado.descricao_artigo = dados["descricao"]
+            estado.cadencia_artigo = int(dados["cadencia"])
+            self.paragens.configurar(estado.cadencia_artigo)
+            self._backend.configurar(estado.cadencia_artigo)
+            estado.contagem_total = int(dados["total"])
+            estado.ordem = dados["ordem"]
+            estado.id_ordem = int(dados["id_ordem"])
+            estado.configurado = True
+            estado.contagem_atual = 0
+            estado.quebras = 0
+        self._publicar_estado("configurar")
 
     def adicionar_quebras(self, quantidade: int):
         """Adiciona quebras à contagem"""
-        self.state.quebras += quantidade
-
-    def _contagem_loop(self):
-        """Loop principal de contagem otimizado"""
-        ultimo_estado = False
-        contagem_buffer = 0
-        ultima_atualizacao = time.time()
-
-        while self._running:
-            if self.state.estado == 1:  # Estado de contagem
-                estado_atual = self.gpio.read_counter()
-                if estado_atual and not ultimo_estado:
-                    contagem_buffer += 1
-
-                    # Atualiza a cada 10 contagens ou 1 segundo
-                    agora = time.time()
-                    if contagem_buffer >= 10 or (agora - ultima_atualizacao) >= 1:
-                        self.state.contagem_atual += contagem_buffer
-                        if self.state.contagem_atual >= (
-                            self.state.contagem_total + self.state.quebras
-                        ):
-                            self.parar_contagem()
-
-                        contagem_buffer = 0
-                        ultima_atualizacao = agora
-
-                ultimo_estado = estado_atual
-            time.sleep(0.0001)  # Reduz uso de CPU mantendo resposta rápida
+        with self._alterar_estado() as estado:
+            estado.quebras += quantidade
+        self._guardar_checkpoint(sincronizar=True)
+        self.eventos.publicar("quebras", {"quebras": self._snapshot.quebras})
+
+    def _registar_garrafas(self, quantidade: int, instante: float):
+        """Soma garrafas detetadas pelo backend de contagem
+
+        Corre na thread do backend (callback de flanco ou loop de polling):
+        só espera pelo lock do estado, o tempo de uma alteração; o fecho da
+        ordem e a retoma são feitos noutra thread.
+        """
+        retomar = parar = False
+        with self._lock_estado:
+            estado = self.state
+            if estado.estado != 1 and not self._pausado_por_paragem:
+                return
+            passagens = estado.passagens
+            if passagens.total:
+                self._intervalos.observar(instante - passagens.ultimo)
+            for _ in range(quantidade):
+                passagens.registar(instante)
+            self.paragens.passagem(instante)
+            estado.contagem_atual += quantidade
+            contagem, total = estado.contagem_atual, estado.contagem_total
+            if self._pausado_por_paragem:
+                # A linha voltou a andar: retoma já (a porta e o backend
+                # ficaram prontos) e deixa a publicação para outra thread
+                self._pausado_por_paragem = False
+                estado.estado = 1
+                retomar = True
+            if not self._a_parar and contagem >= total + estado.quebras:
+                self._a_parar = parar = True
+            # Refazer o snapshot (e o checkpoint) custa dez vezes a contagem:
+            # só a cada INTERVALO_SNAPSHOT, nas transições e no tick de estatísticas
+            if retomar or parar or (
+                time.monotonic() - self._ultimo_snapshot >= self.INTERVALO_SNAPSHOT
+            ):
+                self._publicar_contagem()
+        self._garrafas.incrementar(quantidade)
+        self.eventos.publicar("contagem", {"contagem": contagem, "total": total}, coalescer=True)
+        if retomar:
+            threading.Thread(target=self._retomar_apos_paragem, daemon=True).start()
+        if parar:
+            threading.Thread(target=self.parar_contagem, daemon=True).start()
 
     def _stats_loop(self):
         """Loop de estatísticas otimizado"""
-        ultima_gravacao = time.time()
-
-        while self._running:
-            if self.state.estado == 1:
-                agora = time.time()
-                # Grava contagem a cada 10 segundos
-                if agora - ultima_gravacao >= 10:  # Alterado de 300 para 10 segundos
-                    try:
-                        self.db.gravar_contagem(
-                            self,
-                            self.state.id_ordem,
-                            self.state.contagem_atual,
-                            self.state.contagem_total,
-                        )
-                        ultima_gravacao = agora
-                    except Exception as e:
-                        logging.error(f"Erro ao gravar contagem parcial: {e}")
-
-                contagem_atual = self.state.contagem_atual
-                delta_tempo = agora - self._last_time
-                delta_contagem = contagem_atual - self._last_count
-
-                if delta_tempo >= 10:  # Mantido em 10 segundos para consistência
-                    gfa = (delta_contagem / delta_tempo) * 3600
-
-                    self.state.estatistica_gfa.append(int(gfa))
-                    self.state.estatistica_nominal = int(gfa)
-                    self.state.estatistica_media.append(
-                        int(np.mean(self.state.estatistica_gfa[-10:]))
-                    )
-                    self.state.estatistica_tempo.append(
-                        datetime.now().strftime("%H:%M:%S")
-                    )
-                    self.state.estatistica_cadencia.append(self.state.cadencia_artigo)
-
-                    # Registra paragem se necessário
-                    if self.state.registo_paragem:
-                        self.state.paragens.append("0")
-                        self.state.registo_paragem = 0
-                    else:
-                        self.state.paragens.append("null")
-
-                    self._last_count = contagem_atual
-                    self._last_time = agora
-
-            time.sleep(1)
-
-    def _auto_pause_loop(self):
-        """Loop para detectar paradas automáticas"""
-        JANELA_ANALISE = 6  # Analisa 1 minuto (6 períodos de 10 segundos)
-        LIMITE_GFA = 100  # Limite mínimo de GFA para considerar produção ativa
+        metrica = MetricaLoop("estatisticas", prazo=10)
 
         while self._running:
             try:
-                if self.state.estado == 1:
-                    if len(self.state.estatistica_gfa) >= JANELA_ANALISE:
-                        # Analisa os últimos 6 registros (1 minuto)
-                        ultimas_gfas = self.state.estatistica_gfa[-JANELA_ANALISE:]
-                        media_gfa = sum(ultimas_gfas) / len(ultimas_gfas)
-
-                        # Pausa se a média de GFA estiver abaixo do limite por 1 minuto
-                        if media_gfa < LIMITE_GFA:
-                            logging.info(
-                                f"Pausa automática ativada - GFA média: {media_gfa:.2f}"
-                            )
-                            self.pausar_contagem()
-
-                time.sleep(10)  # Verifica a cada 10 segundos
+                self.tick_estatisticas()
             except Exception as e:
-                logging.error(f"Erro no loop de pausa automática: {e}")
-                time.sleep(10)
-
-    def _schedule_pause_loop(self):
-        """Loop para pausar automaticamente nos horários programados"""
-        PAUSA_ALMOCO = datetime_time(12, 0)  # 12:00
-        PAUSA_FIM = datetime_time(17, 0)  # 17:00
-
-        while self._running:
-            try:
-                agora = datetime.now().time()
-
-                if self.state.estado == 1 and not self.state.pausa_automatica:
-                    if (
-                        agora.hour == PAUSA_ALMOCO.hour
-                        and agora.minute == PAUSA_ALMOCO.minute
-                    ):
-                        logging.info("Pausa automática - Horário de almoço")
-                        self.state.pausa_automatica = True
-                        self.pausar_contagem()
-
-                    elif (
-                        agora.hour == PAUSA_FIM.hour
-                        and agora.minute == PAUSA_FIM.minute
-                    ):
-                        logging.info("Pausa automática - Fim de expediente")
-                        self.state.pausa_automatica = True
-                        self.pausar_contagem()
-
-                time.sleep(30)  # Verifica a cada 30 segundos
-
-            except Exception as e:
-                logging.error(f"Erro no loop de pausa programada: {e}")
-                time.sleep(60)  # Em caso de erro, espera 1 minuto
+                # Um erro num tick não pode acabar com os checkpoints e as amostras
+                logging.error(f"Erro no loop de estatísticas: {e}")
+            metrica.fim_trabalho()
+            time.sleep(1)
+            metrica.acordou(1)
+        metrica.terminar()
+
+    def tick_estatisticas(self):
+        """Uma iteração (de segundo a segundo) do loop de estatísticas"""
+        self._backend.vigiar()
+        if self.state.estado != 1:
+            return
+        agora = time.time()
+        # Grava contagem a cada 10 segundos (em segundo plano)
+        if agora - self._ultima_gravacao >= 10:  # Alterado de 300 para 10 segundos
+            self.escritor.submeter(
+                self.db.amostra_contagem(
+                    self,
+                    self.state.id_ordem,
+                    self.state.contagem_atual,
+                    self.state.contagem_total,
+                )
+            )
+            self._ultima_gravacao = agora
+
+        instante = time.monotonic()
+        delta_tempo = instante - self._ultimo_ponto
+
+        if delta_tempo >= 10:  # Mantido em 10 segundos para consistência
+            # Taxa exata desde o ponto anterior, pelos instantes das garrafas
+            gfa = self.state.passagens.taxa(delta_tempo, instante)
+
+            with self._alterar_estado() as estado:
+                estado.estatistica_nominal = int(gfa)
+                estado.estatisticas.adicionar(int(gfa))
+
+                # Registra paragem se necessário
+                paragem = estado.registo_paragem
+                estado.registo_paragem = 0
+
+                estado.series.adicionar(
+                    time.time(),
+                    int(gfa),
+                    int(estado.estatisticas.media_movel.media),
+                    estado.cadencia_artigo,
+                    paragem,
+                )
+            snapshot = self._snapshot
+            self.eventos.publicar(
+                "estatisticas",
+                {
+                    "seq": snapshot.seq,
+                    "gfa": snapshot.gfa,
+                    "media": snapshot.media,
+                    "cadencia": snapshot.cadencia_artigo,
+                    "paragem": paragem,
+                    "tempo": formatar_tempo(snapshot.series.ultimo_instante()),
+                },
+            )
+            self._ultimo_ponto = instante
+        else:
+            # Publica as garrafas contadas desde o último snapshot e a taxa
+            # instantânea, que desce sozinha se não houver garrafas
+            with self._lock_estado:
+                self._publicar_contagem()
+            snapshot = self._snapshot
+            self.eventos.publicar(
+                "taxa",
+                {"instantanea": snapshot.taxa_instantanea, "minuto": snapshot.taxa_minuto},
+                coalescer=True,
+            )
+
+    def _paragem_iniciada(self, paragem: Dict[str, Any]):
+        """Callback do detetor: a linha está parada (thread do detetor)"""
+        with self._alterar_estado() as estado:
+            estado.registo_paragem = 1
+        self.eventos.publicar("paragem", {"acao": "inicio", **formatar_registo(paragem)})
+
+    def _paragem_terminada(self, paragem: Dict[str, Any]):
+        """Callback do detetor: chegou uma garrafa (pode correr na thread de contagem)"""
+        self.eventos.publicar("paragem", {"acao": "fim", **formatar_registo(paragem)})
+
+    def _paragem_prolongada(self, paragem: Dict[str, Any]):
+        """Pausa automática quando uma paragem dura mais que PARAGEM_AUTO_PAUSA
+
+        A porta fica aberta e o backend armado: a primeira garrafa que
+        passar retoma a contagem.
+        """
+        with self._alterar_estado() as estado:
+            if estado.estado != 1:
+                return
+            logging.info(
+                f"Pausa automática - linha parada há {paragens_config.auto_pausa:.0f} s"
+            )
+            estado.estado = 2
+            estado.pausa_automatica = True
+            self._pausado_por_paragem = True
+        self._publicar_estado("pausa_paragem")
+
+    def _retomar_apos_paragem(self):
+        with self._alterar_estado() as estado:
+            estado.pausa_automatica = False
+        logging.info("Contagem retomada - a linha voltou a produzir")
+        self._publicar_estado("retomar")
+
+    def evento_turno(self, acao: str, pausa: Pausa):
+        """Callback do calendário de turnos: "pausar" ou "retomar" na hora da `pausa`"""
+        if acao == "pausar":
+            self.pausa_programada(pausa.nome)
+        else:
+            self.retomar_programada(pausa.nome)
+
+    def pausa_programada(self, motivo: str):
+        """Pausa a contagem numa pausa do calendário (só se estiver a contar)"""
+        with self._alterar_estado() as estado:
+            if estado.estado != 1 and not self._pausado_por_paragem:
+                return
+            logging.info(f"Pausa automática - {motivo}")
+            estado.pausa_automatica = True
+            self._pausado_por_horario = True
+            self.pausar_contagem()
+
+    def retomar_programada(self, motivo: str):
+        """Retoma a contagem no fim de uma pausa do calendário
+
+        Só retoma o que o calendário pausou: uma pausa manual fica em pausa.
+        """
+        with self._alterar_estado():
+            if not self._pausado_por_horario:
+                return
+            logging.info(f"Contagem retomada - fim de {motivo}")
+            self.retomar_contagem()
 
     def _gravar_dados_finais(self):
         """Grava os dados finais da produção no banco de dados"""
         try:
-            with pymssql.connect(self.db._host, self.db._user, self.db._password, "SIP") as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(
-                        """
-                        UPDATE krones_contadoreslinha 
-                        SET
-                            Ativo = 0,
-                            QuantidadeFinal = %d,
-                            Quebras = %d,
-                            MediaProducao = %d,
-                            Abertura = %s,
-                            Fecho = %s
-                        WHERE
-                            Ativo = 1 AND
-                            Ordem = %s
-                    """,
-                        (
-                            int(self.state.contagem_atual),
-                            int(self.state.quebras),
-                            int(self.state.estatistica_media[-1] if self.state.estatistica_media else 0),
-                            self.state.tempo_inicio,
-                            self.state.tempo_fim,
-                            str(self.state.ordem),
-                        ),
-                    )
-                conn.commit()
+            self.escritor.finalizar(
+                str(self.state.ordem),
+                {
+                    "contagem_final": int(self.state.contagem_atual),
+                    "quebras": int(self.state.quebras),
+                    "media_producao": int(self.state.series.ultimo("media", 0)),
+                    "tempo_inicio": self.state.tempo_inicio,
+                    "tempo_fim": self.state.tempo_fim,
+                },
+            )
         except Exception as e:
             logging.error(f"Erro ao gravar dados finais: {e}")
             raise
@@ -317,14 +674,128 @@ class Contador:
     def reset(self):
         """Reseta o contador para o estado inicial"""
         try:
-            self.db.desativar_ordens_ativas()
-            self.state = ContadorState()
-            self.gpio.set_door(False)
+            # Com várias linhas só desativa a ordem desta linha
+            self.db.desativar_ordens_ativas(self.state.ordem if self.linha else None)
+            with self._alterar_estado():
+                self.state.series.fechar()
+                self.state = ContadorState()
+                self._a_parar = False
+                self._pausado_por_paragem = False
+                self._pausado_por_horario = False
+                self._backend.desarmar()
+                # As paragens eram da ordem que saiu
+                self.paragens.desarmar(time.monotonic())
+                self.paragens.limpar()
+                self.paragens.configurar(self.state.cadencia_artigo)
+                self.set_porta(False)
+            self._publicar_estado("reset")
         except Exception as e:
             logging.error(f"Erro ao resetar contador: {e}")
             raise
 
     def set_porta(self, estado: bool):
         """Controla o estado da porta - simplificado e direto"""
-        self.gpio.set_door(estado)
-        self.state.porta_estado = 1 if estado else 0
+        with self._alterar_estado() as state:
+            self.gpio.set_door(estado)
+            state.porta_estado = 1 if estado else 0
+        self.eventos.publicar("porta", {"porta": self._snapshot.porta_estado})
+
+    def _guardar_checkpoint(self, sincronizar: bool = False):
+        """Guarda o estado da ordem no checkpoint (se houver)"""
+        if self.checkpoint is None:
+            return
+        try:
+            with self._lock_estado:
+                estado = self.state
+                self.checkpoint.guardar(
+                    {
+                        "ordem": estado.ordem,
+                        "id_ordem": estado.id_ordem,
+                        "artigo": estado.artigo,
+                        "descricao_artigo": estado.descricao_artigo,
+                        "cadencia_artigo": estado.cadencia_artigo,
+                        "contagem_atual": estado.contagem_atual,
+                        "contagem_total": estado.contagem_total,
+                        "quebras": estado.quebras,
+                        "estado": estado.estado,
+                        "configurado": bool(estado.configurado),
+                        "pausa_automatica": estado.pausa_automatica,
+                        "pausado_por_paragem": self._pausado_por_paragem,
+                        "pausado_por_horario": self._pausado_por_horario,
+                        "tempo_inicio": estado.tempo_inicio.isoformat()
+                        if estado.tempo_inicio
+                        else None,
+                    },
+                    sincronizar,
+                )
+        except Exception as e:
+            logging.error(f"Erro ao guardar checkpoint: {e}")
+
+    def _restaurar_checkpoint(self):
+        """Retoma a ordem guardada no checkpoint (depois de um reinício)
+
+        Uma ordem em contagem volta a contar, com a porta aberta; uma ordem
+        em pausa fica em pausa. As séries vêm do ficheiro da ordem e os
+        agregados da GFA são recalculados a partir delas.
+        """
+        dados = self.checkpoint.ler()
+        if not dados or not dados["configurado"]:
+            return
+        inicio = time.perf_counter()
+        with self._alterar_estado() as estado:
+            estado.ordem = dados["ordem"]
+            estado.id_ordem = dados["id_ordem"]
+            estado.artigo = dados["artigo"]
+            estado.descricao_artigo = dados["descricao_artigo"]
+            estado.cadencia_artigo = dados["cadencia_artigo"]
+            estado.contagem_atual = dados["contagem_atual"]
+            estado.contagem_total = dados["contagem_total"]
+            estado.quebras = dados["quebras"]
+            estado.configurado = True
+            estado.pausa_automatica = dados["pausa_automatica"]
+            self.paragens.configurar(estado.cadencia_artigo)
+            self._backend.configurar(estado.cadencia_artigo)
+            if dados["estado"] in (1, 2):
+                estado.estado = dados["estado"]
+                estado.tempo_inicio = (
+                    datetime.fromisoformat(dados["tempo_inicio"])
+                    if dados["tempo_inicio"]
+                    else datetime.now()
+                )
+                estado.series.fechar()
+                estado.series = criar_series_estatisticas(
+                    series_config.retencao, self.diretorio_series, estado.ordem
+                )
+                if estado.series.restaurar():
+                    for gfa in estado.series.completa()[1]["gfa"]:
+                        estado.estatisticas.adicionar(gfa)
+                    estado.estatistica_nominal = estado.series.ultimo("gfa", 0)
+                self._a_parar = False
+                self._pausado_por_paragem = dados["pausado_por_paragem"]
+                self._pausado_por_horario = dados.get("pausado_por_horario", False)
+                if estado.estado == 1 or self._pausado_por_paragem:
+                    self._backend.armar()
+                    self.set_porta(True)
+                    self.paragens.armar(time.monotonic())
+        logging.info(
+            f"Ordem {dados['ordem']} restaurada do checkpoint em "
+            f"{(time.perf_counter() - inicio) * 1000:.1f} ms "
+            f"({dados['contagem_atual']}/{dados['contagem_total']} garrafas)"
+        )
+        self._publicar_estado("restaurar")
+
+    def _publicar_estado(self, acao: str):
+        """Publica uma transição de estado para os clientes do stream"""
+        self._guardar_checkpoint(sincronizar=True)
+        snapshot = self._snapshot
+        self.eventos.publicar(
+            "estado",
+            {
+                "acao": acao,
+                "estado": snapshot.estado,
+                "configurado": bool(snapshot.configurado),
+                "ordem": snapshot.ordem,
+                "contagem": snapshot.contagem_atual,
+                "total": snapshot.contagem_total,
+            },
+        )
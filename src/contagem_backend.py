@@ -0,0 +1,355 @@
+import logging
+import threading
+import time
+from typing import Optional
+from .batimentos import batimentos
+from .config import gpio_config
+from .metricas import LIMITES_LOOP, MetricaLoop, metricas
+
+ATRASO_FLANCO = metricas.histograma(
+    "contagem_atraso_flanco_segundos",
+    "Atraso entre o flanco e o seu registo pelo callback",
+    limites=LIMITES_LOOP,
+)
+RESSALTOS = metricas.contador(
+    "contagem_ressaltos_total", "Pulsos rejeitados pelo filtro de ressaltos", ("linha", "motivo")
+)
+
+
+class FiltroRessaltos:
+    """Filtro de ressaltos aplicado a cada flanco, antes de contar a garrafa
+
+    Desligado (largura e intervalo mínimos a 0, o padrão), cada flanco
+    ascendente é uma garrafa, como sempre foi. Ligado, a garrafa continua a
+    ter o instante do flanco ascendente, mas só conta quando o pulso
+    termina (flanco descendente), se
+    durou pelo menos `largura_minima` segundos e se começou pelo menos
+    `intervalo_minimo` segundos depois do fim do pulso anterior. O intervalo
+    mínimo é uma `fracao` do intervalo nominal do artigo (3600 / cadência),
+    com `intervalo_base` como mínimo. Os pulsos rejeitados são contados à
+    parte, por motivo, para afinar os limites. Só guarda números: não há
+    alocações por pulso.
+
+    Com polling, um flanco só se sabe ter ocorrido entre duas leituras: a
+    `incerteza` de uma subida alarga a largura medida (um atraso do loop não
+    faz passar um pulso por ressalto) sem encurtar o intervalo para o pulso
+    anterior (uma garrafa vista depois de um atraso não é rejeitada).
+    """
+
+    def __init__(
+        self,
+        largura_minima: float = 0,
+        intervalo_base: float = 0,
+        fracao: float = 0,
+        linha: str = "1",
+    ):
+        self.largura_minima = largura_minima
+        self.intervalo_base = intervalo_base
+        self.fracao = fracao
+        self.intervalo_minimo = intervalo_base
+        self.curtos = 0  # Pulsos mais curtos que largura_minima
+        self.proximos = 0  # Pulsos demasiado perto do anterior (garrafa a oscilar)
+        self._curtos = RESSALTOS.com(linha, "largura")
+        self._proximos = RESSALTOS.com(linha, "intervalo")
+        self._subida = None
+        self._largura_extra = 0.0
+        self._fim_anterior = float("-inf")
+
+    def configurar(self, cadencia: float):
+        """Ajusta o intervalo mínimo à cadência nominal do artigo (garrafas/hora)"""
+        intervalo = 3600 / cadencia if cadencia > 0 else 0
+        self.intervalo_minimo = max(self.intervalo_base, self.fracao * intervalo)
+
+    def reiniciar(self):
+        """Esquece o pulso em curso (ao armar a contagem)"""
+        self._subida = None
+        self._fim_anterior = float("-inf")
+
+    def flanco(self, instante: float, nivel: bool, incerteza: float = 0.0) -> Optional[float]:
+        """Processa um flanco; devolve o início do pulso se for uma garrafa"""
+        if self.largura_minima <= 0 and self.intervalo_minimo <= 0:
+            return instante if nivel else None
+        if nivel:
+            self._subida = instante
+            self._largura_extra = incerteza
+            return None
+        subida = self._subida
+        if subida is None:  # Descida sem subida (contagem armada a meio de um pulso)
+            return None
+        self._subida = None
+        if instante - subida + self._largura_extra < self.largura_minima:
+            self.curtos += 1
+            self._curtos.incrementar()
+            return None
+        fim_anterior = self._fim_anterior
+        self._fim_anterior = instante
+        if subida - fim_anterior < self.intervalo_minimo:
+            self.proximos += 1
+            self._proximos.incrementar()
+            return None
+        return subida
+
+    @property
+    def rejeitados(self) -> int:
+        return self.curtos + self.proximos
+
+
+class ContagemBackend:
+    """Interface comum dos modos de contagem"""
+
+    def __init__(self, contador):
+        self.contador = contador
+        self.gpio = contador.gpio
+        self.filtro = FiltroRessaltos(
+            gpio_config.debounce_largura,
+            gpio_config.debounce_intervalo,
+            gpio_config.debounce_fracao,
+            contador.id_linha,
+        )
+
+    def configurar(self, cadencia: float):
+        """Ajusta o filtro de ressaltos ao artigo"""
+        self.filtro.configurar(cadencia)
+
+    @property
+    def rejeitados(self) -> int:
+        """Pulsos rejeitados pelo filtro de ressaltos"""
+        return self.filtro.rejeitados
+
+    def start(self):
+        """Prepara o backend (chamado uma vez no arranque do contador)"""
+
+    def stop(self):
+        """Liberta os recursos do backend"""
+        self.desarmar()
+
+    def vigiar(self):
+        """Batimento do backend, a cada tick de estatísticas (se não tiver loop próprio)"""
+
+    def armar(self):
+        """Começa a contar garrafas"""
+        raise NotImplementedError
+
+    def desarmar(self):
+        """Deixa de contar garrafas"""
+        raise NotImplementedError
+
+
+class EventosBackend(ContagemBackend):
+    """Contagem por eventos de flanco do kernel, sem polling
+
+    Os flancos chegam em threads do driver, que não acordam sem garrafas;
+    o batimento é dado pelo tick de estatísticas (`vigiar`) enquanto está
+    armado, exceto se um callback de flanco estiver preso há mais de
+    PRAZO_BATIMENTO segundos (por exemplo à espera de um lock).
+    """
+
+    PRAZO_BATIMENTO = 5
+
+    def __init__(self, contador):
+        super().__init__(contador)
+        self._armado = False
+        self._lock = threading.Lock()
+        self._batimento = None
+        self._callback_desde = None  # Monotonic da entrada no callback em curso
+
+    def start(self):
+        self._batimento = batimentos.registar(
+            f"eventos_{self.contador.id_linha}", self.PRAZO_BATIMENTO
+        )
+        self.vigiar()
+
+    def stop(self):
+        super().stop()
+        if self._batimento is not None:
+            self._batimento.terminar()
+            self._batimento = None
+
+    def vigiar(self):
+        if self._batimento is None:
+            return
+        if not self._armado:
+            self._batimento.em_espera()
+            return
+        desde = self._callback_desde
+        agora = time.monotonic()
+        if desde is None or agora - desde < self.PRAZO_BATIMENTO:
+            self._batimento.bater(agora)
+
+    def armar(self):
+        with self._lock:
+            if not self._armado:
+                self.filtro.reiniciar()
+                self.gpio.enable_edge_events(self._on_edge)
+                self._armado = True
+                logging.info("Contagem por eventos armada")
+
+    def desarmar(self):
+        with self._lock:
+            if self._armado:
+                self.gpio.disable_edge_events()
+                self._armado = False
+                logging.info("Contagem por eventos desarmada")
+
+    def _on_edge(self, instante: float, nivel: bool):
+        """Callback de flanco - conta diretamente, sem buffer"""
+        agora = time.monotonic()
+        self._callback_desde = agora
+        try:
+            ATRASO_FLANCO.observar(agora - instante)
+            garrafa = self.filtro.flanco(instante, nivel)
+            if garrafa is not None:
+                self.contador._registar_garrafas(1, garrafa)
+        finally:
+            self._callback_desde = None
+
+
+class CicloPolling:
+    """Thread de polling partilhada pelos backends de várias linhas
+
+    Cada iteração lê o pino de todos os backends armados e dorme uma vez,
+    pelo que o custo de acordar não cresce com o número de linhas. Sem
+    nenhum backend armado a thread fica parada.
+    """
+
+    def __init__(self, intervalo: float = 0.0001):
+        self.intervalo = intervalo
+        self._backends = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def adicionar(self, backend):
+        with self._cond:
+            self._backends = self._backends + [backend]
+            self._cond.notify()
+
+    def remover(self, backend):
+        with self._cond:
+            self._backends = [b for b in self._backends if b is not backend]
+
+    def acordar(self):
+        """Chamado quando um backend é armado"""
+        with self._cond:
+            self._cond.notify()
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._contagem_loop, daemon=True)
+            logging.info(f"Iniciando thread: {self._thread.name}")
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _armados(self):
+        return [backend for backend in self._backends if backend.armado]
+
+    def _contagem_loop(self):
+        """Loop de contagem por polling - fica parado enquanto nada está armado"""
+        metrica = MetricaLoop("contagem", prazo=2)
+
+        while self._running:
+            armados = self._armados()
+            if not armados:
+                metrica.espera()
+                with self._cond:
+                    while self._running and not self._armados():
+                        self._cond.wait()
+                metrica.reiniciar()
+                continue
+
+            for backend in armados:
+                backend._ler()
+            metrica.fim_trabalho()
+            time.sleep(self.intervalo)  # Reduz uso de CPU mantendo resposta rápida
+            metrica.acordou(self.intervalo)
+        metrica.terminar()
+
+
+class PollingBackend(ContagemBackend):
+    """Contagem por leitura periódica do pino (modo de recurso)
+
+    As leituras são feitas por um CicloPolling: o do GestorLinhas, partilhado
+    pelas linhas do processo, ou um próprio.
+    """
+
+    INTERVALO = 0.0001
+
+    def __init__(self, contador, ciclo: Optional[CicloPolling] = None):
+        super().__init__(contador)
+        self.ciclo = ciclo
+        self._ciclo_proprio = ciclo is None
+        self.armado = False
+        self._ultimo_estado = None  # None: primeira leitura depois de armar
+        self._leitura_anterior = 0.0
+
+    def start(self):
+        if self.ciclo is None:
+            self.ciclo = CicloPolling(self.INTERVALO)
+        self.ciclo.adicionar(self)
+        self.ciclo.start()
+
+    def stop(self):
+        self.desarmar()
+        if self.ciclo is not None:
+            self.ciclo.remover(self)
+            if self._ciclo_proprio:
+                self.ciclo.stop()
+
+    def armar(self):
+        if not self.armado:
+            self._ultimo_estado = None
+            self.armado = True
+            if self.ciclo is not None:
+                self.ciclo.acordar()
+
+    def desarmar(self):
+        self.armado = False
+
+    def _ler(self):
+        """Uma leitura do pino (na thread do ciclo de polling)
+
+        Cada flanco passa logo pelo filtro de ressaltos, com o seu instante,
+        para que as taxas calculadas a partir dos instantes das garrafas
+        sejam exatas. Um flanco visto nesta leitura deu-se depois da leitura
+        anterior: o tempo desde essa leitura vai como incerteza da subida.
+        """
+        estado_atual = self.gpio.read_counter()
+        agora = time.monotonic()
+        if self._ultimo_estado is None:
+            self.filtro.reiniciar()
+        elif estado_atual != self._ultimo_estado:
+            garrafa = self.filtro.flanco(agora, estado_atual, agora - self._leitura_anterior)
+            if garrafa is not None:
+                self.contador._registar_garrafas(1, garrafa)
+        self._leitura_anterior = agora
+        self._ultimo_estado = estado_atual
+
+
+BACKENDS = {
+    "eventos": EventosBackend,
+    "polling": PollingBackend,
+}
+
+
+def criar_backend(modo: str, contador, ciclo: Optional[CicloPolling] = None) -> ContagemBackend:
+    """Cria o backend de contagem configurado
+
+    `ciclo` é o ciclo de polling partilhado entre linhas (só no modo polling).
+    """
+    if modo == "processo":
+        from .processo_contagem import ProcessoBackend  # Importa este módulo
+
+        return ProcessoBackend(contador)
+    if modo not in BACKENDS:
+        raise ValueError(f"Modo de contagem desconhecido: {modo}")
+    if modo == "polling":
+        return PollingBackend(contador, ciclo)
+    return BACKENDS[modo](contador)
@@ -1,23 +1,305 @@
-import pymssql
 from contextlib import contextmanager
 from typing import Any, Dict, Optional
 import logging
-from datetime import datetime
-from .config import db_config
+import queue
+import threading
+import time
+from datetime import date, datetime, timedelta
+from .cache import CacheTTL
+from .config import cache_config, db_config
+from .metricas import cronometrar, metricas
+from .series import formatar_paragem, formatar_tempo
+
+COLUNAS_CONTAGEM = ("IdContagem", "ContagemAtual", "Objetivo", "DataLeitura")
+COLUNAS_HISTORICO = (
+    "DataDados", "Ordem", "Artigo", "DescricaoArtigo", "CadenciaArtigo", "Inicio", "Fim",
+    "ContagemAtual", "ContagemTotal", "MediaProducao", "EstimativaFecho", "Paragens",
+    "Quebras", "EstadoPorta", "EstadoContador", "EstadoConfiguracao", "Nominal", "Media",
+    "Cadencia", "Tempo",
+)
+
+DURACAO_BD = metricas.histograma(
+    "bd_chamada_segundos", "Duração das chamadas ao DatabaseManager", ("metodo",)
+)
+ERROS_BD = metricas.contador("bd_erros_total", "Chamadas ao DatabaseManager que falharam", ("metodo",))
+
+MAX_LINHAS_INSERT = 1000  # Limite do SQL Server para um INSERT ... VALUES
+
+# Ordens planeadas para um dia (DataPrevista em [%s, %s[), no máximo TOP (%s)
+SQL_ORDENS_DO_DIA = """
+    SELECT TOP (%s)
+        op.Id,
+        op.ArtigoGCP as Artigo,
+        DescricaoGCP as DescricaoArtigo,
+        ISNULL(CDU_Cadencia, 6000) as CadenciaArtigo,
+        op.NORDEM
+    FROM
+        prd_ORDEM_PRODUCAO op
+    INNER JOIN
+        PRIPOCAS.dbo.Artigo art
+    ON
+        op.ArtigoGCP = art.Artigo
+    WHERE
+        nEMPRESA = 1 AND op.DataPrevista >= %s AND op.DataPrevista < %s
+    ORDER BY op.Id DESC
+"""
+
+# Descrição e cadência de um artigo, a partir de uma das suas ordens
+SQL_ARTIGO = """
+    SELECT TOP (1)
+        DescricaoGCP as DescricaoArtigo,
+        ISNULL(CDU_Cadencia, 6000) as CadenciaArtigo
+    FROM
+        prd_ORDEM_PRODUCAO op
+    INNER JOIN
+        PRIPOCAS.dbo.Artigo art
+    ON
+        op.ArtigoGCP = art.Artigo
+    WHERE
+        nEMPRESA = 1 AND op.ArtigoGCP = %s
+"""
+
+
+def _chave_ordem(ordem: str) -> str:
+    """Chave da cache de ordens: o número como está na base de dados"""
+    return ordem.replace("-", "/")
+
+
+class ConnectionPool:
+    """Pool limitado de conexões pymssql para uma base de dados"""
+
+    def __init__(
+        self,
+        host: str,
+        user: str,
+        password: str,
+        database: str,
+        max_connections: int = 5,
+        verificar_apos: float = 30,
+        timeout: float = 30,
+        login_timeout: int = 10,
+        timeout_consulta: int = 30,
+    ):
+        self.database = database
+        self._host = host
+        self._user = user
+        self._password = password
+        self._verificar_apos = verificar_apos  # Segundos parada antes de testar a conexão
+        self._timeout = timeout  # Espera máxima por uma conexão livre
+        self._login_timeout = login_timeout
+        self._timeout_consulta = timeout_consulta
+        # Instante do último erro: as conexões devolvidas antes dele são testadas
+        self._ultimo_erro = float("-inf")
+        self._livres = queue.LifoQueue()  # (conexão, último uso)
+        self._vagas = threading.BoundedSemaphore(max_connections)
+
+    def _conectar(self):
+        import pymssql  # Só na primeira ligação: não atrasa o arranque da contagem
+
+        return pymssql.connect(
+            self._host,
+            self._user,
+            self._password,
+            self.database,
+            timeout=self._timeout_consulta,
+            login_timeout=self._login_timeout,
+        )
+
+    def _saudavel(self, conn) -> bool:
+        """Testa uma conexão que ficou parada"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except Exception:
+            return False
+
+    def _obter(self):
+        """Devolve uma conexão livre e saudável, ou abre uma nova
+
+        Uma conexão parada há mais de `verificar_apos` segundos, ou devolvida
+        antes do último erro, é testada. Se falhar, as outras livres (mais
+        antigas) também são fechadas e a conexão é refeita uma vez, nova.
+        """
+        try:
+            conn, ultimo_uso = self._livres.get_nowait()
+        except queue.Empty:
+            return self._conectar()
+        verificar = (
+            ultimo_uso <= self._ultimo_erro
+            or time.monotonic() - ultimo_uso >= self._verificar_apos
+        )
+        if not verificar or self._saudavel(conn):
+            return conn
+        logging.warning(f"Conexão inválida descartada ({self.database})")
+        self._fechar_conexao(conn)
+        self.fechar()
+        return self._conectar()
+
+    def _fechar_conexao(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão do pool
+
+        Se o bloco levantar uma exceção a conexão é descartada, para que a
+        próxima utilização volte a ligar ao servidor.
+        """
+        if not self._vagas.acquire(timeout=self._timeout):
+            raise TimeoutError(f"Sem conexões livres para {self.database}")
+        conn = None
+        try:
+            conn = self._obter()
+            yield conn
+        except Exception:
+            self._ultimo_erro = time.monotonic()
+            if conn is not None:
+                self._fechar_conexao(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._livres.put((conn, time.monotonic()))
+            self._vagas.release()
+
+    def aquecer(self):
+        """Abre uma conexão e deixa-a no pool"""
+        with self.conexao():
+            pass
+
+    def fechar(self):
+        """Fecha todas as conexões livres"""
+        while True:
+            try:
+                conn, _ = self._livres.get_nowait()
+            except queue.Empty:
+                return
+            self._fechar_conexao(conn)
 
 
 class DatabaseManager:
     def __init__(self):
-        self._pool = {}
         self._max_connections = 5
         self._host = db_config.host
         self._user = db_config.user
         self._password = db_config.password
+        timeouts = {
+            "login_timeout": db_config.login_timeout,
+            "timeout_consulta": db_config.timeout,
+        }
+        self._pool = {
+            "SIP": ConnectionPool(
+                self._host, self._user, self._password, "SIP", self._max_connections, **timeouts
+            ),
+            "VGDadosPocas": ConnectionPool(
+                self._host, "Leitura", "Leitura", "VGDadosPocas", self._max_connections, **timeouts
+            ),
+        }
+        # Metadados de ordens e artigos (mudam raramente): o setup de uma ordem
+        # em cache não vai à base de dados
+        self.ordens = CacheTTL("ordens", cache_config.capacidade, cache_config.ttl)
+        self.artigos = CacheTTL("artigos", cache_config.capacidade, cache_config.ttl)
+        self._parar_prefetch = threading.Event()
+        self._prefetch = None
+        # As métricas leem só as caches: não prendem o gestor (nem o pool)
+        caches = (self.ordens, self.artigos)
+        metricas.medidor(
+            "cache_pedidos_total",
+            "Consultas às caches de ordens e artigos, por resultado",
+            lambda: {
+                (cache.nome, resultado): getattr(cache, resultado)
+                for cache in caches
+                for resultado in ("acertos", "falhas")
+            },
+            ("cache", "resultado"),
+            tipo="counter",
+        )
+        metricas.medidor(
+            "cache_entradas",
+            "Entradas nas caches de ordens e artigos",
+            lambda: {cache.nome: len(cache) for cache in caches},
+            ("cache",),
+        )
+
+    def conexao(self, database: str = "SIP"):
+        """Empresta uma conexão do pool da base de dados indicada"""
+        return self._pool[database].conexao()
+
+    def fechar(self):
+        """Fecha as conexões de todos os pools"""
+        self._parar_prefetch.set()
+        for pool in self._pool.values():
+            pool.fechar()
+
+    def aquecer(self):
+        """Abre uma conexão em cada pool, para o primeiro pedido não esperar por ela"""
+        for pool in self._pool.values():
+            pool.aquecer()
+
+    def invalidar_cache(self, ordem: Optional[str] = None):
+        """Esquece uma ordem da cache, ou todas as ordens e artigos sem `ordem`"""
+        if ordem is not None:
+            self.ordens.invalidar(_chave_ordem(ordem))
+            return
+        self.ordens.invalidar()
+        self.artigos.invalidar()
+
+    def estado_cache(self) -> Dict[str, Any]:
+        return {"ordens": self.ordens.estado(), "artigos": self.artigos.estado()}
 
+    def iniciar_prefetch(self, intervalo: float):
+        """Pré-carrega as ordens do dia em segundo plano, a cada `intervalo` segundos"""
+        if self._prefetch is None:
+            self._prefetch = threading.Thread(
+                target=self._prefetch_loop, args=(intervalo,), daemon=True
+            )
+            logging.info(f"Iniciando thread: {self._prefetch.name}")
+            self._prefetch.start()
+
+    def _prefetch_loop(self, intervalo: float):
+        while not self._parar_prefetch.is_set():
+            try:
+                logging.info(f"Cache: {self.prefetch_ordens()} ordens pré-carregadas")
+            except Exception as e:
+                logging.error(f"Erro no pré-carregamento de ordens: {e}")
+            self._parar_prefetch.wait(intervalo)
+
+    @cronometrar(DURACAO_BD, ERROS_BD)
+    def prefetch_ordens(self) -> int:
+        """Carrega para a cache as ordens planeadas para hoje (e os seus artigos)
+
+        No máximo `CACHE_PREFETCH_ORDENS` ordens, as de maior Id.
+        """
+        hoje = datetime.combine(date.today(), datetime.min.time())
+        with self.conexao("VGDadosPocas") as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                SQL_ORDENS_DO_DIA,
+                (cache_config.prefetch_ordens, hoje, hoje + timedelta(days=1)),
+            )
+            linhas = cursor.fetchall()
+        for linha in linhas:
+            self._guardar_ordem(linha)
+        return len(linhas)
+
+    def _guardar_ordem(self, row) -> Dict[str, Any]:
+        """Guarda nas caches uma linha de SQL_ORDENS_DO_DIA"""
+        artigo = {"DescricaoArtigo": row[2], "CadenciaArtigo": row[3]}
+        self.artigos.guardar(row[1], artigo)
+        dados = {"Id": row[0], "Artigo": row[1], **artigo}
+        self.ordens.guardar(_chave_ordem(str(row[4]).strip()), dados)
+        return dados
+
+    @cronometrar(DURACAO_BD, ERROS_BD)
     def buscar_ordem(self, id_ordem: int) -> Optional[Dict[str, Any]]:
         """Busca uma ordem de produção pelo ID"""
         try:
-            with pymssql.connect(db_config.host, db_config.user, db_config.password, "SIP") as conn:
+            with self.conexao("SIP") as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
@@ -49,103 +331,164 @@ class DatabaseManager:
             raise
 
     def buscar_ordem_producao(self, ordem: str) -> Optional[Dict[str, Any]]:
-        """Busca os dados de uma ordem de produção"""
+        """Busca os dados de uma ordem de produção (através da cache)
+
+        Só a leitura da base de dados (`_carregar_ordem_producao`) entra em
+        bd_chamada_segundos; os acertos da cache contam em cache_pedidos_total.
+        """
+        dados = self.ordens.obter_ou_carregar(
+            _chave_ordem(ordem), lambda: self._carregar_ordem_producao(ordem)
+        )
+        return dict(dados) if dados else None
+
+    @cronometrar(DURACAO_BD, ERROS_BD)
+    def _carregar_ordem_producao(self, ordem: str) -> Optional[Dict[str, Any]]:
+        """Lê uma ordem da base de dados
+
+        Lê só a tabela das ordens; o artigo vem da cache de artigos e só se
+        lá não estiver é lido da base de dados dos artigos.
+        """
         try:
-            with pymssql.connect(self._host, "Leitura", "Leitura", "VGDadosPocas") as conn:
+            with self.conexao("VGDadosPocas") as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
-                    SELECT
-                        Id,
-                        ArtigoGCP as Artigo,
-                        DescricaoGCP as DescricaoArtigo,
-                        ISNULL(CDU_Cadencia, 6000) as CadenciaArtigo
-                    FROM
-                        prd_ORDEM_PRODUCAO op
-                    INNER JOIN
-                        PRIPOCAS.dbo.Artigo art
-                    ON
-                        op.ArtigoGCP = art.Artigo
-                    WHERE 
-                        nEMPRESA = 1 AND
-                        NORDEM = REPLACE(%s, '-', '/')
+                    SELECT Id, ArtigoGCP
+                    FROM prd_ORDEM_PRODUCAO
+                    WHERE nEMPRESA = 1 AND NORDEM = REPLACE(%s, '-', '/')
                     """,
                     (ordem,),
                 )
                 row = cursor.fetchone()
-                if row:
-                    return {
-                        "Id": row[0],
-                        "Artigo": row[1],
-                        "DescricaoArtigo": row[2],
-                        "CadenciaArtigo": row[3],
-                    }
-                return None
+                if not row:
+                    return None
+                artigo = self.artigos.obter_ou_carregar(
+                    row[1], lambda: self._carregar_artigo(cursor, row[1])
+                )
+                if artigo is None:
+                    return None
+                return {"Id": row[0], "Artigo": row[1], **artigo}
         except Exception as e:
             logging.error(f"Erro ao buscar ordem de produção: {e}")
             raise
 
-    def gravar_contagem(self, contador, id_ordem: int, contagem: int, contagem_total: int):
-        """Grava uma contagem parcial no banco SIP e no histórico"""
+    def _carregar_artigo(self, cursor, artigo: str) -> Optional[Dict[str, Any]]:
+        cursor.execute(SQL_ARTIGO, (artigo,))
+        row = cursor.fetchone()
+        if row:
+            return {"DescricaoArtigo": row[0], "CadenciaArtigo": row[1]}
+        return None
+
+    def amostra_contagem(
+        self, contador, id_ordem: int, contagem: int, contagem_total: int
+    ) -> Dict[str, Any]:
+        """Captura os valores de uma contagem parcial para gravar mais tarde"""
+        data_atual = datetime.now()
+        series = contador.state.series
+        ultimo_instante = series.ultimo_instante()
+        return {
+            "contagem": {
+                "IdContagem": id_ordem,
+                "ContagemAtual": contagem,
+                "Objetivo": contagem_total,
+                "DataLeitura": data_atual,
+            },
+            "historico": {
+                "DataDados": data_atual,
+                "Ordem": id_ordem,
+                "Artigo": contador.state.artigo,
+                "DescricaoArtigo": contador.state.descricao_artigo,
+                "CadenciaArtigo": contador.state.cadencia_artigo,
+                "Inicio": contador.state.tempo_inicio,
+                "Fim": contador.state.tempo_fim,
+                "ContagemAtual": contador.state.contagem_atual,
+                "ContagemTotal": contador.state.contagem_total,
+                "MediaProducao": series.ultimo("media"),
+                "EstimativaFecho": None,  # Será calculado separadamente se necessário
+                "Paragens": formatar_paragem(series.ultimo("paragem")) if series.total else None,
+                "Quebras": contador.state.quebras,
+                "EstadoPorta": contador.state.porta_estado,
+                "EstadoContador": contador.state.estado,
+                "EstadoConfiguracao": contador.state.configurado,
+                "Nominal": series.ultimo("gfa"),
+                "Media": series.ultimo("media"),
+                "Cadencia": series.ultimo("cadencia"),
+                "Tempo": formatar_tempo(ultimo_instante) if ultimo_instante else None,
+            },
+        }
+
+    def _insert_multiplo(self, cursor, tabela: str, colunas, linhas, chave=None):
+        """Insere várias linhas com um único INSERT ... VALUES (...), (...)
+
+        Com `chave`, as linhas cujas colunas-chave já existam na tabela são
+        ignoradas, para que um reenvio não crie duplicados. Acima de
+        MAX_LINHAS_INSERT linhas são feitos vários INSERT.
+        """
+        if len(linhas) > MAX_LINHAS_INSERT:
+            for inicio in range(0, len(linhas), MAX_LINHAS_INSERT):
+                self._insert_multiplo(
+                    cursor, tabela, colunas, linhas[inicio:inicio + MAX_LINHAS_INSERT], chave
+                )
+            return
+        marcadores = "(" + ", ".join(["%s"] * len(colunas)) + ")"
+        params = []
+        for linha in linhas:
+            params.extend(linha[coluna] for coluna in colunas)
+        lista_colunas = ", ".join(colunas)
+        valores = ", ".join([marcadores] * len(linhas))
+        if chave is None:
+            sql = f"INSERT INTO {tabela} ({lista_colunas}) VALUES {valores}"
+        else:
+            condicao = " AND ".join(f"t.{coluna} = v.{coluna}" for coluna in chave)
+            sql = f"""
+                INSERT INTO {tabela} ({lista_colunas})
+                SELECT {lista_colunas} FROM (VALUES {valores}) AS v ({lista_colunas})
+                WHERE NOT EXISTS (SELECT 1 FROM {tabela} t WHERE {condicao})
+            """
+        cursor.execute(sql, tuple(params))
+
+    @cronometrar(DURACAO_BD, ERROS_BD)
+    def gravar_contagens(self, amostras, idempotente: bool = False):
+        """Grava um lote de contagens parciais no banco SIP e no histórico
+
+        `idempotente` é usado nos reenvios do journal local: as linhas já
+        gravadas (mesma ordem e mesmo instante) são ignoradas.
+        """
+        if not amostras:
+            return
         try:
-            with pymssql.connect(self._host, self._user, self._password, "SIP") as conn:
+            with self.conexao("SIP") as conn:
                 cursor = conn.cursor()
-                
-                # Primeira query - Grava na tabela de contagem atual
-                cursor.execute(
-                    """
-                    INSERT INTO krones_contadoreslinhacontagem
-                        (IdContagem, ContagemAtual, Objetivo, DataLeitura)
-                    VALUES
-                        (%s, %s, %s, %s)
-                    """,
-                    (id_ordem, contagem, contagem_total, datetime.now()),
+                self._insert_multiplo(
+                    cursor,
+                    "krones_contadoreslinhacontagem",
+                    COLUNAS_CONTAGEM,
+                    [amostra["contagem"] for amostra in amostras],
+                    chave=("IdContagem", "DataLeitura") if idempotente else None,
+                )
+                self._insert_multiplo(
+                    cursor,
+                    "krones_historico_contagens",
+                    COLUNAS_HISTORICO,
+                    [amostra["historico"] for amostra in amostras],
+                    chave=("Ordem", "DataDados") if idempotente else None,
                 )
-
-                # Segunda query - Grava no histórico
-                data_atual = datetime.now()
-                
-                SQL = """
-                    INSERT INTO krones_historico_contagens
-                        (DataDados, Ordem, Artigo, DescricaoArtigo, CadenciaArtigo, Inicio, Fim, ContagemAtual, ContagemTotal, MediaProducao, EstimativaFecho, Paragens, Quebras, EstadoPorta, EstadoContador, EstadoConfiguracao, Nominal, Media, Cadencia, Tempo)
-                    VALUES
-                        (%(DataDados)s, %(Ordem)s, %(Artigo)s, %(DescricaoArtigo)s, %(CadenciaArtigo)s, %(Inicio)s, %(Fim)s, %(ContagemAtual)s, %(ContagemTotal)s, %(MediaProducao)s, %(EstimativaFecho)s, %(Paragens)s, %(Quebras)s, %(EstadoPorta)s, %(EstadoContador)s, %(EstadoConfiguracao)s, %(Nominal)s, %(Media)s, %(Cadencia)s, %(Tempo)s)
-                """
-                params = {
-                    "DataDados": data_atual,
-                    "Ordem": id_ordem,
-                    "Artigo": contador.state.artigo,
-                    "DescricaoArtigo": contador.state.descricao_artigo,
-                    "CadenciaArtigo": contador.state.cadencia_artigo,
-                    "Inicio": contador.state.tempo_inicio,
-                    "Fim": contador.state.tempo_fim,
-                    "ContagemAtual": contador.state.contagem_atual,
-                    "ContagemTotal": contador.state.contagem_total,
-                    "MediaProducao": contador.state.estatistica_media[-1] if contador.state.estatistica_media else None,
-                    "EstimativaFecho": None,  # Será calculado separadamente se necessário
-                    "Paragens": contador.state.paragens[-1] if contador.state.paragens else None,
-                    "Quebras": contador.state.quebras,
-                    "EstadoPorta": contador.state.porta_estado,
-                    "EstadoContador": contador.state.estado,
-                    "EstadoConfiguracao": contador.state.configurado,
-                    "Nominal": contador.state.estatistica_gfa[-1] if contador.state.estatistica_gfa else None,
-                    "Media": contador.state.estatistica_media[-1] if contador.state.estatistica_media else None,
-                    "Cadencia": contador.state.estatistica_cadencia[-1] if contador.state.estatistica_cadencia else None,
-                    "Tempo": contador.state.estatistica_tempo[-1] if contador.state.estatistica_tempo else None,
-                }
-
-                cursor.execute(SQL, params)
-                
                 conn.commit()
-                
         except Exception as e:
             logging.error(f"Erro ao gravar contagem: {e}")
             raise
 
-    def gravar_estatisticas(self, id_ordem: int, stats: Dict[str, Any]):
+    def gravar_contagem(self, contador, id_ordem: int, contagem: int, contagem_total: int):
+        """Grava uma contagem parcial no banco SIP e no histórico"""
+        self.gravar_contagens(
+            [self.amostra_contagem(contador, id_ordem, contagem, contagem_total)]
+        )
+
+    @cronometrar(DURACAO_BD, ERROS_BD)
+    def gravar_estatisticas(self, ordem: str, stats: Dict[str, Any]):
         """Grava as estatísticas finais no banco SIP"""
         try:
-            with pymssql.connect(self._host, self._user, self._password, "SIP") as conn:
+            with self.conexao("SIP") as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
@@ -167,7 +510,7 @@ class DatabaseManager:
                         stats["media_producao"],
                         stats["tempo_inicio"],
                         stats["tempo_fim"],
-                        id_ordem,
+                        ordem,
                     ),
                 )
                 conn.commit()
@@ -175,18 +518,47 @@ class DatabaseManager:
             logging.error(f"Erro ao gravar estatísticas: {e}")
             raise
 
-    def desativar_ordens_ativas(self):
-        """Desativa todas as ordens de produção ativas"""
+    @cronometrar(DURACAO_BD, ERROS_BD)
+    def registar_ordem(self, ordem: str, quantidade: int, artigo: str):
+        """Regista uma nova ordem ativa em krones_contadoreslinha"""
         try:
-            with pymssql.connect(self._host, self._user, self._password, "SIP") as conn:
+            with self.conexao("SIP") as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
+                    INSERT INTO krones_contadoreslinha
+                        (Data, Ativo, Ordem, QuantidadeInicial, Artigo)
+                    VALUES
+                        (%s, %s, %s, %s, %s)
+                    """,
+                    (
+                        datetime.now().replace(microsecond=0).strftime("%Y-%m-%d %H:%M:%S"),
+                        1,
+                        ordem,
+                        quantidade,
+                        artigo,
+                    ),
+                )
+                conn.commit()
+        except Exception as e:
+            logging.error(f"Erro ao registar ordem {ordem}: {e}")
+            raise
+
+    @cronometrar(DURACAO_BD, ERROS_BD)
+    def desativar_ordens_ativas(self, ordem: Optional[str] = None):
+        """Desativa as ordens de produção ativas (todas, ou só `ordem`)"""
+        try:
+            with self.conexao("SIP") as conn:
+                cursor = conn.cursor()
+                sql = """
                     UPDATE krones_contadoreslinha
                     SET Ativo = 0
                     WHERE Ativo = 1
                     """
-                )
+                if ordem is None:
+                    cursor.execute(sql)
+                else:
+                    cursor.execute(sql + " AND Ordem = %s", (ordem,))
                 conn.commit()
         except Exception as e:
             logging.error(f"Erro ao desativar ordens ativas: {e}")
@@ -0,0 +1,231 @@
+import math
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import List, Optional, Sequence
+
+# Limites (segundos) dos histogramas de intervalos entre garrafas
+LIMITES_INTERVALOS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+class EstatisticaIncremental:
+    """Agregados de uma série inteira, atualizados em O(1) por amostra
+
+    Média e variância pelo método de Welford, mais soma, mínimo e máximo.
+    """
+
+    def __init__(self):
+        self.contagem = 0
+        self.soma = 0.0
+        self.media = 0.0
+        self._m2 = 0.0
+        self.minimo = None
+        self.maximo = None
+
+    def adicionar(self, valor: float):
+        self.contagem += 1
+        self.soma += valor
+        delta = valor - self.media
+        self.media += delta / self.contagem
+        self._m2 += delta * (valor - self.media)
+        if self.minimo is None or valor < self.minimo:
+            self.minimo = valor
+        if self.maximo is None or valor > self.maximo:
+            self.maximo = valor
+
+    @property
+    def variancia(self) -> float:
+        return self._m2 / self.contagem if self.contagem else 0.0
+
+    @property
+    def desvio(self) -> float:
+        return math.sqrt(self.variancia)
+
+
+class JanelaMovel:
+    """Agregados das últimas `tamanho` amostras, em O(1) amortizado
+
+    Soma e soma dos quadrados correntes para a média e a variância; deques
+    monótonas para o mínimo e o máximo da janela.
+    """
+
+    def __init__(self, tamanho: int):
+        self.tamanho = tamanho
+        self._valores = array("d", [0.0]) * tamanho
+        self._total = 0
+        self.soma = 0.0
+        self._soma_quadrados = 0.0
+        self._minimos = deque()  # (índice, valor), valores crescentes
+        self._maximos = deque()  # (índice, valor), valores decrescentes
+
+    def __len__(self) -> int:
+        return min(self._total, self.tamanho)
+
+    def adicionar(self, valor: float):
+        i = self._total % self.tamanho
+        if self._total >= self.tamanho:
+            antigo = self._valores[i]
+            self.soma -= antigo
+            self._soma_quadrados -= antigo * antigo
+        self._valores[i] = valor
+        self.soma += valor
+        self._soma_quadrados += valor * valor
+
+        indice = self._total
+        self._total += 1
+        while self._minimos and self._minimos[-1][1] >= valor:
+            self._minimos.pop()
+        self._minimos.append((indice, valor))
+        while self._maximos and self._maximos[-1][1] <= valor:
+            self._maximos.pop()
+        self._maximos.append((indice, valor))
+        limite = self._total - self.tamanho
+        if self._minimos[0][0] < limite:
+            self._minimos.popleft()
+        if self._maximos[0][0] < limite:
+            self._maximos.popleft()
+
+    @property
+    def media(self) -> float:
+        n = len(self)
+        return self.soma / n if n else 0.0
+
+    @property
+    def variancia(self) -> float:
+        n = len(self)
+        if not n:
+            return 0.0
+        media = self.soma / n
+        return max(self._soma_quadrados / n - media * media, 0.0)
+
+    @property
+    def minimo(self):
+        return self._minimos[0][1] if self._minimos else None
+
+    @property
+    def maximo(self):
+        return self._maximos[0][1] if self._maximos else None
+
+
+class RegistoPassagens:
+    """Instante (time.monotonic) de cada garrafa, num buffer circular
+
+    Como em SerieTemporal, cada instante é escrito em duas posições para que
+    os últimos `capacidade` instantes estejam numa fatia contígua e ordenada,
+    onde os limites de uma janela se encontram por pesquisa binária. Registar
+    uma garrafa é O(1) e não aloca memória.
+
+    Os leitores de outras threads passam `ate` (o `total` publicado no
+    snapshot): só veem as garrafas registadas até aí, como as séries com
+    `seq`.
+    """
+
+    def __init__(self, capacidade: int = 8192):
+        self.capacidade = capacidade
+        self._instantes = array("d", [0.0]) * (2 * capacidade)
+        self.total = 0
+
+    def __len__(self) -> int:
+        return min(self.total, self.capacidade)
+
+    def registar(self, instante: float):
+        i = self.total % self.capacidade
+        self._instantes[i] = self._instantes[i + self.capacidade] = instante
+        self.total += 1
+
+    def instantes(self, ate: Optional[int] = None) -> memoryview:
+        """Instantes em memória, do mais antigo ao mais recente (até à garrafa `ate`)"""
+        total = self.total
+        fim = total if ate is None else min(ate, total)
+        # As posições já reutilizadas por garrafas depois de `ate` ficam de fora
+        inicio = max(total - self.capacidade, 0)
+        if inicio >= fim:
+            return memoryview(self._instantes)[0:0]
+        i = inicio % self.capacidade
+        return memoryview(self._instantes)[i : i + fim - inicio]
+
+    @property
+    def ultimo(self) -> Optional[float]:
+        return self._instantes[(self.total - 1) % self.capacidade] if self.total else None
+
+    def contar(self, desde: float, ate: Optional[int] = None) -> int:
+        """Garrafas registadas depois de `desde`"""
+        instantes = self.instantes(ate)
+        return len(instantes) - bisect_right(instantes, desde)
+
+    def taxa(self, janela: float, agora: Optional[float] = None, ate: Optional[int] = None) -> float:
+        """Garrafas/hora exatas nos últimos `janela` segundos
+
+        Se o buffer já não tiver o início da janela, a taxa é calculada só
+        sobre o intervalo que ainda está em memória.
+        """
+        agora = time.monotonic() if agora is None else agora
+        desde = agora - janela
+        instantes = self.instantes(ate)
+        if self.total > self.capacidade and len(instantes):
+            desde = max(desde, instantes[0])
+        if agora <= desde:
+            return 0.0
+        return (len(instantes) - bisect_right(instantes, desde)) * 3600 / (agora - desde)
+
+    def taxa_instantanea(
+        self, agora: Optional[float] = None, amostras: int = 10, ate: Optional[int] = None
+    ) -> float:
+        """Garrafas/hora a partir dos últimos `amostras` intervalos
+
+        Se a linha parar, o tempo desde a última garrafa passa a contar e a
+        taxa desce de imediato, sem esperar por novas garrafas.
+        """
+        instantes = self.instantes(ate)
+        n = min(amostras, len(instantes) - 1)
+        if n < 1:
+            return 0.0
+        agora = time.monotonic() if agora is None else agora
+        duracao = max(instantes[-1] - instantes[-1 - n], agora - instantes[-n])
+        return n * 3600 / duracao if duracao > 0 else 0.0
+
+    def intervalos(
+        self,
+        janela: float,
+        limites: Sequence[float],
+        agora: Optional[float] = None,
+        ate: Optional[int] = None,
+    ) -> List[int]:
+        """Histograma dos intervalos entre garrafas nos últimos `janela` segundos
+
+        Devolve uma contagem por limite (intervalo <= limite) e uma última
+        para os intervalos maiores que o último limite.
+        """
+        agora = time.monotonic() if agora is None else agora
+        instantes = self.instantes(ate)
+        contagens = [0] * (len(limites) + 1)
+        inicio = max(bisect_left(instantes, agora - janela), 1)
+        for k in range(inicio, len(instantes)):
+            contagens[bisect_left(limites, instantes[k] - instantes[k - 1])] += 1
+        return contagens
+
+
+class EstatisticasGFA:
+    """Agregados da GFA de uma ordem, mantidos a cada tick de estatísticas"""
+
+    def __init__(self, janela_media: int = 10, janela_longa: int = 60):
+        self.ordem = EstatisticaIncremental()  # Desde o início da ordem
+        self.media_movel = JanelaMovel(janela_media)  # Série "Media" (últimos 10 ticks)
+        self.janela_longa = JanelaMovel(janela_longa)  # Últimos 10 minutos
+
+    def adicionar(self, gfa: float):
+        self.ordem.adicionar(gfa)
+        self.media_movel.adicionar(gfa)
+        self.janela_longa.adicionar(gfa)
+
+    def resumo(self) -> dict:
+        return {
+            "media_ordem": round(self.ordem.media),
+            "minimo": self.ordem.minimo or 0,
+            "maximo": self.ordem.maximo or 0,
+            "desvio": round(self.ordem.desvio, 1),
+            "media_10min": round(self.janela_longa.media),
+            "minimo_10min": self.janela_longa.minimo or 0,
+            "maximo_10min": self.janela_longa.maximo or 0,
+        }
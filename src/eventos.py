@@ -0,0 +1,74 @@
+import threading
+from collections import deque
+from typing import Any, Dict, List, Tuple
+
+
+class Subscricao:
+    """Buffer de envio de um cliente ligado ao stream
+
+    Eventos coalescíveis (por exemplo a contagem) guardam só o último valor
+    de cada tipo; os restantes entram numa fila limitada que, se o cliente
+    não acompanhar, perde os mais antigos em vez de bloquear quem publica.
+    """
+
+    def __init__(self, tamanho_buffer: int):
+        self._cond = threading.Condition(threading.Lock())
+        self._fila = deque(maxlen=tamanho_buffer)
+        self._coalescidos: Dict[str, Any] = {}
+        self.perdidos = 0
+
+    def _entregar(self, tipo: str, dados: Any, coalescer: bool):
+        with self._cond:
+            if coalescer:
+                self._coalescidos[tipo] = dados
+            else:
+                if len(self._fila) == self._fila.maxlen:
+                    self.perdidos += 1
+                self._fila.append((tipo, dados))
+            self._cond.notify()
+
+    def proximos(self, timeout: float) -> List[Tuple[str, Any]]:
+        """Espera até `timeout` segundos e devolve os eventos pendentes"""
+        with self._cond:
+            if not self._fila and not self._coalescidos:
+                self._cond.wait(timeout)
+            eventos = list(self._fila)
+            eventos.extend(self._coalescidos.items())
+            self._fila.clear()
+            self._coalescidos = {}
+            if self.perdidos:
+                eventos.append(("perdidos", {"eventos": self.perdidos}))
+                self.perdidos = 0
+            return eventos
+
+
+class Difusor:
+    """Difunde os eventos do contador para os clientes do stream (SSE)
+
+    `publicar` nunca bloqueia à espera de um cliente: só escreve no buffer de
+    cada subscrição, e cada ligação envia o seu buffer na sua própria thread.
+    """
+
+    def __init__(self, tamanho_buffer: int = 256):
+        self.tamanho_buffer = tamanho_buffer
+        self._lock = threading.Lock()
+        self._subscricoes: Tuple[Subscricao, ...] = ()
+
+    @property
+    def clientes(self) -> int:
+        return len(self._subscricoes)
+
+    def subscrever(self) -> Subscricao:
+        subscricao = Subscricao(self.tamanho_buffer)
+        with self._lock:
+            self._subscricoes = self._subscricoes + (subscricao,)
+        return subscricao
+
+    def cancelar(self, subscricao: Subscricao):
+        with self._lock:
+            self._subscricoes = tuple(s for s in self._subscricoes if s is not subscricao)
+
+    def publicar(self, tipo: str, dados: Any, coalescer: bool = False):
+        """Publica um evento para todos os clientes ligados"""
+        for subscricao in self._subscricoes:  # Tuplo imutável: lido sem lock
+            subscricao._entregar(tipo, dados, coalescer)
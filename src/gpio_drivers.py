@@ -0,0 +1,297 @@
+import logging
+import random
+import threading
+import time
+
+
+class GPIODriver:
+    """Interface dos drivers de hardware usados pelo GPIOHandler"""
+
+    def __init__(self, counter_pin: int, door_pin: int):
+        self.counter_pin = counter_pin
+        self.door_pin = door_pin
+        self.door_state = 0  # 0: Fechado, 1: Aberto
+
+    def read_counter(self) -> bool:
+        """Lê o estado do sensor de contagem"""
+        raise NotImplementedError
+
+    def set_door(self, state: bool):
+        """Aciona a porta/pistão"""
+        raise NotImplementedError
+
+    def enable_edge_events(self, callback):
+        """Ativa a deteção dos dois flancos; callback(instante, nivel)"""
+        raise NotImplementedError
+
+    def disable_edge_events(self):
+        """Desativa a deteção de flancos"""
+        raise NotImplementedError
+
+    def cleanup(self):
+        """Liberta os recursos do driver"""
+
+
+class RPiGPIODriver(GPIODriver):
+    """Driver real sobre RPi.GPIO
+
+    O RPi.GPIO não diz se um flanco é de subida ou de descida, e o callback
+    corre numa thread, às vezes depois de o pino já ter mudado outra vez. O
+    nível de cada flanco é por isso deduzido por alternância a partir de um
+    nível conhecido. Depois de uma pausa de RESSINCRONIZAR segundos sem
+    flancos, o nível lido no callback anterior já era o nível estável, e a
+    alternância recomeça a partir dele (um flanco perdido não desalinha a
+    contagem para sempre).
+
+    O instante e o nível são uma aproximação feita no espaço do utilizador:
+    para os flancos com o instante e o tipo dados pelo kernel, usar o
+    GpiodDriver (GPIO_DRIVER=gpiod).
+    """
+
+    RESSINCRONIZAR = 0.5  # Segundos sem flancos, muito acima do atraso de um callback
+
+    def __init__(self, counter_pin: int, door_pin: int):
+        super().__init__(counter_pin, door_pin)
+        import RPi.GPIO as GPIO  # Só existe no Raspberry Pi
+
+        self._gpio = GPIO
+        self._nivel = False  # Nível depois do último flanco (deduzido)
+        self._lido = False  # Nível lido no último callback
+        self._ultimo_flanco = 0.0
+        self._setup_gpio()
+
+    def _setup_gpio(self):
+        """Configura os pinos GPIO"""
+        GPIO = self._gpio
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)  # Desativa avisos
+
+        # Configura pinos
+        GPIO.setup(self.door_pin, GPIO.OUT)
+        GPIO.setup(self.counter_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+        # Garante que a porta começa fechada
+        GPIO.output(self.door_pin, GPIO.LOW)
+
+    def read_counter(self) -> bool:
+        return self._gpio.input(self.counter_pin)
+
+    def set_door(self, state: bool):
+        self._gpio.output(self.door_pin, self._gpio.HIGH if state else self._gpio.LOW)
+        self.door_state = 1 if state else 0
+
+    def enable_edge_events(self, callback):
+        self._nivel = self._lido = bool(self._gpio.input(self.counter_pin))
+        self._ultimo_flanco = time.monotonic()
+
+        def ao_flanco(canal):
+            instante = time.monotonic()
+            if instante - self._ultimo_flanco > self.RESSINCRONIZAR:
+                self._nivel = not self._lido
+            else:
+                self._nivel = not self._nivel
+            self._lido = bool(self._gpio.input(canal))
+            self._ultimo_flanco = instante
+            callback(instante, self._nivel)
+
+        self._gpio.add_event_detect(self.counter_pin, self._gpio.BOTH, callback=ao_flanco)
+
+    def disable_edge_events(self):
+        self._gpio.remove_event_detect(self.counter_pin)
+
+    def cleanup(self):
+        # Só os pinos deste driver: noutras linhas do mesmo processo continuam em uso
+        self._gpio.cleanup((self.counter_pin, self.door_pin))
+
+
+class GpiodDriver(GPIODriver):
+    """Driver real sobre o libgpiod (módulo `gpiod`, API 2)
+
+    Os flancos vêm do kernel com o tipo (subida ou descida) e o instante em
+    CLOCK_MONOTONIC, o mesmo relógio do `time.monotonic()`: o nível e o
+    instante de cada flanco não dependem de quando a thread os lê.
+    """
+
+    def __init__(self, counter_pin: int, door_pin: int, chip: str = "/dev/gpiochip0"):
+        super().__init__(counter_pin, door_pin)
+        import gpiod  # Só existe no Raspberry Pi (pip install gpiod)
+        from gpiod.line import Bias, Direction, Edge, Value
+
+        self._gpiod = gpiod
+        self._ativo = Value.ACTIVE
+        self._inativo = Value.INACTIVE
+        # A porta começa fechada; o sensor tem pull-up, como no RPi.GPIO
+        self._pedido = gpiod.request_lines(
+            chip,
+            consumer="contador",
+            config={
+                counter_pin: gpiod.LineSettings(
+                    direction=Direction.INPUT, bias=Bias.PULL_UP, edge_detection=Edge.BOTH
+                ),
+                door_pin: gpiod.LineSettings(
+                    direction=Direction.OUTPUT, output_value=Value.INACTIVE
+                ),
+            },
+        )
+        self._callback = None
+        self._thread = None
+
+    def read_counter(self) -> bool:
+        return self._pedido.get_value(self.counter_pin) == self._ativo
+
+    def set_door(self, state: bool):
+        self._pedido.set_value(self.door_pin, self._ativo if state else self._inativo)
+        self.door_state = 1 if state else 0
+
+    def enable_edge_events(self, callback):
+        # Os flancos de quando estava desativado já não interessam
+        while self._pedido.wait_edge_events(0):
+            self._pedido.read_edge_events()
+        self._callback = callback
+        self._thread = threading.Thread(target=self._flancos_loop, daemon=True)
+        self._thread.start()
+
+    def disable_edge_events(self):
+        self._callback = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def cleanup(self):
+        self.disable_edge_events()
+        self._pedido.release()
+
+    def _flancos_loop(self):
+        subida = self._gpiod.EdgeEvent.Type.RISING_EDGE
+        while self._callback is not None:
+            if not self._pedido.wait_edge_events(0.5):
+                continue
+            for evento in self._pedido.read_edge_events():
+                callback = self._callback
+                if callback is None:
+                    return
+                try:
+                    callback(evento.timestamp_ns / 1e9, evento.event_type == subida)
+                except Exception as e:
+                    logging.error(f"Erro no callback de flanco: {e}")
+
+
+class SimulatedGPIODriver(GPIODriver):
+    """Driver simulado que gera um trem de pulsos no sensor de contagem
+
+    Os pulsos só passam com a porta aberta, como na linha real. O intervalo
+    entre garrafas varia com `jitter` (fração do intervalo nominal) e, se
+    `paragem_intervalo` > 0, a linha pára `paragem_duracao` segundos a cada
+    `paragem_intervalo` segundos de produção. Uma fração `ressalto` dos
+    pulsos é seguida de um ressalto (um pulso curto de 0,5 ms) logo depois
+    do flanco descendente, como um sensor com ressaltos.
+    """
+
+    def __init__(
+        self,
+        counter_pin: int,
+        door_pin: int,
+        taxa: float = 6000,
+        largura: float = 0.02,
+        jitter: float = 0.1,
+        paragem_intervalo: float = 0,
+        paragem_duracao: float = 0,
+        ressalto: float = 0,
+        seed=None,
+    ):
+        super().__init__(counter_pin, door_pin)
+        self.taxa = taxa  # garrafas/hora
+        self.largura = largura  # segundos em nível alto
+        self.jitter = jitter
+        self.paragem_intervalo = paragem_intervalo
+        self.paragem_duracao = paragem_duracao
+        self.ressalto = ressalto
+        self.ressaltos_gerados = 0
+        self.pulsos_gerados = 0  # Flancos ascendentes produzidos (valor esperado)
+        self._random = random.Random(seed)
+        self._nivel = False
+        self._callback = None
+        self._porta = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._gerador_loop, daemon=True)
+        self._thread.start()
+
+    def read_counter(self) -> bool:
+        return self._nivel
+
+    def set_door(self, state: bool):
+        self.door_state = 1 if state else 0
+        if state:
+            self._porta.set()
+        else:
+            self._porta.clear()
+
+    def enable_edge_events(self, callback):
+        self._callback = callback
+
+    def disable_edge_events(self):
+        self._callback = None
+
+    def cleanup(self):
+        self._running = False
+        self._porta.set()
+        self._thread.join()
+
+    def _proximo_intervalo(self) -> float:
+        intervalo = 3600.0 / self.taxa
+        if self.jitter:
+            intervalo *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        return max(intervalo, self.largura * 2)
+
+    def _dormir_ate(self, instante: float):
+        restante = instante - time.monotonic()
+        if restante > 0:
+            time.sleep(restante)
+
+    def _gerador_loop(self):
+        """Produz os flancos agendados enquanto a porta estiver aberta"""
+        proximo = None
+        inicio_producao = None
+        while self._running:
+            if not self._porta.is_set():
+                self._nivel = False
+                proximo = None
+                self._porta.wait()
+                continue
+
+            agora = time.monotonic()
+            if proximo is None:
+                proximo = agora + self._proximo_intervalo()
+                inicio_producao = agora
+
+            if self.paragem_intervalo > 0 and proximo - inicio_producao >= self.paragem_intervalo:
+                # Paragem da linha: empurra a próxima garrafa para depois da paragem
+                proximo += self.paragem_duracao
+                inicio_producao = proximo
+
+            self._dormir_ate(proximo)
+            if not self._running or not self._porta.is_set():
+                continue
+
+            self.pulsos_gerados += 1
+            self._flanco(proximo, True)
+            self._dormir_ate(proximo + self.largura)
+            self._flanco(proximo + self.largura, False)
+            if self.ressalto and self._random.random() < self.ressalto:
+                self.ressaltos_gerados += 1
+                fim = proximo + self.largura
+                self._dormir_ate(fim + 0.0005)
+                self._flanco(fim + 0.0005, True)
+                self._dormir_ate(fim + 0.001)
+                self._flanco(fim + 0.001, False)
+            proximo += self._proximo_intervalo()
+
+    def _flanco(self, instante: float, nivel: bool):
+        self._nivel = nivel
+        callback = self._callback
+        if callback is not None:
+            try:
+                callback(instante, nivel)
+            except Exception as e:
+                logging.error(f"Erro no callback do simulador: {e}")
+
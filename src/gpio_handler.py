@@ -1,38 +1,99 @@
 import logging
-import RPi.GPIO as GPIO
-from .config import gpio_config
+from typing import Optional
+from .config import gpio_config, simulador_config
+from .gpio_drivers import GPIODriver, GpiodDriver, RPiGPIODriver, SimulatedGPIODriver
+from .metricas import metricas
 import time
 
+ACIONAMENTO_PORTA = metricas.histograma(
+    "porta_acionamento_segundos", "Duração da chamada ao driver para mover a porta"
+)
+
+
+def criar_driver(
+    nome: str, counter_pin: Optional[int] = None, door_pin: Optional[int] = None
+) -> GPIODriver:
+    """Cria o driver de hardware configurado (por padrão com os pinos do .env)"""
+    if counter_pin is None:
+        counter_pin = gpio_config.counter_pin
+    if door_pin is None:
+        door_pin = gpio_config.door_pin
+    if nome == "rpi":
+        return RPiGPIODriver(counter_pin, door_pin)
+    if nome == "gpiod":
+        return GpiodDriver(counter_pin, door_pin, gpio_config.chip)
+    if nome == "sim":
+        return SimulatedGPIODriver(
+            counter_pin,
+            door_pin,
+            taxa=simulador_config.taxa,
+            largura=simulador_config.largura,
+            jitter=simulador_config.jitter,
+            paragem_intervalo=simulador_config.paragem_intervalo,
+            paragem_duracao=simulador_config.paragem_duracao,
+            ressalto=simulador_config.ressalto,
+        )
+    raise ValueError(f"Driver GPIO desconhecido: {nome}")
 
-class GPIOHandler:
-    def __init__(self):
-        self.counter_pin = gpio_config.counter_pin
-        self.door_pin = gpio_config.door_pin
-        self.door_state = 0  # Adiciona variável para controlar o estado da porta
-        self._setup_gpio()
-        logging.info("GPIO Handler iniciado")
 
-    def _setup_gpio(self):
-        """Configura os pinos GPIO"""
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)  # Desativa avisos
+def criar_driver_linha(
+    counter_pin: Optional[int] = None, door_pin: Optional[int] = None, linha: str = "1"
+) -> GPIODriver:
+    """Driver do processo principal para uma linha
 
-        # Configura pinos
-        GPIO.setup(self.door_pin, GPIO.OUT)
-        GPIO.setup(self.counter_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    Com COUNTER_MODE=processo os pinos pertencem ao processo de contagem e
+    o driver só lhe reencaminha os comandos.
+    """
+    if gpio_config.counter_mode == "processo":
+        from .processo_contagem import DriverProcesso
 
-        # Garante que a porta começa fechada
-        GPIO.output(self.door_pin, GPIO.LOW)
+        return DriverProcesso(
+            gpio_config.driver,
+            gpio_config.counter_pin if counter_pin is None else counter_pin,
+            gpio_config.door_pin if door_pin is None else door_pin,
+            linha,
+        )
+    return criar_driver(gpio_config.driver, counter_pin, door_pin)
+
+
+class GPIOHandler:
+    def __init__(self, driver: Optional[GPIODriver] = None):
+        self._driver = driver or criar_driver_linha()
+        self.counter_pin = self._driver.counter_pin
+        self.door_pin = self._driver.door_pin
+        logging.info(f"GPIO Handler iniciado ({type(self._driver).__name__})")
+
+    @property
+    def driver(self) -> GPIODriver:
+        return self._driver
+
+    @property
+    def door_state(self) -> int:
+        """Estado da porta: 0 fechada, 1 aberta"""
+        return self._driver.door_state
 
     def read_counter(self) -> bool:
         """Lê o estado do contador"""
-        return GPIO.input(self.counter_pin)
+        return self._driver.read_counter()
+
+    def enable_edge_events(self, callback):
+        """Ativa a deteção de flancos no pino do contador
+
+        O callback recebe o instante (time.monotonic) e o nível (True no
+        flanco ascendente) de cada flanco.
+        """
+        self._driver.enable_edge_events(callback)
+
+    def disable_edge_events(self):
+        """Desativa a deteção de flancos no pino do contador"""
+        self._driver.disable_edge_events()
 
     def set_door(self, state: bool):
         """Controla a porta/pistão"""
         try:
-            GPIO.output(self.door_pin, GPIO.HIGH if state else GPIO.LOW)
-            self.door_state = 1 if state else 0  # Atualiza o estado interno
+            inicio = time.perf_counter()
+            self._driver.set_door(state)
+            ACIONAMENTO_PORTA.observar(time.perf_counter() - inicio)
             time.sleep(0.1)  # Pequeno delay para garantir a operação
         except Exception as e:
             logging.error(f"Erro ao controlar porta: {e}")
@@ -40,4 +101,4 @@ class GPIOHandler:
 
     def cleanup(self):
         """Limpa os recursos GPIO"""
-        GPIO.cleanup()
+        self._driver.cleanup()
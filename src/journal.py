@@ -0,0 +1,128 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _codificar(valor):
+    if isinstance(valor, datetime):
+        return {"__datetime__": valor.isoformat()}
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def _descodificar(objeto):
+    if "__datetime__" in objeto:
+        return datetime.fromisoformat(objeto["__datetime__"])
+    return objeto
+
+
+class JournalLocal:
+    """Registo local append-only (SQLite em modo WAL) do que vai para a base de dados
+
+    Cada amostra de contagem e cada finalização de ordem é anexada aqui antes
+    de ser enviada ao SQL Server e apagada depois do commit remoto. O que
+    ficar por enviar é reenviado quando a ligação voltar. As amostras de um
+    lote são anexadas numa só transação (um fsync por lote).
+    """
+
+    def __init__(self, caminho: Path, sincronismo: str = "FULL"):
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._fechado = False
+        self._conn = sqlite3.connect(str(caminho), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={sincronismo}")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS registos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                dados TEXT NOT NULL,
+                criado REAL NOT NULL,
+                enviado INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_registos_pendentes ON registos (enviado, id)"
+        )
+        self._conn.commit()
+
+    def anexar(self, tipo: str, dados: Dict[str, Any]) -> int:
+        """Anexa um registo e devolve o seu id"""
+        return self.anexar_lote(tipo, [dados])[0]
+
+    def anexar_lote(self, tipo: str, lista: List[Dict[str, Any]]) -> List[int]:
+        """Anexa vários registos numa só transação e devolve os seus ids"""
+        textos = [json.dumps(dados, default=_codificar) for dados in lista]
+        agora = time.time()
+        with self._lock:
+            ids = [
+                self._conn.execute(
+                    "INSERT INTO registos (tipo, dados, criado) VALUES (?, ?, ?)",
+                    (tipo, texto, agora),
+                ).lastrowid
+                for texto in textos
+            ]
+            self._conn.commit()
+        return ids
+
+    def marcar_enviados(self, ids: List[int]):
+        """Marca registos como enviados para a base de dados"""
+        ids = [i for i in ids if i is not None]
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE registos SET enviado = 1 WHERE id = ?", [(i,) for i in ids]
+            )
+            self._conn.commit()
+
+    def pendentes(
+        self, limite: int, ate_id: Optional[int] = None
+    ) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """Registos por enviar, por ordem de chegada"""
+        sql = "SELECT id, tipo, dados FROM registos WHERE enviado = 0"
+        params = []
+        if ate_id is not None:
+            sql += " AND id <= ?"
+            params.append(ate_id)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limite)
+        with self._lock:
+            linhas = self._conn.execute(sql, params).fetchall()
+        return [
+            (id_registo, tipo, json.loads(dados, object_hook=_descodificar))
+            for id_registo, tipo, dados in linhas
+        ]
+
+    def ultimo_id(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT IFNULL(MAX(id), 0) FROM registos").fetchone()[0]
+
+    def total_pendentes(self) -> int:
+        with self._lock:
+            if self._fechado:
+                return 0
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM registos WHERE enviado = 0"
+            ).fetchone()[0]
+
+    def limpar(self, ate_id: Optional[int] = None):
+        """Apaga os registos já enviados (só até `ate_id`, se indicado)"""
+        sql = "DELETE FROM registos WHERE enviado = 1"
+        params = []
+        if ate_id is not None:
+            sql += " AND id <= ?"
+            params.append(ate_id)
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def fechar(self):
+        with self._lock:
+            self._fechado = True
+            self._conn.close()
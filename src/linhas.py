@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from .checkpoint import CheckpointEstado
+from .config import (
+    checkpoint_config,
+    gpio_config,
+    persistencia_config,
+    series_config,
+    turnos_config,
+)
+from .contador import Contador
+from .contagem_backend import CicloPolling, PollingBackend
+from .gpio_handler import GPIOHandler
+from .journal import JournalLocal
+from .metricas import MetricaLoop
+from .persistencia import EscritorContagens
+from .turnos import AgendadorTurnos, Pausa
+
+
+class GestorLinhas:
+    """Várias linhas de produção num só processo (modo multi-linha)
+
+    Cada linha tem o seu Contador, com os seus pinos, estado, ordem e
+    estatísticas. A base de dados (e o seu pool de conexões), o escritor das
+    contagens, o calendário de turnos e o servidor HTTP são partilhados. Os
+    loops periódicos correm numa só thread para todas as linhas: estatísticas
+    a cada segundo e, no modo polling, a leitura dos pinos num único
+    CicloPolling. Assim uma linha a mais custa o trabalho dessa linha, sem
+    mais threads a acordar.
+    """
+
+    def __init__(
+        self,
+        db_manager,
+        escritor: Optional[EscritorContagens] = None,
+        modo_contagem: Optional[str] = None,
+        diretorio_checkpoint: Optional[Path] = None,
+    ):
+        """Com `diretorio_checkpoint` cada linha guarda o seu checkpoint em linha-<id>.bin"""
+        self.db = db_manager
+        self.diretorio_checkpoint = diretorio_checkpoint
+        self.modo_contagem = modo_contagem or gpio_config.counter_mode
+        self._escritor_proprio = escritor is None
+        self.escritor = escritor or EscritorContagens(
+            db_manager,
+            capacidade=persistencia_config.capacidade_fila,
+            lote=persistencia_config.tamanho_lote,
+            politica=persistencia_config.politica,
+            journal=JournalLocal(
+                persistencia_config.journal_path, persistencia_config.journal_sync
+            ),
+        )
+        self.ciclo_polling = CicloPolling(PollingBackend.INTERVALO)
+        self.contadores: Dict[str, Contador] = {}
+        self.turnos = (
+            AgendadorTurnos(self._evento_turno, turnos_config.caminho)
+            if turnos_config.ativo
+            else None
+        )
+        self._running = False
+        self._thread = None
+
+    def adicionar(self, linha: str, gpio_handler: GPIOHandler) -> Contador:
+        """Cria o contador de uma linha (antes de `start`)"""
+        if linha in self.contadores:
+            raise ValueError(f"Linha repetida: {linha}")
+        contador = Contador(
+            gpio_handler,
+            self.db,
+            modo_contagem=self.modo_contagem,
+            escritor=self.escritor,
+            linha=linha,
+            ciclo_polling=self.ciclo_polling,
+            diretorio_series=series_config.diretorio / f"linha-{linha}",
+            checkpoint=CheckpointEstado(
+                self.diretorio_checkpoint / f"linha-{linha}.bin", checkpoint_config.sync
+            )
+            if self.diretorio_checkpoint is not None
+            else None,
+        )
+        self.contadores[linha] = contador
+        return contador
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self.escritor.start()
+            for contador in self.contadores.values():
+                contador.start(loops=False)
+            self._thread = threading.Thread(target=self._linhas_loop, daemon=True)
+            logging.info(
+                f"Iniciando thread: {self._thread.name} ({len(self.contadores)} linhas)"
+            )
+            self._thread.start()
+            if self.turnos is not None:
+                self.turnos.start()
+
+    def stop(self):
+        self._running = False
+        if self.turnos is not None:
+            self.turnos.stop()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for contador in self.contadores.values():
+            contador.stop()
+        self.ciclo_polling.stop()
+        if self._escritor_proprio:
+            self.escritor.stop()
+
+    def _evento_turno(self, acao: str, pausa: Pausa):
+        """Pausa ou retoma todas as linhas (thread do calendário de turnos)"""
+        for linha, contador in self.contadores.items():
+            try:
+                contador.evento_turno(acao, pausa)
+            except Exception as e:
+                logging.error(f"Erro no evento de turno da linha {linha}: {e}")
+
+    def _linhas_loop(self):
+        """Estatísticas de todas as linhas"""
+        metrica = MetricaLoop("estatisticas", prazo=10)
+
+        while self._running:
+            for linha, contador in self.contadores.items():
+                try:
+                    contador.tick_estatisticas()
+                except Exception as e:
+                    # Uma linha com erro não pode parar as estatísticas das outras
+                    logging.error(f"Erro no loop da linha {linha}: {e}")
+            metrica.fim_trabalho()
+            time.sleep(1)
+            metrica.acordou(1)
+        metrica.terminar()
@@ -1,35 +1,229 @@
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
-from .config import app_config
+from typing import Any, Dict, Optional, Tuple
+from .config import app_config, log_config
+from .metricas import metricas
 
+# Atributos de um LogRecord; os restantes vêm de `extra=` e vão para o JSON
+_ATRIBUTOS_REGISTO = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+}
+_FORMATADOR_EXCECOES = logging.Formatter()
 
-def setup_logger():
-    """Configura o logger da aplicação"""
-    # Cria o diretório de logs se não existir
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
 
-    # Configura o handler de arquivo com rotação
-    file_handler = RotatingFileHandler(
-        str(app_config.log_path),
-        maxBytes=1024 * 1024,  # 1MB
-        backupCount=5,
+class FiltroRepeticoes(logging.Filter):
+    """Limita os avisos e erros repetidos a um por `janela` segundos
+
+    Registos com a mesma mensagem, do mesmo sítio do código (ficheiro e
+    linha), dentro da janela são descartados logo na thread que os emite,
+    sem chegar à fila. O primeiro registo depois da janela leva o número de
+    repetições suprimidas (na mensagem e no campo "suprimidas").
+    """
+
+    LIMITE_VISTOS = 1000  # Mensagens lembradas antes de esquecer as de janelas já fechadas
+
+    def __init__(self, janela: float, nivel: int = logging.WARNING):
+        super().__init__()
+        self.janela = janela
+        self.nivel = nivel
+        self.suprimidos = 0
+        self._lock = threading.Lock()
+        # (ficheiro, linha, mensagem) -> [início da janela, suprimidos]
+        self._vistos: Dict[Tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.nivel or self.janela <= 0:
+            return True
+        chave = (record.pathname, record.lineno, record.getMessage())
+        agora = time.monotonic()
+        with self._lock:
+            visto = self._vistos.get(chave)
+            if visto is not None and agora - visto[0] < self.janela:
+                visto[1] += 1
+                self.suprimidos += 1
+                return False
+            if len(self._vistos) >= self.LIMITE_VISTOS:
+                self._vistos = {
+                    c: v for c, v in self._vistos.items() if agora - v[0] < self.janela
+                }
+            self._vistos[chave] = [agora, 0]
+        if visto is not None and visto[1]:
+            record.suprimidas = visto[1]
+            record.msg = f"{record.msg} [{visto[1]} repetições suprimidas]"
+        return True
+
+
+class _QueueHandlerSemBloqueio(QueueHandler):
+    """QueueHandler que descarta (e conta) registos com a fila cheia
+
+    A exceção segue formatada em `exc_text`, à parte da mensagem, para o
+    formatador JSON a pôr no campo "exc".
+    """
+
+    def __init__(self, fila: queue.Queue):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _FORMATADOR_EXCECOES.formatException(record.exc_info)
+            record.exc_info = None  # O traceback não atravessa a fila
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+class FormatadorJSON(logging.Formatter):
+    """Um objeto JSON por linha: instante, nível, logger, thread, mensagem e extras
+
+    `campos` são acrescentados a todos os registos (por exemplo, o processo).
+    """
+
+    def __init__(self, campos: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.campos = campos or {}
+
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "ts": f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+            **self.campos,
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_REGISTO:
+                dados[chave] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            dados["exc"] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+def criar_formatador() -> logging.Formatter:
+    """Formatador do ficheiro de log, no formato de LOG_FORMATO"""
+    if log_config.formato == "json":
+        return FormatadorJSON()
+    return logging.Formatter(
+        "%(asctime)s;%(levelname)s;%(message)s", datefmt="%Y-%m-%d %H:%M:%S"
     )
 
-    # Configura o formato do log
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+class FormatadorCanal(logging.Formatter):
+    """Serializa um registo numa linha JSON, para outro processo o reemitir
+
+    O processo de contagem escreve assim os registos no stdout; o processo
+    principal recria-os com `registo_do_canal` e passa-os ao seu logging.
+    `campos` são acrescentados a todos os registos.
+    """
+
+    def __init__(self, campos: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.campos = campos or {}
+
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            chave: valor
+            for chave, valor in vars(record).items()
+            if chave not in ("msg", "args", "exc_info", "message")
+        }
+        dados["msg"] = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            dados["exc_text"] = self.formatException(record.exc_info)
+        dados.update(self.campos)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+def registo_do_canal(linha: bytes) -> logging.LogRecord:
+    """Recria um registo serializado por FormatadorCanal (ValueError se não for)"""
+    dados = json.loads(linha)
+    if not isinstance(dados, dict):
+        raise ValueError("Registo inválido")
+    return logging.makeLogRecord(dados)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logger() -> QueueListener:
+    """Configura o logging da aplicação sem escritas em disco nas threads que registam
+
+    As threads só põem os registos numa fila limitada (QueueHandler); uma
+    thread própria (QueueListener) escreve-os no ficheiro com rotação. Com a
+    fila cheia os registos novos são descartados e contados, em vez de
+    bloquear quem regista.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    Path(app_config.log_path).parent.mkdir(parents=True, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        str(app_config.log_path),
+        maxBytes=log_config.tamanho,
+        backupCount=log_config.ficheiros,
+        encoding="utf-8",
     )
+    formatter = criar_formatador()
     file_handler.setFormatter(formatter)
-
-    # Configura o logger root
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(file_handler)
+    handlers = [file_handler]
 
     # Também envia logs para o console em modo debug
     if app_config.debug:
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
-        root_logger.addHandler(console_handler)
+        handlers.append(console_handler)
+
+    fila = queue.Queue(maxsize=log_config.capacidade_fila)
+    queue_handler = _QueueHandlerSemBloqueio(fila)
+    repeticoes = FiltroRepeticoes(log_config.janela_repeticoes)
+    queue_handler.addFilter(repeticoes)
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(queue_handler)
+
+    _listener = QueueListener(fila, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(parar_logging)
+
+    metricas.medidor(
+        "log_registos_perdidos_total",
+        "Registos de log que não chegaram ao ficheiro, por motivo",
+        lambda: {
+            "fila_cheia": queue_handler.descartados,
+            "repetidos": repeticoes.suprimidos,
+        },
+        ("motivo",),
+        tipo="counter",
+    )
+    metricas.medidor("log_fila_profundidade", "Registos de log à espera de escrita", fila.qsize)
+    return _listener
+
+
+def parar_logging():
+    """Escreve os registos que ainda estão na fila e para a thread do logging"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
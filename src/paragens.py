@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+
+def _epoch(instante: float) -> float:
+    """Converte um instante time.monotonic para epoch"""
+    return time.time() - (time.monotonic() - instante)
+
+
+class DetetorParagens:
+    """Deteta paragens da linha pelo intervalo desde a última garrafa
+
+    Há paragem quando passam `limiar` segundos sem garrafas. O limiar é
+    `fator` intervalos nominais do artigo (3600 / cadência), com um mínimo
+    de `minimo` segundos, e por isso uma micro-paragem é sinalizada em
+    segundos. Cada garrafa só guarda o seu instante (sem locks nem
+    notificações); uma thread dorme até ao prazo da próxima paragem possível
+    e volta a dormir se entretanto passaram garrafas. A garrafa seguinte
+    termina a paragem.
+
+    Com `limite_pausa`, uma paragem que dure mais do que esses segundos
+    chama `ao_exceder` (usado para a pausa automática).
+    """
+
+    def __init__(
+        self,
+        ao_iniciar: Callable[[Dict], None],
+        ao_terminar: Callable[[Dict], None],
+        ao_exceder: Optional[Callable[[Dict], None]] = None,
+        fator: float = 5,
+        minimo: float = 2,
+        limite_pausa: float = 0,
+        historico: int = 1000,
+    ):
+        self.ao_iniciar = ao_iniciar
+        self.ao_terminar = ao_terminar
+        self.ao_exceder = ao_exceder
+        self.fator = fator
+        self.minimo = minimo
+        self.limite_pausa = limite_pausa
+        self.limiar = minimo
+        self._cond = threading.Condition()
+        self._ultimo = None  # Instante da última garrafa; None enquanto desarmado
+        self._atual: Optional[Dict] = None  # Paragem em curso
+        self._excedida = False
+        self._paragens = deque(maxlen=historico)
+        self.total = 0
+        self.tempo_parado = 0.0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._vigiar_loop, daemon=True)
+            logging.info(f"Iniciando thread: {self._thread.name}")
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def configurar(self, cadencia: float):
+        """Ajusta o limiar à cadência nominal do artigo (garrafas/hora)"""
+        intervalo = 3600 / cadencia if cadencia > 0 else 0
+        with self._cond:
+            self.limiar = max(self.minimo, self.fator * intervalo)
+            self._cond.notify()
+
+    def limpar(self):
+        """Esquece as paragens registadas (nova ordem)"""
+        with self._cond:
+            self._paragens.clear()
+            self.total = 0
+            self.tempo_parado = 0.0
+
+    def armar(self, instante: float):
+        """Começa a vigiar, contando o tempo sem garrafas a partir de `instante`"""
+        with self._cond:
+            self._ultimo = instante
+            self._cond.notify()
+
+    def desarmar(self, instante: float):
+        """Deixa de vigiar; uma paragem em curso termina em `instante`"""
+        with self._cond:
+            paragem = self._terminar(instante)
+            self._ultimo = None
+            self._cond.notify()
+        if paragem:
+            self.ao_terminar(paragem)
+
+    @property
+    def em_paragem(self) -> bool:
+        return self._atual is not None
+
+    def passagem(self, instante: float):
+        """Regista uma garrafa (chamado no caminho de contagem)"""
+        self._ultimo = instante
+        if self._atual is None:
+            return
+        with self._cond:
+            paragem = self._terminar(instante)
+            self._cond.notify()  # A thread volta a vigiar a partir desta garrafa
+        if paragem:
+            self.ao_terminar(paragem)
+
+    def historico(self) -> List[Dict]:
+        """Paragens terminadas, mais a que estiver em curso"""
+        with self._cond:
+            paragens = list(self._paragens)
+            if self._atual is not None:
+                paragens.append(dict(self._atual))
+        return paragens
+
+    def _terminar(self, instante: float) -> Optional[Dict]:
+        paragem = self._atual
+        if paragem is None:
+            return None
+        paragem["fim"] = _epoch(instante)
+        paragem["duracao"] = round(max(paragem["fim"] - paragem["inicio"], 0.0), 3)
+        self._atual = None
+        self._paragens.append(paragem)
+        self.total += 1
+        self.tempo_parado += paragem["duracao"]
+        return paragem
+
+    def _vigiar_loop(self):
+        with self._cond:
+            while self._running:
+                agora = time.monotonic()
+                if self._ultimo is None:
+                    self._cond.wait()
+                elif self._atual is None:
+                    prazo = self._ultimo + self.limiar
+                    if agora < prazo:
+                        self._cond.wait(prazo - agora)
+                        continue
+                    self._atual = {"inicio": _epoch(self._ultimo), "fim": None, "duracao": None}
+                    self._excedida = False
+                    self._chamar(self.ao_iniciar, dict(self._atual))
+                elif self.limite_pausa and self.ao_exceder and not self._excedida:
+                    prazo = self._ultimo + self.limite_pausa
+                    if agora < prazo:
+                        self._cond.wait(prazo - agora)
+                        continue
+                    self._excedida = True
+                    self._chamar(self.ao_exceder, dict(self._atual))
+                else:
+                    self._cond.wait()
+
+    def _chamar(self, callback, paragem: Dict):
+        """Chama um callback sem o lock (pode pausar o contador)"""
+        self._cond.release()
+        try:
+            callback(paragem)
+        except Exception as e:
+            logging.error(f"Erro no callback de paragem: {e}")
+        finally:
+            self._cond.acquire()
+
+
+def formatar_registo(paragem: Dict) -> Dict:
+    """Paragem no formato da API (datas locais, duração em segundos)"""
+    return {
+        "Inicio": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(paragem["inicio"])),
+        "Fim": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(paragem["fim"]))
+        if paragem["fim"] is not None
+        else None,
+        "Duracao": paragem["duracao"],
+    }
@@ -0,0 +1,325 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from .journal import JournalLocal
+
+POLITICAS = ("descartar_antigas", "descartar_novas", "bloquear")
+
+
+class EscritorContagens:
+    """Grava as contagens periódicas em segundo plano (write-behind)
+
+    As amostras entram numa fila limitada e uma thread dedicada grava-as em
+    lotes com INSERTs de várias linhas. Quando a fila enche aplica-se a
+    política configurada:
+
+    - descartar_antigas: descarta a amostra mais antiga da fila
+    - descartar_novas: descarta a amostra que está a entrar
+    - bloquear: espera até `timeout_bloqueio` segundos por espaço na fila
+
+    Com um journal local, a thread de escrita anexa cada lote ao journal,
+    numa só transação, antes de o enviar, e apaga-o do journal depois de
+    gravado; uma amostra descartada da fila e uma finalização de ordem são
+    anexadas logo. Um lote que falhe ou uma amostra descartada ficam no
+    journal e são reenviados, de forma idempotente, quando a base de dados
+    voltar a responder. Quem submete amostras nunca espera pelo disco.
+    """
+
+    def __init__(
+        self,
+        db,
+        capacidade: int = 1000,
+        lote: int = 50,
+        politica: str = "descartar_antigas",
+        timeout_bloqueio: float = 1.0,
+        journal: Optional[JournalLocal] = None,
+        intervalo_reenvio: float = 30,
+    ):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de fila desconhecida: {politica}")
+        self.db = db
+        self.lote = lote
+        self.politica = politica
+        self.timeout_bloqueio = timeout_bloqueio
+        self.journal = journal
+        self.intervalo_reenvio = intervalo_reenvio
+        self._fila = queue.Queue(maxsize=capacidade)
+        self._running = False
+        self._thread = None
+
+        # Maior id do journal que se sabe não estar na fila (falhou, foi
+        # descartado ou vem de uma execução anterior). Só esses são reenviados.
+        self._lock_reenvio = threading.Lock()
+        self._limite_reenvio = journal.ultimo_id() if journal else 0
+        # Há registos por reenviar: a thread de escrita verifica-o a cada volta
+        self._reenvio = threading.Event()
+        if self._limite_reenvio:
+            self._reenvio.set()
+
+        # Métricas
+        self.amostras_gravadas = 0
+        self.lotes_gravados = 0
+        self.reenviadas = 0
+        self.descartadas = 0
+        self.erros = 0
+        self.ultima_latencia = 0.0
+        self.latencia_maxima = 0.0
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._escrita_loop, daemon=True)
+            logging.info(f"Iniciando thread: {self._thread.name}")
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Pára a thread de escrita, tentando gravar o que ficou na fila"""
+        if self._running:
+            self._running = False
+            try:
+                self._fila.put_nowait(None)  # Acorda a thread
+            except queue.Full:
+                pass  # Com a fila cheia a thread não está parada à espera
+            self._thread.join(timeout)
+            if self.journal is not None and not self._thread.is_alive():
+                self.journal.fechar()
+
+    def _por_reenviar(self, id_registo: Optional[int], acordar: bool = True):
+        """Marca os registos do journal até `id_registo` para reenvio
+
+        Com `acordar`, acorda a thread de escrita se estiver parada à espera
+        de amostras (uma finalização falhada ou uma amostra descartada não
+        passam pela fila).
+        """
+        if id_registo is None:
+            return
+        with self._lock_reenvio:
+            self._limite_reenvio = max(self._limite_reenvio, id_registo)
+        self._reenvio.set()
+        if acordar:
+            try:
+                self._fila.put_nowait(None)
+            except queue.Full:
+                pass  # Com a fila cheia a thread não está parada à espera
+
+    def _anexar(self, tipo: str, dados: Dict[str, Any]) -> Optional[int]:
+        if self.journal is None:
+            return None
+        try:
+            return self.journal.anexar(tipo, dados)
+        except Exception as e:
+            logging.error(f"Erro ao anexar ao journal local: {e}")
+            return None
+
+    def _anexar_lote(self, amostras: List[Dict[str, Any]]) -> List[tuple]:
+        """(id no journal, amostra) de cada amostra do lote, anexadas de uma vez"""
+        ids = [None] * len(amostras)
+        if self.journal is not None and amostras:
+            try:
+                ids = self.journal.anexar_lote("contagem", amostras)
+            except Exception as e:
+                logging.error(f"Erro ao anexar lote ao journal local: {e}")
+        return list(zip(ids, amostras))
+
+    def submeter(self, amostra: Dict[str, Any]) -> bool:
+        """Coloca uma amostra na fila sem bloquear o chamador
+
+        Devolve False se a amostra foi descartada da fila (vai para o
+        journal, se existir).
+        """
+        try:
+            if self.politica == "bloquear":
+                self._fila.put(amostra, timeout=self.timeout_bloqueio)
+            else:
+                self._fila.put_nowait(amostra)
+            return True
+        except queue.Full:
+            pass
+
+        if self.politica == "descartar_antigas":
+            try:
+                descartado = self._fila.get_nowait()
+                self._fila.put_nowait(amostra)
+                self.descartadas += 1
+                if descartado is not None:
+                    self._por_reenviar(self._anexar("contagem", descartado))
+                logging.warning("Fila de gravação cheia - amostra mais antiga descartada")
+                return True
+            except (queue.Empty, queue.Full):
+                pass
+        self.descartadas += 1
+        self._por_reenviar(self._anexar("contagem", amostra))
+        logging.warning("Fila de gravação cheia - amostra descartada")
+        return False
+
+    def finalizar(self, ordem: str, stats: Dict[str, Any]):
+        """Grava a finalização de uma ordem
+
+        É feita logo, na thread do chamador. Se falhar e houver journal,
+        fica registada para reenvio e a exceção não é propagada.
+        """
+        id_registo = self._anexar("finalizacao", {"ordem": ordem, "stats": stats})
+        try:
+            self.db.gravar_estatisticas(ordem, stats)
+        except Exception:
+            self.erros += 1
+            if id_registo is None:
+                raise
+            self._por_reenviar(id_registo)
+            logging.warning(f"Finalização da ordem {ordem} guardada no journal local")
+            return
+        if id_registo is not None:
+            self.journal.marcar_enviados([id_registo])
+
+    @property
+    def profundidade(self) -> int:
+        return self._fila.qsize()
+
+    def estado(self) -> Dict[str, Any]:
+        """Métricas da fila de gravação"""
+        return {
+            "profundidade": self._fila.qsize(),
+            "capacidade": self._fila.maxsize,
+            "politica": self.politica,
+            "amostras_gravadas": self.amostras_gravadas,
+            "lotes_gravados": self.lotes_gravados,
+            "reenviadas": self.reenviadas,
+            "descartadas": self.descartadas,
+            "erros": self.erros,
+            "ultima_latencia": self.ultima_latencia,
+            "latencia_maxima": self.latencia_maxima,
+            "journal_pendentes": self.journal.total_pendentes() if self.journal else 0,
+        }
+
+    def _proximo_lote(self, timeout: Optional[float]):
+        """Espera pela primeira amostra, junta as que já estiverem na fila e
+        anexa-as ao journal"""
+        try:
+            primeira = self._fila.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        lote = [] if primeira is None else [primeira]
+        while len(lote) < self.lote:
+            try:
+                item = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                lote.append(item)
+        return self._anexar_lote(lote)
+
+    def _gravar_lote(self, lote) -> bool:
+        inicio = time.monotonic()
+        try:
+            self.db.gravar_contagens([amostra for _, amostra in lote])
+        except Exception as e:
+            self.erros += 1
+            logging.error(f"Erro ao gravar lote de {len(lote)} contagens: {e}")
+            return False
+
+        self.ultima_latencia = time.monotonic() - inicio
+        self.latencia_maxima = max(self.latencia_maxima, self.ultima_latencia)
+        self.amostras_gravadas += len(lote)
+        self.lotes_gravados += 1
+        if self.journal is not None:
+            try:
+                ids = [id_registo for id_registo, _ in lote if id_registo is not None]
+                self.journal.marcar_enviados(ids)
+                if ids:
+                    self.journal.limpar(max(ids))
+            except Exception as e:
+                logging.error(f"Erro ao limpar o journal local: {e}")
+        return True
+
+    def _reenviar(self) -> bool:
+        """Reenvia do journal o que ficou por gravar, em lotes
+
+        Só corre com a fila vazia, para não competir com as amostras novas.
+        Devolve True quando já não há nada por reenviar.
+        """
+        while self._fila.empty():
+            with self._lock_reenvio:
+                limite = self._limite_reenvio
+            registos = self.journal.pendentes(self.lote, ate_id=limite)
+            if not registos:
+                self.journal.limpar()
+                return True
+
+            # Contagens seguidas vão num só lote; finalizações uma a uma, por ordem
+            contagens = []
+            try:
+                for id_registo, tipo, dados in registos:
+                    if tipo == "contagem":
+                        contagens.append((id_registo, dados))
+                        continue
+                    self._reenviar_contagens(contagens)
+                    contagens = []
+                    self.db.gravar_estatisticas(dados["ordem"], dados["stats"])
+                    self.journal.marcar_enviados([id_registo])
+                    self.reenviadas += 1
+                self._reenviar_contagens(contagens)
+            except Exception as e:
+                self.erros += 1
+                logging.error(f"Erro ao reenviar registos do journal: {e}")
+                return False
+        return False
+
+    def _reenviar_contagens(self, contagens):
+        if contagens:
+            self.db.gravar_contagens(
+                [amostra for _, amostra in contagens], idempotente=True
+            )
+            self.journal.marcar_enviados([id_registo for id_registo, _ in contagens])
+            self.reenviadas += len(contagens)
+
+    def _reenvio_pedido(self) -> bool:
+        """Consome o pedido de reenvio feito por `_por_reenviar`"""
+        if self._reenvio.is_set():
+            self._reenvio.clear()
+            return True
+        return False
+
+    def _escrita_loop(self):
+        """Loop de escrita em lotes
+
+        Sem journal, um lote que falhe é repetido com recuo exponencial.
+        Com journal, o lote fica no journal e a thread passa a acordar a cada
+        `intervalo_reenvio` segundos para o reenviar.
+        """
+        pendente = []
+        espera = 1.0
+        reenvio_pendente = False
+        while self._running or pendente or not self._fila.empty():
+            reenvio_pendente = self._reenvio_pedido() or reenvio_pendente
+            if not pendente:
+                timeout = self.intervalo_reenvio if reenvio_pendente else None
+                pendente = self._proximo_lote(timeout if self._running else 0)
+                # O pedido pode ter chegado durante a espera
+                reenvio_pendente = self._reenvio_pedido() or reenvio_pendente
+                if not pendente:
+                    if reenvio_pendente and self._running:
+                        reenvio_pendente = not self._reenviar()
+                    continue
+
+            if self._gravar_lote(pendente):
+                pendente = []
+                espera = 1.0
+                if reenvio_pendente and self._running:
+                    # A base de dados voltou: aproveita para esvaziar o journal
+                    reenvio_pendente = not self._reenviar()
+                continue
+
+            if self.journal is not None:
+                self._por_reenviar(
+                    max(id_registo or 0 for id_registo, _ in pendente), acordar=False
+                )
+                reenvio_pendente = True
+                pendente = []
+                continue
+
+            if not self._running:
+                break  # A terminar: não insiste com a base de dados em baixo
+            time.sleep(espera)
+            espera = min(espera * 2, 30)
@@ -0,0 +1,518 @@
+import argparse
+import gc
+import logging
+import mmap
+import os
+import select
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+from .config import log_config, processo_config
+from .contagem_backend import ATRASO_FLANCO, ContagemBackend, criar_backend
+from .gpio_drivers import GPIODriver
+from .gpio_handler import GPIOHandler, criar_driver
+from .logger import FormatadorCanal, registo_do_canal
+from .metricas import MetricaLoop
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+CABECALHO = 128  # bytes: até dezasseis campos de 64 bits
+_SEQ, _TOTAL, _CURTOS, _PROXIMOS, _PORTA, _ARMADO = range(6)
+_BATIMENTO = 6  # índice na vista float64 do cabeçalho
+_SIMULADOS = 7  # Pulsos gerados pelo driver simulado (0 com o driver real)
+_SOMA = 8  # Soma de controlo de seq e dos campos 1 a 7
+_MASCARA = (1 << 64) - 1
+_PESOS = tuple(2 * i + 0x9E3779B97F4A7C15 for i in range(_SOMA))  # Ímpares e distintos
+_BITS = struct.Struct("Q")
+_REAL = struct.Struct("d")
+
+
+def _soma(valores) -> int:
+    """Soma de controlo de uma lista de inteiros de 64 bits"""
+    soma = 0
+    for peso, valor in zip(_PESOS, valores):
+        soma = (soma * 31 + peso * (valor + 1)) & _MASCARA
+    return soma
+
+
+def _marca(indice: int, bits: int) -> int:
+    """Marca de uma posição do buffer: o índice da garrafa misturado com o instante"""
+    return (bits ^ (indice * _PESOS[0])) & _MASCARA
+
+
+class BlocoContagem:
+    """Bloco de memória partilhada entre o processo de contagem e o principal
+
+    Cabeçalho com o total de garrafas, os pulsos rejeitados, a porta, se a
+    contagem está armada e o último batimento do processo de contagem,
+    seguido de um buffer circular com o instante (time.monotonic, comum aos
+    dois processos) de cada garrafa. Só o processo de contagem escreve, com
+    um seqlock: `seq` é ímpar durante uma escrita e o leitor repete a
+    leitura se `seq` mudou entretanto.
+
+    As escritas no mmap não têm barreiras de memória: num ARM o outro
+    processo pode vê-las por outra ordem, e um campo de 64 bits pode chegar
+    em duas metades num Raspberry Pi de 32 bits. Por isso o cabeçalho leva
+    uma soma de controlo e cada instante uma marca (o índice da garrafa
+    misturado com o instante); o leitor só aceita o que confere, e o que
+    não confere volta a ser lido.
+    """
+
+    def __init__(self, caminho: Path, capacidade: int, criar: bool = False):
+        self.caminho = Path(caminho)
+        self.capacidade = capacidade
+        tamanho = CABECALHO + 16 * capacidade  # Instante e marca de cada garrafa
+        if criar:
+            with open(self.caminho, "wb") as ficheiro:
+                ficheiro.truncate(tamanho)
+        self._ficheiro = open(self.caminho, "r+b")
+        self._mmap = mmap.mmap(self._ficheiro.fileno(), tamanho)
+        vista = memoryview(self._mmap)
+        self._inteiros = vista[:CABECALHO].cast("Q")
+        self._reais = vista[:CABECALHO].cast("d")
+        self._instantes = vista[CABECALHO:].cast("Q")  # Pares (instante, marca)
+        self._vista = vista
+        if criar:
+            self._inteiros[_SEQ] = 1
+            self._selar()
+        elif self._inteiros[_SEQ] & 1:
+            self._selar()  # Escrita interrompida por um processo anterior
+
+    # Escrita (só no processo de contagem, com o lock do escritor)
+
+    def _selar(self):
+        """Termina uma escrita: soma de controlo e `seq` outra vez par"""
+        inteiros = self._inteiros
+        seq = inteiros[_SEQ] + 1
+        inteiros[_SOMA] = _soma((seq, *inteiros[_TOTAL:_SOMA]))
+        inteiros[_SEQ] = seq
+
+    def publicar_garrafa(self, instante: float):
+        inteiros = self._inteiros
+        total = inteiros[_TOTAL]
+        inteiros[_SEQ] += 1
+        posicao = 2 * (total % self.capacidade)
+        bits = _BITS.unpack(_REAL.pack(instante))[0]
+        self._instantes[posicao] = bits
+        self._instantes[posicao + 1] = _marca(total, bits)
+        inteiros[_TOTAL] = total + 1
+        self._selar()
+
+    def publicar_estado(
+        self, curtos: int, proximos: int, porta: int, armado: bool, simulados: int = 0
+    ):
+        inteiros = self._inteiros
+        inteiros[_SEQ] += 1
+        inteiros[_CURTOS] = curtos
+        inteiros[_PROXIMOS] = proximos
+        inteiros[_PORTA] = porta
+        inteiros[_ARMADO] = int(armado)
+        self._reais[_BATIMENTO] = time.monotonic()
+        inteiros[_SIMULADOS] = simulados
+        self._selar()
+
+    # Leitura (processo principal)
+
+    def ler(self) -> Optional[Tuple[int, int, int, int, int, float, int]]:
+        """(total, curtos, proximos, porta, armado, batimento, simulados)
+
+        Devolve None se o escritor não largar o seqlock.
+        """
+        inteiros = self._inteiros
+        for _ in range(1000):
+            seq = inteiros[_SEQ]
+            if seq & 1:
+                continue
+            campos = tuple(inteiros[_TOTAL:_SOMA])
+            soma = inteiros[_SOMA]
+            if inteiros[_SEQ] == seq and soma == _soma((seq, *campos)):
+                batimento = _REAL.unpack(_BITS.pack(campos[_BATIMENTO - 1]))[0]
+                return campos[: _BATIMENTO - 1] + (batimento, campos[_SIMULADOS - 1])
+        return None
+
+    @property
+    def total(self) -> int:
+        valores = self.ler()
+        return valores[0] if valores else 0
+
+    def instantes(self, desde: int, ate: int) -> List[float]:
+        """Instantes das garrafas [desde, ate) que ainda estão no buffer
+
+        As que já foram substituídas (leitor atrasado mais de `capacidade`
+        garrafas) ficam com o instante da mais antiga disponível. Pára na
+        primeira cuja marca ainda não confere: a lista pode ser mais curta
+        e as restantes ficam para a leitura seguinte.
+        """
+        perdidas = max(ate - desde - self.capacidade, 0)
+        desde += perdidas
+        buffer = self._instantes
+        instantes = []
+        for indice in range(desde, ate):
+            posicao = 2 * (indice % self.capacidade)
+            bits = buffer[posicao]
+            if buffer[posicao + 1] != _marca(indice, bits):
+                break
+            instantes.append(_REAL.unpack(_BITS.pack(bits))[0])
+        if perdidas and instantes:
+            logging.warning(f"Leitura do bloco atrasada: {perdidas} instantes aproximados")
+            instantes = [instantes[0]] * perdidas + instantes
+        return instantes
+
+    def fechar(self):
+        for vista in (self._inteiros, self._reais, self._instantes, self._vista):
+            vista.release()
+        self._mmap.close()
+        self._ficheiro.close()
+
+
+class DriverProcesso(GPIODriver):
+    """Driver do processo principal quando a contagem corre num processo à parte
+
+    Lança o processo de contagem, dono dos pinos (com o driver `driver`,
+    'rpi', 'gpiod' ou 'sim'), e reencaminha-lhe os comandos. A porta só é dada como
+    movida quando o processo de contagem a confirma no bloco partilhado.
+    """
+
+    def __init__(self, driver: str, counter_pin: int, door_pin: int, linha: str = "1"):
+        super().__init__(counter_pin, door_pin)
+        self.driver = driver
+        self.linha = linha
+        self.reinicios = 0
+        diretorio = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+        self.bloco = BlocoContagem(
+            diretorio / f"contador-{os.getpid()}-{linha}", processo_config.capacidade, criar=True
+        )
+        # Estado pedido, reposto se o processo de contagem tiver de ser reiniciado
+        self._porta = False
+        self._armado = False
+        self._cadencia = None
+        self._lock = threading.RLock()
+        self._proc = None
+        self._iniciar_processo()
+
+    def _iniciar_processo(self):
+        comando = [
+            sys.executable, "-m", "src.processo_contagem",
+            "--bloco", str(self.bloco.caminho),
+            "--capacidade", str(self.bloco.capacidade),
+            "--driver", self.driver,
+            "--contador", str(self.counter_pin),
+            "--porta", str(self.door_pin),
+            "--linha", self.linha,
+            "--modo", processo_config.modo,
+            "--cpu", str(processo_config.cpu),
+            "--fifo", str(processo_config.prioridade),
+            "--nice", str(processo_config.nice),
+        ]
+        with self._lock:
+            self._proc = subprocess.Popen(
+                comando, stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=str(RAIZ)
+            )
+            threading.Thread(target=self._logs_loop, args=(self._proc,), daemon=True).start()
+            logging.info(f"Processo de contagem da linha {self.linha} iniciado (pid {self._proc.pid})")
+            if self._cadencia is not None:
+                self._enviar(f"cadencia {self._cadencia}")
+            if self._porta:
+                self._enviar("porta 1")
+            if self._armado:
+                self._enviar("armar")
+
+    def _logs_loop(self, proc: subprocess.Popen):
+        """Passa ao logging deste processo os registos do processo de contagem"""
+        for linha in proc.stdout:
+            try:
+                registo = registo_do_canal(linha)
+            except ValueError:
+                registo = logging.makeLogRecord(
+                    {
+                        "msg": linha.decode(errors="replace").rstrip(),
+                        "levelno": logging.INFO,
+                        "levelname": "INFO",
+                        "processo": "contagem",
+                        "linha": self.linha,
+                    }
+                )
+            if log_config.formato != "json":
+                registo.msg = f"[contagem {self.linha}] {registo.msg}"
+            logging.getLogger(registo.name).handle(registo)
+
+    def _enviar(self, comando: str):
+        with self._lock:
+            if self._proc is None:
+                return
+            try:
+                self._proc.stdin.write(f"{comando}\n".encode())
+                self._proc.stdin.flush()
+            except OSError as e:
+                logging.error(f"Processo de contagem indisponível ({comando}): {e}")
+
+    def verificar(self) -> bool:
+        """Reinicia o processo de contagem se tiver terminado (devolve False nesse caso)"""
+        with self._lock:
+            if self._proc is None or self._proc.poll() is None:
+                return True
+            logging.error(
+                f"Processo de contagem da linha {self.linha} terminou "
+                f"(código {self._proc.returncode}) - a reiniciar"
+            )
+            self.reinicios += 1
+            self._iniciar_processo()
+            return False
+
+    def read_counter(self) -> bool:
+        raise NotImplementedError("O pino é lido pelo processo de contagem")
+
+    def set_door(self, state: bool):
+        self._porta = state
+        self._enviar(f"porta {int(state)}")
+        limite = time.monotonic() + 2
+        while time.monotonic() < limite:
+            valores = self.bloco.ler()
+            if valores and valores[3] == int(state):
+                break
+            time.sleep(0.005)
+        else:
+            logging.warning(f"Porta da linha {self.linha} não confirmada pelo processo de contagem")
+        self.door_state = 1 if state else 0
+
+    def armar(self):
+        self._armado = True
+        self._enviar("armar")
+
+    def desarmar(self):
+        self._armado = False
+        self._enviar("desarmar")
+
+    def configurar(self, cadencia: float):
+        self._cadencia = cadencia
+        self._enviar(f"cadencia {cadencia}")
+
+    def cleanup(self):
+        with self._lock:
+            proc, self._proc = self._proc, None
+        if proc is not None:
+            try:
+                proc.stdin.write(b"sair\n")
+                proc.stdin.close()
+                proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                proc.kill()
+        self.bloco.fechar()
+        self.bloco.caminho.unlink(missing_ok=True)
+
+
+class ProcessoBackend(ContagemBackend):
+    """Contagem num processo à parte, lida do bloco partilhado
+
+    A thread de leitura passa ao contador as garrafas novas a cada
+    PROCESSO_LEITURA segundos, com o instante registado no processo de
+    contagem: uma pausa do GIL neste processo atrasa a leitura, mas não
+    perde flancos nem altera as taxas. O filtro de ressaltos corre no
+    processo de contagem.
+    """
+
+    def __init__(self, contador):
+        super().__init__(contador)
+        driver = contador.gpio.driver
+        if not isinstance(driver, DriverProcesso):
+            raise ValueError("COUNTER_MODE=processo precisa do DriverProcesso (ver criar_driver_linha)")
+        self.driver = driver
+        self.intervalo = processo_config.leitura
+        self._lidos = driver.bloco.total
+        self._armado = threading.Event()
+        self._running = False
+        self._thread = None
+
+    @property
+    def rejeitados(self) -> int:
+        valores = self.driver.bloco.ler()
+        return valores[1] + valores[2] if valores else 0
+
+    def configurar(self, cadencia: float):
+        self.driver.configurar(cadencia)
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._leitura_loop, daemon=True)
+            logging.info(f"Iniciando thread: {self._thread.name}")
+            self._thread.start()
+
+    def stop(self):
+        self.desarmar()
+        self._running = False
+        self._armado.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def armar(self):
+        self.driver.armar()
+        self._armado.set()
+
+    def desarmar(self):
+        self.driver.desarmar()
+        self._armado.clear()
+
+    def _ler(self):
+        total = self.driver.bloco.total
+        if total <= self._lidos:
+            return
+        agora = time.monotonic()
+        instantes = self.driver.bloco.instantes(self._lidos, total)
+        for instante in instantes:
+            ATRASO_FLANCO.observar(agora - instante)
+            self.contador._registar_garrafas(1, instante)
+        self._lidos += len(instantes)
+
+    def _leitura_loop(self):
+        """Lê o bloco enquanto armado; desarmado só vigia o processo de contagem"""
+        metrica = MetricaLoop("leitura_processo", prazo=5)
+
+        while self._running:
+            self._ler()
+            if not self.driver.verificar():
+                self._lidos = min(self._lidos, self.driver.bloco.total)
+            metrica.fim_trabalho()
+            if self._armado.is_set():
+                time.sleep(self.intervalo)
+                metrica.acordou(self.intervalo)
+            else:
+                self._armado.wait(1)
+                metrica.reiniciar()
+        metrica.terminar()
+
+
+class ContagemIsolada:
+    """Lado do processo de contagem: o backend de sempre a escrever no bloco"""
+
+    def __init__(self, gpio: GPIOHandler, bloco: BlocoContagem, modo: str, linha: str):
+        self.gpio = gpio
+        self.bloco = bloco
+        self.id_linha = linha
+        self.armado = False
+        self._lock = threading.Lock()  # Callback de flanco e thread principal escrevem no bloco
+        self.backend = criar_backend(modo, self)
+
+    def _registar_garrafas(self, quantidade: int, instante: float):
+        with self._lock:
+            for _ in range(quantidade):
+                self.bloco.publicar_garrafa(instante)
+
+    def publicar_estado(self):
+        filtro = self.backend.filtro
+        with self._lock:
+            self.bloco.publicar_estado(
+                filtro.curtos,
+                filtro.proximos,
+                self.gpio.door_state,
+                self.armado,
+                getattr(self.gpio.driver, "pulsos_gerados", 0),
+            )
+
+    def _comando(self, partes: List[str]) -> bool:
+        """Executa um comando do processo principal; False para terminar"""
+        if not partes:
+            return True
+        nome = partes[0]
+        if nome == "armar":
+            self.backend.armar()
+            self.armado = True
+        elif nome == "desarmar":
+            self.backend.desarmar()
+            self.armado = False
+        elif nome == "porta":
+            self.gpio.set_door(partes[1] == "1")
+        elif nome == "cadencia":
+            self.backend.configurar(float(partes[1]))
+        elif nome == "sair":
+            return False
+        else:
+            logging.warning(f"Comando desconhecido: {' '.join(partes)}")
+        return True
+
+    def executar(self, fd: int):
+        """Lê comandos de `fd` até "sair" ou até o processo principal fechar o canal"""
+        self.backend.start()
+        pendente = b""
+        try:
+            while True:
+                prontos, _, _ = select.select([fd], [], [], 0.1)
+                if prontos:
+                    dados = os.read(fd, 4096)
+                    if not dados:
+                        logging.warning("Canal de comandos fechado - a terminar")
+                        return
+                    *linhas, pendente = (pendente + dados).split(b"\n")
+                    for linha in linhas:
+                        if not self._comando(linha.decode().split()):
+                            return
+                self.publicar_estado()  # Batimento a cada 100 ms e após cada comando
+        finally:
+            self.backend.stop()
+            self.gpio.set_door(False)  # Sem processo principal a porta fica fechada
+            self.publicar_estado()
+            self.gpio.cleanup()
+
+
+def aplicar_tempo_real(cpu: int, prioridade: int, nice: int):
+    """Fixa o processo num núcleo e pede escalonamento de tempo real
+
+    As threads criadas depois (callbacks de flanco, polling) herdam as
+    definições. Sem permissões (CAP_SYS_NICE) fica só um aviso no log.
+    """
+    if cpu >= 0:
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except (AttributeError, OSError) as e:
+            logging.warning(f"Sem afinidade ao núcleo {cpu}: {e}")
+    if prioridade > 0:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(prioridade))
+        except (AttributeError, OSError) as e:
+            logging.warning(f"Sem SCHED_FIFO (prioridade {prioridade}): {e}")
+    elif nice:
+        try:
+            os.nice(nice)
+        except OSError as e:
+            logging.warning(f"Sem nice {nice}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Processo de contagem isolado")
+    parser.add_argument("--bloco", required=True)
+    parser.add_argument("--capacidade", type=int, required=True)
+    parser.add_argument("--driver", default="rpi")
+    parser.add_argument("--contador", type=int, required=True)
+    parser.add_argument("--porta", type=int, required=True)
+    parser.add_argument("--linha", default="1")
+    parser.add_argument("--modo", default="eventos", choices=["eventos", "polling"])
+    parser.add_argument("--cpu", type=int, default=-1)
+    parser.add_argument("--fifo", type=int, default=0)
+    parser.add_argument("--nice", type=int, default=0)
+    args = parser.parse_args()
+
+    # Os registos seguem pelo stdout para o processo principal, que os escreve
+    # (e roda o ficheiro) com o seu logging
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(FormatadorCanal({"processo": "contagem", "linha": args.linha}))
+    logging.basicConfig(handlers=[handler], level=logging.INFO)
+    aplicar_tempo_real(args.cpu, args.fifo, args.nice)
+
+    bloco = BlocoContagem(Path(args.bloco), args.capacidade)
+    gpio = GPIOHandler(criar_driver(args.driver, args.contador, args.porta))
+    contagem = ContagemIsolada(gpio, bloco, args.modo, args.linha)
+    contagem.publicar_estado()
+    gc.freeze()  # Os objetos do arranque deixam de ser percorridos pelo GC
+    logging.info(f"Processo de contagem pronto (pid {os.getpid()}, modo {args.modo})")
+    contagem.executar(sys.stdin.fileno())
+    bloco.fechar()
+
+
+if __name__ == "__main__":
+    main()
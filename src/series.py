@@ -0,0 +1,269 @@
+import logging
+import os
+import struct
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Colunas das estatísticas do contador: (nome, typecode do array)
+COLUNAS_ESTATISTICAS = (
+    ("gfa", "q"),
+    ("media", "q"),
+    ("cadencia", "q"),
+    ("paragem", "b"),  # 1 se houve paragem no intervalo, 0 caso contrário
+)
+
+
+def formatar_tempo(instante: float) -> str:
+    """Instante epoch no formato HH:MM:SS usado pela API"""
+    return time.strftime("%H:%M:%S", time.localtime(instante))
+
+
+def formatar_paragem(valor: int) -> str:
+    """Marcador de paragem no formato da API ("0" = paragem, "null" = sem)"""
+    return "0" if valor else "null"
+
+
+class SerieTemporal:
+    """Série temporal em buffer circular pré-alocado
+
+    Guarda um instante epoch e um valor por coluna em cada ponto. Cada array
+    tem o dobro da capacidade e cada valor é escrito em duas posições
+    (i e i + capacidade), para que os últimos pontos estejam sempre numa
+    fatia contígua: as vistas devolvidas são memoryviews, sem cópias.
+
+    Cada ponto é também acrescentado a `ficheiro_registo` (registos
+    binários de tamanho fixo), que guarda a ordem completa: os pontos que já
+    saíram do buffer e os de arranques anteriores da mesma ordem.
+
+    `total` funciona como número de sequência: o ponto k (a contar de 0) é o
+    k-ésimo ponto adicionado, e as vistas podem ser pedidas para um intervalo
+    [desde, ate) de sequências. `id` distingue esta série de outras (por
+    exemplo, de uma ordem anterior) para os clientes que guardam cursores.
+    """
+
+    def __init__(
+        self,
+        colunas: Sequence[Tuple[str, str]],
+        capacidade: int,
+        ficheiro_registo: Optional[Path] = None,
+    ):
+        self.capacidade = capacidade
+        self.nomes = tuple(nome for nome, _ in colunas)
+        self._instantes = array("d", [0.0]) * (2 * capacidade)
+        self._colunas = {
+            nome: array(tipo, [0]) * (2 * capacidade) for nome, tipo in colunas
+        }
+        self._ordem = [self._colunas[nome] for nome in self.nomes]
+        self._registo = struct.Struct("<d" + "".join(tipo for _, tipo in colunas))
+        self._ficheiro_registo = ficheiro_registo
+        self._registo_ficheiro = None
+        self.registados_antes = 0  # Pontos que já estavam no ficheiro ao abrir
+        self.total = 0  # Pontos adicionados desde o início (número de sequência)
+        self.id = os.urandom(4).hex()
+
+    def __len__(self) -> int:
+        return min(self.total, self.capacidade)
+
+    def adicionar(self, instante: float, *valores):
+        """Acrescenta um ponto com um valor por coluna, pela ordem das colunas"""
+        i = self.total % self.capacidade
+        j = i + self.capacidade
+        self._instantes[i] = self._instantes[j] = instante
+        for coluna, valor in zip(self._ordem, valores):
+            coluna[i] = coluna[j] = valor
+        if self._ficheiro_registo is not None:
+            self._registar(instante, valores)
+        self.total += 1
+
+    def _registar(self, instante: float, valores):
+        """Acrescenta o ponto ao ficheiro da ordem"""
+        try:
+            if self._registo_ficheiro is None:
+                self.registados_antes = self._abrir_registo()
+            self._registo_ficheiro.write(self._registo.pack(instante, *valores))
+            self._registo_ficheiro.flush()  # Um ponto a cada 10 s: legível logo pela API
+        except Exception as e:
+            logging.error(f"Erro ao gravar série em disco: {e}")
+
+    def _fatia(self, dados: array, desde: Optional[int], ate: Optional[int]) -> memoryview:
+        fim = self.total if ate is None else min(ate, self.total)
+        inicio = max(fim - self.capacidade, self.total - self.capacidade, desde or 0, 0)
+        if inicio >= fim:
+            return memoryview(dados)[0:0]
+        i = inicio % self.capacidade
+        return memoryview(dados)[i : i + fim - inicio]
+
+    def instantes(self, desde: Optional[int] = None, ate: Optional[int] = None) -> memoryview:
+        """Instantes epoch dos pontos em memória, do mais antigo ao mais recente
+
+        Com `desde`/`ate` devolve só os pontos com sequência em [desde, ate).
+        """
+        return self._fatia(self._instantes, desde, ate)
+
+    def coluna(self, nome: str, desde: Optional[int] = None, ate: Optional[int] = None) -> memoryview:
+        """Valores de uma coluna, do mais antigo ao mais recente"""
+        return self._fatia(self._colunas[nome], desde, ate)
+
+    def _abrir_registo(self) -> int:
+        """Abre o ficheiro da ordem para acrescentar e devolve os pontos que já tem"""
+        Path(self._ficheiro_registo).parent.mkdir(parents=True, exist_ok=True)
+        self._registo_ficheiro = open(self._ficheiro_registo, "ab")
+        tamanho = self._registo_ficheiro.tell()
+        if tamanho % self._registo.size:  # Ponto a meio de um encerramento abrupto
+            tamanho -= tamanho % self._registo.size
+            self._registo_ficheiro.truncate(tamanho)
+        return tamanho // self._registo.size
+
+    def restaurar(self) -> int:
+        """Carrega os pontos do ficheiro da ordem, que passam a ser desta série
+
+        Usado ao retomar uma ordem depois de um reinício do serviço.
+        Devolve o número de pontos carregados.
+        """
+        if self._ficheiro_registo is None or self.total:
+            return 0
+        try:
+            self._abrir_registo()
+            instantes, colunas = ler_registo(self._ficheiro_registo, self._registo, self.nomes)
+        except OSError as e:
+            logging.error(f"Erro ao restaurar série do disco: {e}")
+            return 0
+        self.registados_antes = 0
+        valores = [colunas[nome] for nome in self.nomes]
+        for k in range(max(len(instantes) - self.capacidade, 0), len(instantes)):
+            i = k % self.capacidade
+            j = i + self.capacidade
+            self._instantes[i] = self._instantes[j] = instantes[k]
+            for coluna, serie in zip(self._ordem, valores):
+                coluna[i] = coluna[j] = serie[k]
+        self.total = len(instantes)
+        return self.total
+
+    def completa(self, ate: Optional[int] = None) -> Tuple[list, Dict[str, list]]:
+        """Todos os pontos da ordem até à sequência `ate`: (instantes, colunas)
+
+        Se o buffer não tiver a ordem completa (pontos que já saíram ou de um
+        arranque anterior) lê o ficheiro da ordem.
+        """
+        fim = self.total if ate is None else min(ate, self.total)
+        if self._registo_ficheiro is not None and (
+            self.registados_antes or fim > self.capacidade
+        ):
+            try:
+                instantes, colunas = ler_registo(
+                    self._ficheiro_registo, self._registo, self.nomes, self.registados_antes + fim
+                )
+                if len(instantes) >= fim:
+                    return instantes, colunas
+            except OSError as e:
+                logging.error(f"Erro ao ler série do disco: {e}")
+        return (
+            self.instantes(None, fim).tolist(),
+            {nome: self.coluna(nome, None, fim).tolist() for nome in self.nomes},
+        )
+
+    def ultimo(self, nome: str, padrao=None):
+        """Último valor de uma coluna"""
+        if not self.total:
+            return padrao
+        return self._colunas[nome][(self.total - 1) % self.capacidade]
+
+    def ultimo_instante(self) -> Optional[float]:
+        if not self.total:
+            return None
+        return self._instantes[(self.total - 1) % self.capacidade]
+
+    def fechar(self):
+        """Fecha o ficheiro da ordem"""
+        if self._registo_ficheiro is not None:
+            self._registo_ficheiro.close()
+            self._registo_ficheiro = None
+
+
+def ficheiro_ordem(diretorio: Path, ordem: str) -> Path:
+    """Ficheiro com a série de uma ordem (as "/" do número passam a "-")"""
+    return Path(diretorio) / f"{ordem.replace('/', '-')}.bin"
+
+
+def criar_series_estatisticas(
+    capacidade: int, diretorio: Optional[Path] = None, ordem: str = ""
+) -> SerieTemporal:
+    """Série das estatísticas do contador, gravada em `diretorio/<ordem>.bin`"""
+    ficheiro = None
+    if diretorio is not None and ordem:
+        ficheiro = ficheiro_ordem(diretorio, ordem)
+    return SerieTemporal(COLUNAS_ESTATISTICAS, capacidade, ficheiro)
+
+
+def _registo_estatisticas() -> struct.Struct:
+    return struct.Struct("<d" + "".join(tipo for _, tipo in COLUNAS_ESTATISTICAS))
+
+
+def ler_registo(
+    caminho: Path,
+    registo: Optional[struct.Struct] = None,
+    nomes: Sequence[str] = tuple(nome for nome, _ in COLUNAS_ESTATISTICAS),
+    limite: Optional[int] = None,
+) -> Tuple[list, Dict[str, list]]:
+    """Pontos de um ficheiro de série (até `limite`): (instantes, colunas)"""
+    registo = registo or _registo_estatisticas()
+    with open(caminho, "rb") as f:
+        dados = f.read() if limite is None else f.read(limite * registo.size)
+    dados = dados[: len(dados) - len(dados) % registo.size]  # Ignora um ponto a meio
+    pontos = list(zip(*registo.iter_unpack(dados))) or [()] * (len(nomes) + 1)
+    return list(pontos[0]), {nome: list(v) for nome, v in zip(nomes, pontos[1:])}
+
+
+def reduzir(
+    instantes: Sequence[float],
+    colunas: Dict[str, Sequence],
+    pontos: int,
+    principal: str = "gfa",
+    marcadores: Sequence[str] = ("paragem",),
+) -> Tuple[list, Dict[str, list]]:
+    """Reduz uma série a no máximo `pontos` pontos (mínimo 3), preservando a forma
+
+    Os pontos são escolhidos pelo algoritmo Largest-Triangle-Three-Buckets
+    sobre a coluna `principal`: o primeiro e o último ficam, e de cada bucket
+    intermédio fica o ponto que forma o maior triângulo com o ponto escolhido
+    antes e a média do bucket seguinte. As outras colunas usam os mesmos
+    pontos, exceto as `marcadores`, que ficam com o máximo do bucket para
+    que uma paragem num ponto descartado continue a aparecer.
+    """
+    total = len(instantes)
+    if total <= pontos or total <= 2:
+        return list(instantes), {nome: list(v) for nome, v in colunas.items()}
+
+    x, y = instantes, colunas[principal]
+    buckets = pontos - 2
+    limites = [(0, 1)]
+    escolhidos = [0]
+    a = 0
+    for b in range(buckets):
+        inicio = b * (total - 2) // buckets + 1
+        fim = (b + 1) * (total - 2) // buckets + 1
+        fim_seguinte = (b + 2) * (total - 2) // buckets + 1 if b + 1 < buckets else total
+        n = fim_seguinte - fim
+        cx = sum(x[fim:fim_seguinte]) / n
+        cy = sum(y[fim:fim_seguinte]) / n
+        ax, ay = x[a], y[a]
+        melhor, area_maxima = inicio, -1.0
+        for j in range(inicio, fim):
+            area = abs((ax - cx) * (y[j] - ay) - (ax - x[j]) * (cy - ay))
+            if area > area_maxima:
+                melhor, area_maxima = j, area
+        escolhidos.append(melhor)
+        limites.append((inicio, fim))
+        a = melhor
+    escolhidos.append(total - 1)
+    limites.append((total - 1, total))
+
+    reduzidas: Dict[str, List] = {}
+    for nome, valores in colunas.items():
+        if nome in marcadores:
+            reduzidas[nome] = [max(valores[i:j]) for i, j in limites]
+        else:
+            reduzidas[nome] = [valores[i] for i in escolhidos]
+    return [x[i] for i in escolhidos], reduzidas
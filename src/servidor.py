@@ -0,0 +1,116 @@
+import logging
+import queue
+import socket
+import ssl
+import threading
+from pathlib import Path
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+def criar_contexto_tls(cert_path: Path, key_path: Path, num_tickets: int = 2) -> ssl.SSLContext:
+    """Contexto TLS de servidor com reutilização de sessões
+
+    A cache de sessões do servidor fica ativa (padrão do OpenSSL) e os
+    session tickets são explicitamente permitidos, para que os clientes que
+    voltam a ligar façam um handshake abreviado.
+    """
+    contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    contexto.load_cert_chain(certfile=str(cert_path), keyfile=str(key_path))
+    contexto.options &= ~ssl.OP_NO_TICKET
+    contexto.num_tickets = num_tickets  # Tickets TLS 1.3 emitidos por handshake
+    return contexto
+
+
+class _RequestHandler(WSGIRequestHandler):
+    """Handler do Werkzeug com timeout de leitura por pedido
+
+    Se houver ligações à espera de uma thread, a resposta sai com
+    "Connection: close" para libertar a thread; o cliente volta a ligar e,
+    com a sessão TLS reutilizada, o novo handshake é barato.
+    """
+
+    timeout = 10  # Substituído pelo servidor com o valor configurado
+
+    def log_request(self, code="-", size="-"):
+        pass  # Sem uma linha de log por pedido (os erros continuam a ser registados)
+
+    def end_headers(self):
+        if self.server.tem_espera():
+            self.send_header("Connection", "close")
+        super().end_headers()
+
+
+class ServidorProducao(BaseWSGIServer):
+    """Servidor WSGI com um pool fixo de threads e TLS por ligação
+
+    A thread principal só aceita ligações e coloca-as numa fila limitada;
+    o handshake TLS e os pedidos são tratados pelas threads do pool, com
+    timeout, para que um cliente lento não atrase os outros. As ligações são
+    keep-alive (HTTP/1.1) e fecham ao fim de `timeout` segundos sem pedidos.
+    Com a fila cheia, as ligações novas são recusadas.
+    """
+
+    multithread = True
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        app,
+        contexto_tls: ssl.SSLContext = None,
+        threads: int = 16,
+        fila: int = 64,
+        timeout: float = 10,
+        timeout_handshake: float = 5,
+    ):
+        handler = type("RequestHandler", (_RequestHandler,), {"timeout": timeout})
+        super().__init__(host, port, app, handler)
+        # O socket de escuta fica em claro: o TLS é feito ligação a ligação
+        # nas threads do pool, e não no accept().
+        self.ssl_context = contexto_tls
+        self.timeout_handshake = timeout_handshake
+        self._fila = queue.Queue(maxsize=fila)
+        self._threads = [
+            threading.Thread(target=self._worker_loop, name=f"http-{i}", daemon=True)
+            for i in range(threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def process_request(self, request, client_address):
+        """Entrega a ligação ao pool (chamado na thread que aceita)"""
+        try:
+            self._fila.put_nowait((request, client_address))
+        except queue.Full:
+            logging.warning(f"Servidor ocupado - ligação de {client_address[0]} recusada")
+            self.shutdown_request(request)
+
+    def _worker_loop(self):
+        while True:
+            request, client_address = self._fila.get()
+            try:
+                if self.ssl_context is not None:
+                    request = self._handshake(request)
+                self.finish_request(request, client_address)
+            except (OSError, ssl.SSLError) as e:
+                logging.debug(f"Ligação de {client_address[0]} terminada: {e}")
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def _handshake(self, request: socket.socket) -> ssl.SSLSocket:
+        request.settimeout(self.timeout_handshake)
+        tls = self.ssl_context.wrap_socket(
+            request, server_side=True, do_handshake_on_connect=False
+        )
+        tls.do_handshake()
+        return tls
+
+    def tem_espera(self) -> bool:
+        return not self._fila.empty()
+
+    def ocupacao(self) -> dict:
+        """Ligações à espera de uma thread do pool"""
+        return {"fila": self._fila.qsize(), "threads": len(self._threads)}
@@ -0,0 +1,282 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, time as datetime_time, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+from .metricas import MetricaLoop
+
+TODOS_OS_DIAS = frozenset(range(7))  # date.weekday(): 0 = segunda
+
+# O calendário de sempre: almoço às 12:00 e fim do expediente às 17:00, sem retoma
+CALENDARIO_PADRAO = {
+    "pausas": [
+        {"nome": "Horário de almoço", "inicio": "12:00"},
+        {"nome": "Fim de expediente", "inicio": "17:00"},
+    ],
+    "feriados": [],
+}
+
+
+@dataclass(frozen=True)
+class Pausa:
+    """Uma pausa do calendário: pausa às `inicio` e, com `fim`, retoma a essa hora
+
+    Um `fim` igual ou anterior ao `inicio` é no dia seguinte (pausa de noite).
+    """
+
+    nome: str
+    inicio: datetime_time
+    fim: Optional[datetime_time] = None
+    dias: FrozenSet[int] = TODOS_OS_DIAS
+
+    def proxima(self, acao: str, depois: datetime, feriados: FrozenSet[date]) -> Optional[datetime]:
+        """Primeiro instante de `acao` ("pausar" ou "retomar") depois de `depois`"""
+        # Começa no dia anterior: a retoma de uma pausa de noite é no dia seguinte
+        dia = depois.date() - timedelta(days=1)
+        # Cada feriado pode tirar uma ocorrência (uma por semana, no pior caso)
+        for _ in range(7 * (len(feriados) + 1) + 2):
+            if dia.weekday() in self.dias and dia not in feriados:
+                if acao == "pausar":
+                    instante = datetime.combine(dia, self.inicio)
+                else:
+                    instante = datetime.combine(dia, self.fim)
+                    if self.fim <= self.inicio:
+                        instante += timedelta(days=1)
+                if instante > depois:
+                    return instante
+            dia += timedelta(days=1)
+        return None
+
+
+def _formatar_hora(hora: datetime_time) -> str:
+    return hora.isoformat("seconds" if hora.second else "minutes")
+
+
+def _hora(valor: str) -> datetime_time:
+    try:
+        return datetime_time.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Hora inválida: {valor!r} (HH:MM)") from None
+
+
+class CalendarioTurnos:
+    """Pausas (intervalos, fins de turno) e feriados da fábrica
+
+    Formato (o mesmo do ficheiro e da API):
+
+        {"pausas": [{"nome": "Almoço", "inicio": "12:00", "fim": "13:00",
+                     "dias": [0, 1, 2, 3, 4]}],
+         "feriados": ["2026-12-25"]}
+
+    `fim` e `dias` (0 = segunda) são opcionais. Num feriado as pausas
+    desse dia não acontecem.
+    """
+
+    def __init__(self, pausas: List[Pausa], feriados: FrozenSet[date] = frozenset()):
+        self.pausas = pausas
+        self.feriados = feriados
+
+    @classmethod
+    def de_dict(cls, dados: Dict[str, Any]) -> "CalendarioTurnos":
+        """Valida um calendário (ValueError com o motivo se for inválido)"""
+        if not isinstance(dados, dict) or not isinstance(dados.get("pausas", []), list):
+            raise ValueError('Calendário inválido: esperado {"pausas": [...], "feriados": [...]}')
+        pausas = []
+        for pausa in dados.get("pausas", []):
+            if not isinstance(pausa, dict) or "inicio" not in pausa:
+                raise ValueError(f"Pausa sem início: {pausa!r}")
+            dias = pausa.get("dias", sorted(TODOS_OS_DIAS))
+            if not isinstance(dias, list) or not dias or not set(dias) <= TODOS_OS_DIAS:
+                raise ValueError(f"Dias inválidos: {dias!r} (0 = segunda ... 6 = domingo)")
+            pausas.append(
+                Pausa(
+                    nome=str(pausa.get("nome") or pausa["inicio"]),
+                    inicio=_hora(pausa["inicio"]),
+                    fim=_hora(pausa["fim"]) if pausa.get("fim") else None,
+                    dias=frozenset(dias),
+                )
+            )
+        try:
+            feriados = frozenset(date.fromisoformat(d) for d in dados.get("feriados", []))
+        except (TypeError, ValueError):
+            raise ValueError(f"Feriados inválidos: {dados.get('feriados')!r} (AAAA-MM-DD)") from None
+        return cls(pausas, feriados)
+
+    def para_dict(self) -> Dict[str, Any]:
+        pausas = []
+        for pausa in self.pausas:
+            dados = {"nome": pausa.nome, "inicio": _formatar_hora(pausa.inicio)}
+            if pausa.fim is not None:
+                dados["fim"] = _formatar_hora(pausa.fim)
+            dados["dias"] = sorted(pausa.dias)
+            pausas.append(dados)
+        return {"pausas": pausas, "feriados": sorted(d.isoformat() for d in self.feriados)}
+
+    def eventos(self, depois: datetime) -> List[Tuple[datetime, str, Pausa]]:
+        """Próximo instante de cada pausa e de cada retoma depois de `depois`"""
+        eventos = []
+        for pausa in self.pausas:
+            for acao in ("pausar", "retomar") if pausa.fim is not None else ("pausar",):
+                instante = pausa.proxima(acao, depois, self.feriados)
+                if instante is not None:
+                    eventos.append((instante, acao, pausa))
+        return eventos
+
+
+def carregar_calendario(caminho: Optional[Path]) -> CalendarioTurnos:
+    """Calendário guardado em `caminho`, ou o padrão se não existir ou for inválido"""
+    if caminho is not None and Path(caminho).exists():
+        try:
+            with open(caminho, encoding="utf-8") as ficheiro:
+                return CalendarioTurnos.de_dict(json.load(ficheiro))
+        except (OSError, ValueError) as e:
+            logging.error(f"Calendário de turnos ilegível em {caminho}, a usar o padrão: {e}")
+    return CalendarioTurnos.de_dict(CALENDARIO_PADRAO)
+
+
+class AgendadorTurnos:
+    """Pausas e retomas do calendário de turnos, à hora certa
+
+    Os próximos eventos ficam num heap ordenado pelo instante; a thread
+    dorme até ao primeiro (no máximo ESPERA_MAXIMA segundos, para notar
+    acertos do relógio, como o NTP no arranque do Raspberry Pi), chama
+    `acao(acao, pausa)` e agenda a ocorrência seguinte. Mudar o calendário
+    (`definir_calendario`) refaz o heap e acorda a thread.
+
+    Um evento que já passou há mais de TOLERANCIA segundos (o relógio
+    saltou para a frente) não é executado; se o relógio recuar, o heap é
+    refeito a partir da hora nova.
+    """
+
+    ESPERA_MAXIMA = 60
+    TOLERANCIA = 120
+
+    def __init__(self, acao: Callable[[str, Pausa], None], caminho: Optional[Path] = None):
+        """`caminho` é o ficheiro do calendário: lido aqui, reescrito a cada alteração"""
+        self.acao = acao
+        self.caminho = caminho
+        self.calendario = carregar_calendario(caminho)
+        self._condicao = threading.Condition()
+        self._heap: List[Tuple[float, int, str, Pausa]] = []
+        self._sequencia = itertools.count()  # Desempate entre eventos no mesmo instante
+        self._ultimo_agora = time.time()
+        self._running = False
+        self._thread = None
+        self.executados = 0
+        self.ignorados = 0
+
+    def start(self):
+        with self._condicao:
+            if self._running:
+                return
+            self._running = True
+            self._refazer(time.time())
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        logging.info(f"Iniciando thread: {self._thread.name} (turnos)")
+        self._thread.start()
+
+    def stop(self):
+        with self._condicao:
+            self._running = False
+            self._condicao.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def definir_calendario(self, dados: Dict[str, Any]):
+        """Substitui o calendário (ValueError se for inválido) e guarda-o no ficheiro"""
+        calendario = CalendarioTurnos.de_dict(dados)
+        if self.caminho is not None:
+            Path(self.caminho).parent.mkdir(parents=True, exist_ok=True)
+            temporario = Path(f"{self.caminho}.tmp")
+            with open(temporario, "w", encoding="utf-8") as ficheiro:
+                json.dump(calendario.para_dict(), ficheiro, ensure_ascii=False, indent=2)
+            os.replace(temporario, self.caminho)
+        with self._condicao:
+            self.calendario = calendario
+            self._refazer(time.time())
+            self._condicao.notify()
+        logging.info(
+            f"Calendário de turnos alterado: {len(calendario.pausas)} pausas, "
+            f"{len(calendario.feriados)} feriados"
+        )
+
+    def estado(self, proximos: int = 10) -> Dict[str, Any]:
+        """Calendário e próximos eventos agendados"""
+        with self._condicao:
+            eventos = heapq.nsmallest(proximos, self._heap)
+            calendario = self.calendario.para_dict()
+        return {
+            **calendario,
+            "proximos": [
+                {
+                    "instante": datetime.fromtimestamp(instante).strftime("%Y-%m-%d %H:%M:%S"),
+                    "acao": acao,
+                    "pausa": pausa.nome,
+                }
+                for instante, _, acao, pausa in eventos
+            ],
+            "executados": self.executados,
+            "ignorados": self.ignorados,
+        }
+
+    def _agendar(self, instante: Optional[datetime], acao: str, pausa: Pausa):
+        """Põe um evento no heap (chamado com o lock)"""
+        if instante is not None:
+            heapq.heappush(self._heap, (instante.timestamp(), next(self._sequencia), acao, pausa))
+
+    def _refazer(self, agora: float):
+        """Heap com o próximo evento de cada pausa a partir de `agora` (chamado com o lock)"""
+        self._heap = []
+        self._ultimo_agora = agora
+        for instante, acao, pausa in self.calendario.eventos(datetime.fromtimestamp(agora)):
+            self._agendar(instante, acao, pausa)
+
+    def _loop(self):
+        metrica = MetricaLoop("turnos", prazo=2 * self.ESPERA_MAXIMA)
+        with self._condicao:
+            while self._running:
+                agora = time.time()
+                if agora < self._ultimo_agora - self.TOLERANCIA:
+                    logging.warning("O relógio recuou: a reagendar os turnos")
+                    self._refazer(agora)
+                self._ultimo_agora = agora
+
+                if self._heap and self._heap[0][0] <= agora:
+                    instante, _, acao, pausa = heapq.heappop(self._heap)
+                    self._agendar(
+                        pausa.proxima(acao, datetime.fromtimestamp(agora), self.calendario.feriados),
+                        acao,
+                        pausa,
+                    )
+                    atraso = agora - instante
+                    if atraso > self.TOLERANCIA:
+                        self.ignorados += 1
+                        logging.warning(
+                            f"Turnos: {acao} ({pausa.nome}) ignorado, passou há {atraso:.0f} s"
+                        )
+                        continue
+                    self._condicao.release()  # A ação usa os locks do contador
+                    try:
+                        logging.info(f"Turnos: {acao} ({pausa.nome}), atraso {atraso * 1000:.1f} ms")
+                        self.acao(acao, pausa)
+                        self.executados += 1
+                    except Exception as e:
+                        logging.error(f"Erro ao executar o evento de turno {pausa.nome}: {e}")
+                    finally:
+                        self._condicao.acquire()
+                    continue
+
+                espera = self.ESPERA_MAXIMA
+                if self._heap:
+                    espera = min(self._heap[0][0] - agora, espera)
+                metrica.fim_trabalho()
+                self._condicao.wait(espera)
+                metrica.acordou(espera)
+        metrica.terminar()
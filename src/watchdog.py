@@ -1,15 +1,76 @@
 import time
 import logging
+from collections import deque
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 import subprocess
 import os
+from typing import Optional, Sequence, Tuple
+from .batimentos import EM_ESPERA, ler_batimentos
+from .config import watchdog_config
+
+
+def ler_cpu() -> Tuple[int, int]:
+    """(tempo ocupado, tempo total) de todos os CPUs, em jiffies, de /proc/stat"""
+    with open("/proc/stat") as ficheiro:
+        valores = [int(v) for v in ficheiro.readline().split()[1:9]]
+    ocioso = valores[3] + valores[4]  # idle + iowait
+    total = sum(valores)
+    return total - ocioso, total
+
+
+def ler_memoria_disponivel() -> float:
+    """Memória disponível (MemAvailable) em MB, de /proc/meminfo"""
+    with open("/proc/meminfo") as ficheiro:
+        for linha in ficheiro:
+            if linha.startswith("MemAvailable:"):
+                return int(linha.split()[1]) / 1024
+    raise ValueError("MemAvailable em falta em /proc/meminfo")
+
+
+def ler_memoria_processo(pid: int) -> float:
+    """Memória residente de um processo em MB, de /proc/<pid>/statm"""
+    with open(f"/proc/{pid}/statm") as ficheiro:
+        return int(ficheiro.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def declive(pontos: Sequence[Tuple[float, float]]) -> float:
+    """Declive (por segundo) da reta dos mínimos quadrados de (instante, valor)"""
+    n = len(pontos)
+    media_t = sum(t for t, _ in pontos) / n
+    media_v = sum(v for _, v in pontos) / n
+    variancia = sum((t - media_t) ** 2 for t, _ in pontos)
+    if not variancia:
+        return 0.0
+    return sum((t - media_t) * (v - media_v) for t, v in pontos) / variancia
 
 
 class ServiceWatchdog:
+    """Vigia o serviço de contagem sem lançar processos a cada verificação
+
+    A cada `intervalo` segundos lê os batimentos que os loops do serviço
+    escrevem num ficheiro partilhado: um loop encravado (sem bater dentro do
+    seu prazo) em `confirmacoes` verificações seguidas, ou o processo morto
+    durante `carencia` segundos, reinicia o serviço. A cada `amostragem`
+    segundos lê /proc/stat, /proc/meminfo e a memória do serviço; só uma
+    tendência sustentada na janela de amostras reinicia o serviço: CPU acima
+    do limite em todas, memória disponível abaixo do mínimo em todas, ou a
+    memória do serviço a crescer ao ritmo de esgotar a disponível dentro de
+    `horizonte` segundos. Depois de um reinício não decide nada durante
+    `carencia` segundos.
+    """
+
     def __init__(self):
         self.service_name = "krones-counter"
         self.log_path = Path("/home/pi/krones/logs")
+        self.config = watchdog_config
+        self._amostras = deque(maxlen=self.config.janela)  # (instante, CPU %, MB disponíveis, MB do serviço)
+        self._cpu_anterior: Optional[Tuple[int, int]] = None
+        self._proxima_amostra = 0.0
+        self._encravado = 0  # Verificações seguidas com um loop encravado
+        self._morto_desde: Optional[float] = None
+        self._pid: Optional[int] = None
+        self._carencia_ate = 0.0
         self.setup_logging()
 
     def setup_logging(self):
@@ -45,18 +106,36 @@ class ServiceWatchdog:
         watchdog_logger.setLevel(logging.INFO)
         watchdog_logger.addHandler(watchdog_handler)
 
-    def check_service(self):
-        """Verifica se o serviço está rodando"""
-        try:
-            result = subprocess.run(
-                ["systemctl", "is-active", self.service_name],
-                capture_output=True,
-                text=True,
-            )
-            return result.stdout.strip() == "active"
-        except Exception as e:
-            logging.getLogger('watchdog').error(f"Erro ao verificar serviço: {e}")
-            return False
+    def check_service(self) -> bool:
+        """Verifica os batimentos dos loops; False se for preciso reiniciar"""
+        log = logging.getLogger('watchdog')
+        agora = time.monotonic()
+        lido = ler_batimentos(self.config.batimentos)
+        if lido is None or not os.path.exists(f"/proc/{lido[0]}"):
+            if self._morto_desde is None:
+                self._morto_desde = agora
+                log.warning("Serviço não está a correr (sem batimentos)")
+            return agora - self._morto_desde < self.config.carencia
+        pid, _, loops = lido
+        self._morto_desde = None
+        if pid != self._pid:  # Outro arranque do serviço: começa do zero
+            self._pid, self._encravado = pid, 0
+            self._amostras.clear()
+
+        encravados = [
+            f"{nome} há {agora - instante:.1f} s (prazo {prazo:g} s)"
+            for nome, instante, prazo, _ in loops
+            if prazo != EM_ESPERA and agora - instante > prazo
+        ]
+        if not encravados:
+            self._encravado = 0
+            return True
+        self._encravado += 1
+        log.warning(
+            f"Loop encravado ({self._encravado}/{self.config.confirmacoes}): "
+            + ", ".join(encravados)
+        )
+        return self._encravado < self.config.confirmacoes
 
     def restart_service(self):
         """Reinicia o serviço se necessário"""
@@ -66,29 +145,63 @@ class ServiceWatchdog:
         except Exception as e:
             logging.getLogger('watchdog').error(f"Erro ao reiniciar serviço: {e}")
 
-    def check_system_resources(self):
-        """Verifica recursos do sistema"""
+    def check_system_resources(self) -> bool:
+        """Acrescenta uma amostra de /proc; False se a tendência pedir um reinício"""
+        log = logging.getLogger('watchdog')
         try:
-            # Verifica uso de CPU
-            cpu_usage = os.popen("top -n1 | awk '/Cpu\(s\):/ {print $2}'").readline().strip()
-            
-            # Verifica memória livre
-            free_memory = os.popen("free -m | awk '/Mem:/ {print $4}'").readline().strip()
-            
-            if float(cpu_usage) > 90 or int(free_memory) < 50:
-                logging.getLogger('watchdog').warning(f"Recursos críticos - CPU: {cpu_usage}%, Memória livre: {free_memory}MB")
-                self.restart_service()
-        except Exception as e:
-            logging.getLogger('watchdog').error(f"Erro ao verificar recursos: {e}")
+            cpu = ler_cpu()
+            disponivel = ler_memoria_disponivel()
+            servico = ler_memoria_processo(self._pid) if self._pid else 0.0
+        except (OSError, ValueError) as e:
+            log.error(f"Erro ao verificar recursos: {e}")
+            return True
+
+        anterior, self._cpu_anterior = self._cpu_anterior, cpu
+        if anterior is None or cpu[1] == anterior[1]:
+            return True
+        uso = 100 * (cpu[0] - anterior[0]) / (cpu[1] - anterior[1])
+        self._amostras.append((time.monotonic(), uso, disponivel, servico))
+        if len(self._amostras) < self._amostras.maxlen:
+            return True
+
+        c = self.config
+        if all(a[1] > c.cpu_limite for a in self._amostras):
+            log.warning(
+                f"CPU acima de {c.cpu_limite:.0f}% em {len(self._amostras)} amostras seguidas "
+                f"(agora {uso:.0f}%)"
+            )
+            return False
+        if all(a[2] < c.memoria_minima for a in self._amostras):
+            log.warning(
+                f"Memória disponível abaixo de {c.memoria_minima:.0f} MB em "
+                f"{len(self._amostras)} amostras seguidas (agora {disponivel:.0f} MB)"
+            )
+            return False
+        queda = declive([(a[0], a[2]) for a in self._amostras])
+        crescimento = declive([(a[0], a[3]) for a in self._amostras])
+        if queda < 0 < crescimento and disponivel + queda * c.horizonte < c.memoria_minima:
+            log.warning(
+                f"Memória a esgotar: serviço a crescer {crescimento * 3600:.0f} MB/h, "
+                f"disponível {disponivel:.0f} MB a descer {-queda * 3600:.0f} MB/h"
+            )
+            return False
+        return True
 
     def run(self):
         """Loop principal do watchdog"""
         while True:
-            if not self.check_service():
-                logging.getLogger('watchdog').warning("Serviço não está rodando")
+            agora = time.monotonic()
+            saudavel = self.check_service()
+            if agora >= self._proxima_amostra:
+                self._proxima_amostra = agora + self.config.amostragem
+                saudavel = self.check_system_resources() and saudavel
+            if not saudavel and agora >= self._carencia_ate:
                 self.restart_service()
-            self.check_system_resources()
-            time.sleep(60)  # Verifica a cada minuto
+                self._carencia_ate = time.monotonic() + self.config.carencia
+                self._encravado = 0
+                self._morto_desde = None
+                self._amostras.clear()
+            time.sleep(self.config.intervalo)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+import threading
+import time
+
+from src.cache import CacheTTL
+
+
+def test_entrada_expira_depois_do_ttl():
+    cache = CacheTTL("teste", ttl=60)
+    cache.guardar("a", 1)
+    cache.guardar("b", 2, ttl=0)
+
+    assert cache.obter("a") == 1
+    assert cache.obter("b") is None
+    assert cache.expirados == 1 and len(cache) == 1
+
+
+def test_despeja_a_entrada_usada_ha_mais_tempo():
+    cache = CacheTTL("teste", capacidade=2)
+    cache.guardar("a", 1)
+    cache.guardar("b", 2)
+    cache.obter("a")  # "b" passa a ser a menos usada
+    cache.guardar("c", 3)
+
+    assert cache.obter("b") is None
+    assert cache.obter("a") == 1 and cache.obter("c") == 3
+    assert cache.despejados == 1
+
+
+def test_carregamentos_simultaneos_da_mesma_chave_chamam_carregar_uma_vez():
+    cache = CacheTTL("teste")
+    chamadas = []
+    barreira = threading.Barrier(5)
+
+    def carregar():
+        chamadas.append(1)
+        time.sleep(0.05)
+        return "artigo"
+
+    resultados = []
+
+    def pedir():
+        barreira.wait()
+        resultados.append(cache.obter_ou_carregar("X", carregar))
+
+    threads = [threading.Thread(target=pedir) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(chamadas) == 1
+    assert resultados == ["artigo"] * 5
+
+
+def test_none_nao_fica_em_cache():
+    cache = CacheTTL("teste")
+    assert cache.obter_ou_carregar("X", lambda: None) is None
+    assert cache.obter_ou_carregar("X", lambda: 5) == 5
+    assert cache.falhas == 2 and cache.acertos == 0
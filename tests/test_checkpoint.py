@@ -0,0 +1,40 @@
+from src.checkpoint import CheckpointEstado
+
+
+def test_le_o_ultimo_estado_guardado_depois_de_reabrir(tmp_path):
+    checkpoint = CheckpointEstado(tmp_path / "checkpoint.bin")
+    checkpoint.guardar({"contagem_atual": 1})
+    checkpoint.guardar({"contagem_atual": 2})
+    checkpoint.fechar()
+
+    checkpoint = CheckpointEstado(tmp_path / "checkpoint.bin")
+    assert checkpoint.ler() == {"contagem_atual": 2}
+    checkpoint.guardar({"contagem_atual": 3})
+    assert checkpoint.ler() == {"contagem_atual": 3}
+    checkpoint.fechar()
+
+
+def test_slot_corrompido_recupera_o_anterior(tmp_path):
+    checkpoint = CheckpointEstado(tmp_path / "checkpoint.bin")
+    checkpoint.guardar({"contagem_atual": 1})
+    checkpoint.guardar({"contagem_atual": 2})
+    checkpoint.fechar()
+
+    # Escrita interrompida no slot mais recente (o primeiro: cada gravação
+    # alterna de slot e a primeira foi para o segundo); o crc já não bate
+    with open(tmp_path / "checkpoint.bin", "r+b") as ficheiro:
+        ficheiro.seek(20)
+        ficheiro.write(b"\xff")
+
+    checkpoint = CheckpointEstado(tmp_path / "checkpoint.bin")
+    assert checkpoint.ler() == {"contagem_atual": 1}
+    # A gravação seguinte vai para o slot estragado e volta a ser a mais recente
+    checkpoint.guardar({"contagem_atual": 3})
+    checkpoint.fechar()
+    assert CheckpointEstado(tmp_path / "checkpoint.bin").ler() == {"contagem_atual": 3}
+
+
+def test_ficheiro_novo_nao_tem_checkpoint(tmp_path):
+    checkpoint = CheckpointEstado(tmp_path / "novo" / "checkpoint.bin")
+    assert checkpoint.ler() is None
+    checkpoint.fechar()
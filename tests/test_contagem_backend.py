@@ -0,0 +1,53 @@
+from src.contagem_backend import FiltroRessaltos
+
+
+def pulsos(filtro, *pulsos):
+    """Garrafas contadas num trem de pulsos (subida, descida)"""
+    garrafas = []
+    for subida, descida in pulsos:
+        for instante, nivel in ((subida, True), (descida, False)):
+            garrafa = filtro.flanco(instante, nivel)
+            if garrafa is not None:
+                garrafas.append(garrafa)
+    return garrafas
+
+
+def test_desligado_conta_cada_flanco_ascendente():
+    filtro = FiltroRessaltos()
+    assert pulsos(filtro, (1.0, 1.0001), (1.0002, 1.02), (2.0, 2.02)) == [1.0, 1.0002, 2.0]
+    assert filtro.rejeitados == 0
+
+
+def test_largura_minima_rejeita_pulsos_curtos():
+    filtro = FiltroRessaltos(largura_minima=0.005)
+    garrafas = pulsos(filtro, (1.0, 1.02), (1.0205, 1.021), (2.0, 2.02))
+
+    # A garrafa tem o instante da subida, mas só conta na descida
+    assert garrafas == [1.0, 2.0]
+    assert filtro.curtos == 1 and filtro.proximos == 0
+
+
+def test_incerteza_do_polling_alarga_a_largura_medida():
+    filtro = FiltroRessaltos(largura_minima=0.005)
+    assert filtro.flanco(1.0, True, incerteza=0.002) is None
+    assert filtro.flanco(1.004, False) == 1.0
+
+
+def test_intervalo_minimo_segue_a_cadencia_do_artigo():
+    filtro = FiltroRessaltos(intervalo_base=0.01, fracao=0.5)
+    filtro.configurar(36000)  # Uma garrafa a cada 0,1 s: intervalo mínimo de 0,05 s
+    assert filtro.intervalo_minimo == 0.05
+
+    # Um pulso rejeitado também conta como fim anterior (garrafa a oscilar)
+    garrafas = pulsos(filtro, (1.0, 1.02), (1.04, 1.06), (1.1, 1.12), (1.2, 1.22))
+    assert garrafas == [1.0, 1.2]
+    assert filtro.proximos == 2 and filtro.curtos == 0
+
+
+def test_reiniciar_esquece_o_pulso_em_curso():
+    filtro = FiltroRessaltos(largura_minima=0.005)
+    filtro.flanco(1.0, True)
+    filtro.reiniciar()
+    # Descida de um pulso que começou antes de armar: não é contada
+    assert filtro.flanco(1.02, False) is None
+    assert filtro.rejeitados == 0
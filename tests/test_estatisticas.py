@@ -0,0 +1,45 @@
+import random
+import statistics
+
+import pytest
+
+from src.estatisticas import EstatisticaIncremental, JanelaMovel
+
+
+def test_estatistica_incremental_igual_ao_calculo_direto():
+    aleatorio = random.Random(3)
+    valores = [aleatorio.uniform(0, 10000) for _ in range(500)]
+    estatistica = EstatisticaIncremental()
+    for valor in valores:
+        estatistica.adicionar(valor)
+
+    assert estatistica.contagem == 500
+    assert estatistica.soma == pytest.approx(sum(valores))
+    assert estatistica.media == pytest.approx(statistics.fmean(valores))
+    assert estatistica.variancia == pytest.approx(statistics.pvariance(valores))
+    assert estatistica.minimo == min(valores) and estatistica.maximo == max(valores)
+
+
+def test_estatistica_incremental_vazia():
+    estatistica = EstatisticaIncremental()
+    assert estatistica.variancia == 0.0 and estatistica.desvio == 0.0
+    assert estatistica.minimo is None and estatistica.maximo is None
+
+
+def test_janela_movel_so_conta_as_ultimas_amostras():
+    aleatorio = random.Random(7)
+    valores = [aleatorio.randint(0, 100) for _ in range(200)]
+    janela = JanelaMovel(10)
+    for k, valor in enumerate(valores, 1):
+        janela.adicionar(valor)
+        ultimos = valores[max(k - 10, 0) : k]
+        assert len(janela) == len(ultimos)
+        assert janela.media == pytest.approx(statistics.fmean(ultimos))
+        assert janela.variancia == pytest.approx(statistics.pvariance(ultimos), abs=1e-6)
+        assert janela.minimo == min(ultimos) and janela.maximo == max(ultimos)
+
+
+def test_janela_movel_vazia():
+    janela = JanelaMovel(5)
+    assert janela.media == 0.0 and janela.variancia == 0.0
+    assert janela.minimo is None and janela.maximo is None
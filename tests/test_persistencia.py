@@ -0,0 +1,98 @@
+import sqlite3
+import time
+
+from src.journal import JournalLocal
+from src.persistencia import EscritorContagens
+
+
+class BaseDadosFalsa:
+    """Base de dados em memória que pode ser desligada"""
+
+    def __init__(self):
+        self.em_baixo = False
+        self.contagens = []
+        self.finalizacoes = []
+
+    def gravar_contagens(self, amostras, idempotente=False):
+        if self.em_baixo:
+            raise ConnectionError("base de dados em baixo")
+        self.contagens.extend(amostras)
+
+    def gravar_estatisticas(self, ordem, stats):
+        if self.em_baixo:
+            raise ConnectionError("base de dados em baixo")
+        self.finalizacoes.append((ordem, stats))
+
+
+def esperar(condicao, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        if time.monotonic() > limite:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def registos_no_journal(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "journal.db"))
+    try:
+        return conn.execute("SELECT COUNT(*) FROM registos").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def criar_escritor(tmp_path, db, **kwargs):
+    journal = JournalLocal(tmp_path / "journal.db", "OFF")
+    escritor = EscritorContagens(db, journal=journal, intervalo_reenvio=30, **kwargs)
+    escritor.start()
+    return escritor, journal
+
+
+def test_finalizacao_falhada_reenviada_quando_a_base_de_dados_volta(tmp_path):
+    db = BaseDadosFalsa()
+    escritor, journal = criar_escritor(tmp_path, db)
+    try:
+        db.em_baixo = True
+        escritor.finalizar("OP/1", {"contagem_final": 10})
+        assert db.finalizacoes == []
+        assert journal.total_pendentes() == 1
+
+        db.em_baixo = False
+        escritor.submeter({"contagem": 1})
+        assert esperar(lambda: db.finalizacoes == [("OP/1", {"contagem_final": 10})])
+        assert esperar(lambda: journal.total_pendentes() == 0)
+    finally:
+        escritor.stop()
+        journal.fechar()
+
+
+def test_amostra_descartada_reenviada_sem_reiniciar(tmp_path):
+    db = BaseDadosFalsa()
+    escritor, journal = criar_escritor(tmp_path, db, capacidade=1, politica="descartar_novas")
+    try:
+        db.em_baixo = True
+        for contagem in range(5):
+            escritor.submeter({"contagem": contagem})
+        assert escritor.descartadas > 0
+
+        db.em_baixo = False
+        escritor.submeter({"contagem": 5})
+        assert esperar(lambda: sorted(a["contagem"] for a in db.contagens) == list(range(6)))
+        assert esperar(lambda: journal.total_pendentes() == 0)
+    finally:
+        escritor.stop()
+        journal.fechar()
+
+
+def test_lote_gravado_sai_do_journal_e_stop_fecha_o_journal(tmp_path):
+    db = BaseDadosFalsa()
+    escritor, journal = criar_escritor(tmp_path, db)
+    try:
+        for contagem in range(3):
+            escritor.submeter({"contagem": contagem})
+        assert esperar(lambda: len(db.contagens) == 3)
+        assert esperar(lambda: registos_no_journal(tmp_path) == 0)
+    finally:
+        escritor.stop()
+    assert escritor.estado()["journal_pendentes"] == 0
+    assert registos_no_journal(tmp_path) == 0
@@ -0,0 +1,54 @@
+from src.series import SerieTemporal, criar_series_estatisticas, reduzir
+
+COLUNAS = (("gfa", "q"), ("paragem", "b"))
+
+
+def test_buffer_circular_guarda_os_ultimos_pontos_por_sequencia():
+    serie = SerieTemporal(COLUNAS, capacidade=4)
+    for k in range(6):
+        serie.adicionar(100.0 + k, 10 * k, k % 2)
+
+    assert len(serie) == 4 and serie.total == 6
+    assert serie.instantes().tolist() == [102.0, 103.0, 104.0, 105.0]
+    assert serie.coluna("gfa").tolist() == [20, 30, 40, 50]
+    # [desde, ate) em sequências; as que já saíram do buffer são ignoradas
+    assert serie.coluna("gfa", 3, 5).tolist() == [30, 40]
+    assert serie.coluna("gfa", 0, 3).tolist() == [20]
+    assert serie.ultimo("gfa") == 50 and serie.ultimo_instante() == 105.0
+
+
+def test_serie_restaurada_do_ficheiro_da_ordem(tmp_path):
+    serie = criar_series_estatisticas(3, tmp_path, "OP/7")
+    for k in range(5):
+        serie.adicionar(100.0 + k, k, 0, 6000, 0)
+    serie.fechar()
+
+    restaurada = criar_series_estatisticas(3, tmp_path, "OP/7")
+    assert restaurada.restaurar() == 5
+    assert restaurada.coluna("gfa").tolist() == [2, 3, 4]
+    # A ordem completa vem do ficheiro, incluindo os pontos fora do buffer
+    instantes, colunas = restaurada.completa()
+    assert instantes == [100.0, 101.0, 102.0, 103.0, 104.0]
+    assert colunas["gfa"] == [0, 1, 2, 3, 4]
+    restaurada.fechar()
+
+
+def test_reduzir_mantem_extremos_picos_e_paragens():
+    instantes = [float(k) for k in range(100)]
+    gfa = [1000] * 100
+    gfa[37] = 5000  # Pico
+    paragem = [0] * 100
+    paragem[62] = 1
+
+    reduzidos, colunas = reduzir(instantes, {"gfa": gfa, "paragem": paragem}, 10)
+
+    assert len(reduzidos) == 10
+    assert reduzidos[0] == 0.0 and reduzidos[-1] == 99.0
+    assert 37.0 in reduzidos and max(colunas["gfa"]) == 5000
+    assert sum(colunas["paragem"]) == 1
+
+
+def test_reduzir_sem_pontos_a_mais_devolve_a_serie():
+    instantes, colunas = reduzir([1.0, 2.0], {"gfa": [5, 6], "paragem": [0, 1]}, 3)
+    assert instantes == [1.0, 2.0]
+    assert colunas == {"gfa": [5, 6], "paragem": [0, 1]}
@@ -0,0 +1,66 @@
+import threading
+from datetime import date, datetime, time, timedelta
+
+from src.turnos import AgendadorTurnos, CalendarioTurnos, Pausa
+
+SEXTA = datetime(2026, 10, 16, 15, 0)  # Uma sexta-feira
+
+
+def test_proxima_pausa_salta_dias_fora_do_calendario_e_feriados():
+    almoco = Pausa("Almoço", time(12, 0), time(13, 0), dias=frozenset(range(5)))
+
+    # Sexta às 15:00: a próxima é segunda, e com segunda feriado é terça
+    assert almoco.proxima("pausar", SEXTA, frozenset()) == datetime(2026, 10, 19, 12, 0)
+    assert almoco.proxima("pausar", SEXTA, frozenset({date(2026, 10, 19)})) == datetime(
+        2026, 10, 20, 12, 0
+    )
+    assert almoco.proxima("retomar", SEXTA, frozenset()) == datetime(2026, 10, 19, 13, 0)
+
+
+def test_retoma_de_pausa_de_noite_e_no_dia_seguinte():
+    noite = Pausa("Noite", time(22, 0), time(6, 0))
+
+    assert noite.proxima("pausar", SEXTA, frozenset()) == datetime(2026, 10, 16, 22, 0)
+    assert noite.proxima("retomar", SEXTA, frozenset()) == datetime(2026, 10, 17, 6, 0)
+    # A meio da pausa a retoma ainda é a da noite anterior
+    assert noite.proxima("retomar", datetime(2026, 10, 17, 2, 0), frozenset()) == datetime(
+        2026, 10, 17, 6, 0
+    )
+
+
+def test_calendario_invalido_e_rejeitado():
+    for dados in (
+        {"pausas": [{"nome": "Sem início"}]},
+        {"pausas": [{"inicio": "25:00"}]},
+        {"pausas": [{"inicio": "12:00", "dias": [7]}]},
+        {"pausas": [], "feriados": ["31-12-2026"]},
+    ):
+        try:
+            CalendarioTurnos.de_dict(dados)
+        except ValueError:
+            continue
+        raise AssertionError(f"Calendário aceite: {dados}")
+
+
+def test_agendador_executa_a_pausa_a_hora_e_agenda_a_seguinte(tmp_path):
+    executados = []
+    executou = threading.Event()
+
+    def acao(acao, pausa):
+        executados.append((acao, pausa.nome))
+        executou.set()
+
+    agendador = AgendadorTurnos(acao, tmp_path / "turnos.json")
+    inicio = (datetime.now() + timedelta(seconds=1)).time().replace(microsecond=0)
+    agendador.definir_calendario({"pausas": [{"nome": "Teste", "inicio": inicio.isoformat()}]})
+    agendador.start()
+    try:
+        assert executou.wait(5)
+        assert executados == [("pausar", "Teste")]
+        assert agendador.executados == 1
+        # A ocorrência seguinte é no dia seguinte, e o calendário ficou no ficheiro
+        proximos = agendador.estado()["proximos"]
+        assert [evento["pausa"] for evento in proximos] == ["Teste"]
+        assert AgendadorTurnos(acao, tmp_path / "turnos.json").calendario.pausas[0].nome == "Teste"
+    finally:
+        agendador.stop()